@@ -0,0 +1,34 @@
+import argparse
+import os
+
+from agent_service.api import MAX_PENDING, MAX_QUEUED, QUEUE_TIMEOUT, create_app
+
+# HTTP API for the agent capabilities, for other services to call.
+# Usage: python AgentApi.py --port 8000
+# Endpoints: POST /code-interpreter, /rag and /rag-code-interpreter; GET /health and /metrics.
+# For production, serve the app factory with a WSGI server, e.g. gunicorn "agent_service.api:create_app()".
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve the Azure AI Foundry agent capabilities over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-pending", type=int, default=MAX_PENDING,
+                        help="Requests in flight before new ones wait in line")
+    parser.add_argument("--max-queued", type=int, default=MAX_QUEUED,
+                        help="Requests waiting in line before new ones get 429")
+    parser.add_argument("--queue-timeout", type=float, default=QUEUE_TIMEOUT,
+                        help="Seconds a request waits in line before it gets 429")
+    parser.add_argument("--model", default=os.getenv("AZURE_FOUNDRY_GPT_MODEL"))
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    app = create_app(model=args.model, max_pending=args.max_pending, max_queued=args.max_queued,
+                     queue_timeout=args.queue_timeout)
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import argparse
+import io
+import json
+import os
+import sys
+import time
+
+from agent_service.batch import DEFAULT_WORKERS, ResultWriter, load_prompts, run_batch, summarize
+from agent_service.capabilities import CAPABILITIES, DOCUMENT_CAPABILITIES
+
+# Run a file of prompts against one agent capability, several threads at a time.
+# Usage: python AgentBatch.py prompts.txt --capability "RAG" --document data/movies.md --workers 8 --output results.csv
+# Several --document files are indexed into one vector store and searched together.
+
+PROMPT_FORMAT = """prompt files:
+  Plain text files hold prompts separated by lines containing only "---"; a prompt may span several
+  lines, so a file without such lines is a single prompt (see data/test-scripts.txt).
+  .jsonl files hold one {"prompt": "..."} object per line."""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run a batch of prompts against an Azure AI Foundry agent.",
+                                     epilog=PROMPT_FORMAT, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("prompts", help="Prompt file (.txt separated by '---' lines, or .jsonl; see below)")
+    parser.add_argument("--capability", choices=CAPABILITIES, default=CAPABILITIES[0])
+    parser.add_argument("--document", nargs="+", help="Documents to search, required for the RAG capabilities")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Runs in flight at once")
+    parser.add_argument("--rate", type=float, help="Maximum runs started per second")
+    parser.add_argument("--output", default="batch_results.jsonl", help="Results file (.jsonl or .csv)")
+    parser.add_argument("--model", default=os.getenv("AZURE_FOUNDRY_GPT_MODEL"))
+    parser.add_argument("--session", help="Session to tag the runs with and count their tokens against")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    conn_str = os.getenv("AZURE_FOUNDRY_PROJECT_CONNSTRING")
+    if not conn_str or not args.model:
+        sys.exit("Set AZURE_FOUNDRY_PROJECT_CONNSTRING and AZURE_FOUNDRY_GPT_MODEL (or pass --model)")
+    if args.capability in DOCUMENT_CAPABILITIES and not args.document:
+        sys.exit(f"--document is required for {args.capability}")
+
+    documents = []
+    for path in args.document or []:
+        # Shared by every run in the batch; the vector store cache indexes them once
+        with open(path, "rb") as f:
+            document = io.BytesIO(f.read())
+        document.name = os.path.basename(path)
+        documents.append(document)
+    document = documents[0] if len(documents) == 1 else documents or None
+
+    prompts = load_prompts(args.prompts)
+    print(f"Running {len(prompts)} prompts with {args.workers} workers, writing results to {args.output}")
+
+    results = []
+    start = time.perf_counter()
+    with ResultWriter(args.output) as writer:
+        for result in run_batch(conn_str, args.capability, args.model, prompts, document=document,
+                                workers=args.workers, rate=args.rate, session=args.session):
+            writer.write(result)
+            results.append(result)
+            print(f"[{len(results)}/{len(prompts)}] prompt {result.index}: {result.status} in {result.latency:.2f}s"
+                  + (f" ({result.error})" if result.error else ""))
+
+    print(json.dumps(summarize(results, time.perf_counter() - start), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,45 +1,85 @@
 import json
 import os
+import re
+import threading
+from collections import Counter
+import uuid
 import atexit
 from typing import Optional
-from azure.ai.projects import AIProjectClient
-from azure.ai.projects.models import ToolSet, CodeInterpreterTool, BingGroundingTool, MessageTextContent, FileSearchTool, FilePurpose
+from agent_service.agent_pool import get_agent_pool
+from agent_service.async_engine import get_async_engine
+from agent_service.capabilities import CAPABILITIES, CODE_INTERPRETER, RAG, RAG_CODE_INTERPRETER
+from agent_service.client_factory import get_project_client, client_metrics
+from agent_service.conversations import Conversation, delete_thread
+from agent_service.ingestion import FAILED, document_name
+from agent_service.jobs import PENDING_STATUSES, get_job_queue, start_job_workers
+from agent_service.memory_budget import get_artifact_store
+from agent_service.pipeline import AgentPipeline
+from agent_service.rate_limit import get_rate_limiter
+from agent_service.resource_ledger import get_sweeper, session_scope, start_sweeper
+from agent_service.response_cache import RESPONSE_CACHE_ENABLED, get_response_cache
+from agent_service.session_store import get_session_store
+from agent_service.telemetry import stage_metrics, start_metrics_server
+from agent_service.usage import BudgetExceededError
+from agent_service.vector_store_cache import get_vector_store_cache
 
-from azure.identity import DefaultAzureCredential
 import streamlit.components.v1 as components
 import streamlit as st
-from PIL import Image
-from pprint import pformat
 
-import time
 # Author: Ron Dagdag
 # Date: 03/02/2025
 # Version: 1.0
 
-# Add state persistence functions
+# Add state persistence functions; each browser session's state is kept under its own ID in the
+# session store, which only writes the values that changed
 def save_session_state():
+    get_session_store().save(
+        st.session_state["session_id"],
+        last_file=st.session_state.get("last_file", ""),
+        conversations={capability: conversation.state() for capability, conversation in st.session_state["conversations"].items()},
+        jobs=st.session_state["jobs"]
+    )
+
+def load_session_state(session_id):
+    saved_state = get_session_store().load(session_id)
+    st.session_state["last_file"] = saved_state.get("last_file", "")
+    conversations = saved_state.get("conversations", {})
+    st.session_state["conversations"] = {capability: Conversation.from_state(capability, conversations.get(capability)) for capability in CAPABILITIES}
+    # Background job of each capability, by capability
+    st.session_state["jobs"] = saved_state.get("jobs", {})
+
+# The state file shared by all sessions in earlier versions
+LEGACY_STATE_FILE = ".session_state.json"
+
+
+# Clean up after earlier processes; runs on a background thread so the page renders without waiting on the service
+def startup_cleanup(conn_str):
     try:
-        state_to_save = {
-            "rag_agent_id": st.session_state.get("rag_agent_id"),
-            "vector_store_id": st.session_state.get("vector_store_id"),
-            "last_file": st.session_state.get("last_file", "")
-        }
-        with open(".session_state.json", "w") as f:
-            json.dump(state_to_save, f)
-        print("Session state saved successfully")
-    except Exception as e:
-        print(f"Error saving session state: {e}")
+        # Get the shared AI Project client
+        project_client = get_project_client(conn_str)
 
-def load_session_state():
-    try:
-        if os.path.exists(".session_state.json"):
-            with open(".session_state.json", "r") as f:
+        # Threads, agents and vector stores are tracked in the resource ledger; the sweeper deletes
+        # the ones that expired or whose process died, now and every few minutes
+        start_sweeper(conn_str, project_client)
+
+        if os.path.exists(LEGACY_STATE_FILE):
+            # Clean up conversation threads saved by earlier versions, then the state file
+            with open(LEGACY_STATE_FILE, "r") as f:
                 saved_state = json.load(f)
-                return saved_state
-        return None
+            for thread_id in saved_state.get("thread_ids", []):
+                delete_thread(project_client, thread_id)
+            os.remove(LEGACY_STATE_FILE)
     except Exception as e:
-        print(f"Error loading session state: {e}")
-        return None
+        print(f"Error during startup cleanup: {e}")
+
+# Process-wide setup, run once and shared by every session and rerun. The agent pipeline behind
+# all capabilities; the functions below only render its progress and results
+@st.cache_resource(show_spinner=False)
+def start_services(conn_str):
+    threading.Thread(target=startup_cleanup, args=(conn_str,), name="startup-cleanup", daemon=True).start()
+    # Serve the stage timings to Prometheus when AZURE_FOUNDRY_METRICS_PORT is set
+    start_metrics_server()
+    return AgentPipeline(conn_str, response_cache=get_response_cache() if RESPONSE_CACHE_ENABLED else None)
 
 
 # Set page config
@@ -65,57 +105,28 @@ if missing_vars:
 project_connstring = st.session_state.get("project_connstring")
 gpt_model = st.session_state.get("gpt_model")
 
-# Initialize session state and clean up old resources
+pipeline = start_services(project_connstring)
+
+# Initialize session state
 if "initialized" not in st.session_state:
-    # Load previous session state
-    saved_state = load_session_state()
-    
-    if saved_state:
-        try:
-            # Initialize AI Project client
-            project_client = AIProjectClient.from_connection_string(
-                credential=DefaultAzureCredential(),
-                conn_str=project_connstring
-            )
-            
-            # Clean up resources from previous session
-            if saved_state.get("rag_agent_id"):
-                try:
-                    project_client.agents.delete_agent(saved_state["rag_agent_id"])
-                    print(f"Cleaned up previous RAG agent: {saved_state['rag_agent_id']}")
-                except Exception as e:
-                    print(f"Error cleaning up previous RAG agent: {e}")
-                    
-            if saved_state.get("vector_store_id"):
-                try:
-                    project_client.agents.delete_vector_store(saved_state["vector_store_id"])
-                    print(f"Cleaned up previous vector store: {saved_state['vector_store_id']}")
-                except Exception as e:
-                    print(f"Error cleaning up previous vector store: {e}")
-                    
-            # Clean up state file
-            if os.path.exists(".session_state.json"):
-                os.remove(".session_state.json")
-        except Exception as e:
-            print(f"Error during startup cleanup: {e}")
-    
+    # Tags the remote resources this browser session creates and keys its saved state; it is kept
+    # in the URL, so reloading the page picks up the session's conversations and background jobs
+    session_id = st.query_params.get("session", "")
+    if not re.fullmatch("[0-9a-f]{32}", session_id):
+        session_id = uuid.uuid4().hex
+        st.query_params["session"] = session_id
+    st.session_state["session_id"] = session_id
+    load_session_state(session_id)
+    # Forget sessions nobody came back to
+    get_session_store().purge_if_due()
     st.session_state["initialized"] = True
 
-# Streamlit state to store session state variables
-if "interpreter_image" not in st.session_state:
-    st.session_state["interpreter_image"] = ""
-if "interpreter_code" not in st.session_state:
-    st.session_state["interpreter_code"] = ""
+# Streamlit state to store session state variables; the code and images of the last reply are
+# kept in the artifact store instead, under the process's memory budgets
 if "progress" not in st.session_state:
     st.session_state["progress"] = 0
 if "status_message" not in st.session_state:
     st.session_state["status_message"] = ""
-if "rag_agent_id" not in st.session_state:
-    st.session_state["rag_agent_id"] = None
-if "vector_store_id" not in st.session_state:
-    st.session_state["vector_store_id"] = None
-if "project_client" not in st.session_state:
-    st.session_state["project_client"] = None
 
 # Set sidebar navigation
 st.sidebar.title("Instructions:")
@@ -126,406 +137,189 @@ st.sidebar.markdown(
     For source code, setup instructions and more details, visit the [GitHub repo](https://github.com/rondagdag/azure-ai-agents-web-client).
     """
 )
-menu = st.sidebar.radio("Choose a capability:", ("Code Interpreter", "RAG", "RAG + Code Interpreter"))
-
-# Helper Function for Code Interpreter capability
+menu = st.sidebar.radio("Choose a capability:", CAPABILITIES)
+# Start creating the capability's agent and spare threads while the prompt is written
+prefetch_enabled = bool(project_connstring and gpt_model)
+if prefetch_enabled:
+    pipeline.prefetch(menu, gpt_model)
+stream_responses = st.sidebar.toggle("Stream responses", value=True, help="Show the agent's answer as it is generated")
+chat_mode = st.sidebar.toggle("Continue conversation", value=False, help="Ask follow-up questions in the same thread")
+bypass_cache = RESPONSE_CACHE_ENABLED and st.sidebar.toggle("Bypass response cache", value=False, help="Always run the agent, and refresh the cached response")
+run_in_background = st.sidebar.toggle("Run in background", value=False, help="Queue runs as jobs that keep going across reruns and closed tabs; follow-up questions are not supported")
+if run_in_background:
+    # Workers live for the whole process and pick up jobs left over from earlier ones
+    start_job_workers(project_connstring)
+# Started by the background startup cleanup
+sweeper = get_sweeper(project_connstring)
+with st.sidebar.expander("Service metrics"):
+    st.json({
+        "client": client_metrics(),
+        "rate_limiter": get_rate_limiter(project_connstring).stats(),
+        "agent_pool": get_agent_pool(project_connstring).stats(),
+        "vector_store_cache": get_vector_store_cache(project_connstring).stats(),
+        "async_engine": get_async_engine(project_connstring).stats(),
+        "prefetch": pipeline.prefetcher.stats(),
+        **({"response_cache": get_response_cache().stats()} if RESPONSE_CACHE_ENABLED else {}),
+        **({"jobs": get_job_queue().stats()} if run_in_background else {}),
+        "session_store": get_session_store().stats(),
+        "memory": get_artifact_store().stats(),
+        "resource_sweeper": sweeper.stats() if sweeper else {},
+    })
+with st.sidebar.expander("Token usage"):
+    usage_tracker = pipeline.usage_tracker
+    # This session's tokens within the budget window, and this process's totals by capability and model
+    session_tokens = usage_tracker.spent(st.session_state["session_id"])
+    if usage_tracker.session_budget:
+        st.caption(f"This session: {session_tokens} of {usage_tracker.session_budget} tokens")
+    else:
+        st.caption(f"This session: {session_tokens} tokens")
+    if usage_tracker.token_budget:
+        st.caption(f"All sessions: {usage_tracker.spent()} of {usage_tracker.token_budget} tokens")
+    usage_rows = usage_tracker.summary()
+    if usage_rows:
+        st.dataframe(usage_rows, hide_index=True)
+    else:
+        st.caption("No runs yet.")
+with st.sidebar.expander("Stage latency"):
+    # Percentiles over the recent runs of this process, in milliseconds
+    stage_rows = stage_metrics.summary()
+    if stage_rows:
+        st.dataframe([
+            {"capability": row["capability"], "stage": row["stage"], "count": row["count"],
+             **{q: round(row[q] * 1000) for q in ("p50", "p95", "p99")}}
+            for row in stage_rows
+        ], hide_index=True)
+    else:
+        # st.dataframe loads pandas and pyarrow, which would slow down the first page load
+        st.caption("No runs yet.")
+
+# Helper Function for the progress bar
 def update_progress(progress_bar, progress, message):
     st.session_state.progress = progress
     st.session_state.status_message = message
     progress_bar.progress(progress, text=message)
 
-def code_interpreter(prompt, conn_str=project_connstring, model=gpt_model):
-    st.session_state["interpreter_image"] = ""
-    st.session_state["interpreter_code"] = ""
+# Helper Function to show the earlier turns of a multi-turn conversation
+def show_conversation(conversation):
+    for role, text in conversation.turns:
+        with st.chat_message(role):
+            st.markdown(text)
+
+# Helper Functions for the artifacts of the session's last reply (code, images, job result); the artifact
+# store evicts them when the session or the process is over its memory budget, or the session is idle
+def get_artifact(name, default=None):
+    return get_artifact_store().get(st.session_state["session_id"], name, default)
+
+def set_artifacts(**artifacts):
+    for name, value in artifacts.items():
+        get_artifact_store().put(st.session_state["session_id"], name, value)
+
+def clear_artifacts():
+    get_artifact_store().drop(st.session_state["session_id"])
+
+# Helper Function to show the images of the last reply from memory; several images are shown as thumbnails
+def show_images(caption):
+    images = get_artifact("images") or ()
+    if len(images) == 1:
+        st.image(images[0].data, caption=caption)
+    elif images:
+        columns = st.columns(min(3, len(images)))
+        for i, output in enumerate(images):
+            columns[i % len(columns)].image(output.thumbnail(), caption=f"{caption} {i + 1}")
+
+# Helper Function to run a capability through the agent pipeline, showing its progress and streamed reply
+def run_capability(capability, prompt, document=None, conversation=None):
+    st.session_state["jobs"].pop(capability, None)
+    clear_artifacts()
     st.session_state.progress = 0
     st.session_state.status_message = ""
 
-    try:
-        progress_bar = st.progress(0)
-        update_progress(progress_bar, 10, "Initializing...")
-
-        # Initiate AI Project client
-        project_client = AIProjectClient.from_connection_string(
-            credential = DefaultAzureCredential(),
-            conn_str = conn_str
-        )
-        update_progress(progress_bar, 20, "Connected to AI Project service")
-
-        # Add Code Interpreter to the Agent's ToolSet
-        toolset = ToolSet()
-        code_interpreter_tool = CodeInterpreterTool()
-        toolset.add(code_interpreter_tool)
-        update_progress(progress_bar, 30, "Added Code Interpreter tool")
-
-        # Initiate Agent Service
-        agent = project_client.agents.create_agent(
-            model = model,
-            name = "code-interpreter-agent",
-            instructions = "You are a helpful data analyst. You can use Python to perform required calculations.",
-            toolset = toolset
-        )
-        print(f"Created agent, agent ID: {agent.id}")
-        update_progress(progress_bar, 40, "Created AI agent")
-
-        # Create a thread
-        thread = project_client.agents.create_thread()
-        print(f"Created thread, thread ID: {thread.id}")
-        update_progress(progress_bar, 50, "Created conversation thread")
-
-        # Create a message
-        message = project_client.agents.create_message(
-            thread_id = thread.id,
-            role = "user",
-            content = prompt
-        )
-        print(f"Created message, message ID: {message.id}")
-        update_progress(progress_bar, 60, "Sent message to agent")
-
-        # Run the agent
-        run = project_client.agents.create_and_process_run(
-            thread_id = thread.id,
-            assistant_id = agent.id
-        )
-        update_progress(progress_bar, 70, "Processing your request...")
-
-        # Check the run status
-        if run.status == "failed":
-            project_client.agents.delete_agent(agent.id)
-            print(f"Deleted agent, agent ID: {agent.id}")
-            progress_bar.empty()
-            return f"Run failed: {run.last_error}"
-
-        time.sleep(10)  # Increase delay if needed
-        update_progress(progress_bar, 80, "Getting response from agent...")
-
-        # Get the last message from the agent
-        messages = project_client.agents.list_messages(thread_id=thread.id)
-        sorted_messages = sorted(messages.data, key=lambda x: x.created_at)
-        last_msg = sorted_messages[-1]
-        
-        # Handle message content
-        file_name = "interpreter_image_file.png"
-        result = ""
-        if last_msg and last_msg.content:
-            for content_item in last_msg.content:
-                content_type = getattr(content_item, 'type', None)
-                if content_type == 'text':
-                    result += content_item.text.value + "\n"
-                elif content_type == 'image_file':
-                    result += "[Image generated by the agent]\n"
-                    # Save the image file
-                    project_client.agents.save_file(
-                        file_id=content_item.image_file.file_id,
-                        file_name=file_name
-                    )
-                    print(f"Downloaded image, file name: {file_name}")
-                    st.session_state['interpreter_image'] = file_name
-            result = result.strip()
-        else:
-            result = "No response from agent."
-            
-        update_progress(progress_bar, 90, "Processing response...")
-
-        # Retrieve the Python code snippet
-        run_details = project_client.agents.list_run_steps(
-            thread_id = thread.id,
-            run_id = run.id
-        )
-        for steps in run_details.data:
-            if getattr(steps.step_details, 'type', None) == "tool_calls":
-                for calls in steps.step_details.tool_calls:
-                    input_value = getattr(calls.code_interpreter, 'input', None)
-                    if input_value:
-                        print("Extracted Python code snippet")
-                        st.session_state['interpreter_code'] = input_value
-
-        # Delete the agent once done
-        project_client.agents.delete_agent(agent.id)
-        print(f"Deleted agent, agent ID: {agent.id}")
-        update_progress(progress_bar, 100, "Complete!")
-        time.sleep(1)
-        progress_bar.empty()
-
-        return result
-
-    except Exception as e:
-        progress_bar.empty()
-        st.error(f"An error occurred: {e}")
-        return f"An error occurred: {e}"
+    progress_bar = st.progress(0)
+    live = st.empty()
+    with live.container():
+        files_placeholder = st.empty()
+        text_placeholder = st.empty()
+        code_placeholder = st.empty()
+    streamed = []
+    # Latest FileProgress of each document, by name
+    files = {}
+
+    def show_file(file_progress):
+        files[file_progress.name] = file_progress
+        counts = Counter(progress.status for progress in files.values())
+        files_placeholder.caption("Documents: " + ", ".join(f"{count} {status}" for status, count in counts.items()))
+
+    def show_event(event):
+        if event.kind == "text":
+            streamed.append(event.value)
+            text_placeholder.markdown("".join(streamed))
+        elif event.kind == "code":
+            code_placeholder.code(event.value, language="python")
 
-# Helper Function for RAG capability
-def rag_search(file_obj, prompt, conn_str=project_connstring, model=gpt_model):
-    st.session_state["interpreter_image"] = ""  # Reset image state
-    st.session_state.progress = 0
-    st.session_state.status_message = ""
-    
     try:
-        progress_bar = st.progress(0)
-        update_progress(progress_bar, 10, "Initializing...")
-
-        # Initialize AI Project client if not already initialized
-        if not st.session_state["project_client"]:
-            st.session_state["project_client"] = AIProjectClient.from_connection_string(
-                credential=DefaultAzureCredential(),
-                conn_str=conn_str
-            )
-        project_client = st.session_state["project_client"]
-        update_progress(progress_bar, 20, "Connected to AI Project service")
-
-        # Create agent if not exists
-        if not st.session_state["rag_agent_id"]:
-            # Save uploaded file temporarily
-            temp_file_path = f"temp_{file_obj.name}"
-            with open(temp_file_path, "wb") as f:
-                f.write(file_obj.getvalue())
-            update_progress(progress_bar, 30, "Saved uploaded file")
-
-            # Upload the file
-            file = project_client.agents.upload_file_and_poll(
-                file_path=temp_file_path,
-                purpose=FilePurpose.AGENTS
-            )
-            print(f"Uploaded file, file ID: {file.id}")
-            update_progress(progress_bar, 40, "Uploaded file to AI service")
-
-            # Create vector store if not exists or if new file is uploaded
-            if not st.session_state["vector_store_id"]:
-                vector_store = project_client.agents.create_vector_store_and_poll(
-                    file_ids=[file.id],
-                    name=f"vectorstore_{file_obj.name}"
-                )
-                st.session_state["vector_store_id"] = vector_store.id
-                print(f"Created vector store, vector store ID: {vector_store.id}")
-            update_progress(progress_bar, 50, "Created vector store for document search")
-
-            # Create file search tool
-            file_search_tool = FileSearchTool(vector_store_ids=[st.session_state["vector_store_id"]])
-            update_progress(progress_bar, 60, "Initialized document search tool")
-
-
-            agent = project_client.agents.create_agent(
-                model=model,
-                name="rag-agent",
-                instructions="You are a helpful agent which provides answer ONLY from the search.",
-                tools=file_search_tool.definitions,
-                tool_resources=file_search_tool.resources,
+        with session_scope(st.session_state.get("session_id")):
+            response = pipeline.run(
+                capability, gpt_model, prompt,
+                document=document,
+                conversation=conversation,
+                stream=stream_responses,
+                refresh_cache=bypass_cache,
+                on_progress=lambda fraction, message: update_progress(progress_bar, int(fraction * 100), message),
+                on_event=show_event,
+                on_file=show_file
             )
-            st.session_state["rag_agent_id"] = agent.id
-            print(f"Created agent, agent ID: {agent.id}")
-        update_progress(progress_bar, 70, "Created AI agent")
-
-        # Create thread and message
-        thread = project_client.agents.create_thread()
-        message = project_client.agents.create_message(
-            thread_id = thread.id,
-            role = "user",
-            content = prompt
-        )
-        print(f"Created message, message ID: {message.id}")
-        update_progress(progress_bar, 80, "Sent question to agent")
-
-        # Run the agent
-        run = project_client.agents.create_and_process_run(
-            thread_id=thread.id,
-            assistant_id=st.session_state["rag_agent_id"]
-        )
-        update_progress(progress_bar, 85, "Processing your question...")
-
-        # Check the run status
-        if run.status == "failed":
-            progress_bar.empty()
-            return f"Run failed: {run.last_error}"
-
-        #time.sleep(30)  # Increase delay if needed
-        update_progress(progress_bar, 90, "Getting response from agent...")
-
-        # Get the last message from the agent
-        messages = project_client.agents.list_messages(thread_id=thread.id)
-        sorted_messages = sorted(messages.data, key=lambda x: x.created_at)
-        print(f"Messages: {pformat(sorted_messages)}")
-        last_msg = sorted_messages[-1]
-        result = last_msg.content[0].text.value if last_msg else "No response from agent."
-        update_progress(progress_bar, 95, "Processing response...")
-
-        save_session_state()
-        # Cleanup temporary file
-        if 'temp_file_path' in locals():
-            os.remove(temp_file_path)
-        
-        update_progress(progress_bar, 100, "Complete!")
-        time.sleep(1)
-        progress_bar.empty()
-
-        return result
-
+    except BudgetExceededError as e:
+        st.warning(f"{e}. Try again in {e.retry_after / 60:.0f} minutes.")
+        return str(e)
     except Exception as e:
-        if 'temp_file_path' in locals():
-            os.remove(temp_file_path)
-        progress_bar.empty()
         st.error(f"An error occurred: {e}")
         return f"An error occurred: {e}"
-
-# Helper Function for Combined RAG and Code Interpreter capability
-def rag_with_code_interpreter(file_obj, prompt, conn_str=project_connstring, model=gpt_model):
-    st.session_state["interpreter_image"] = ""
-    st.session_state["interpreter_code"] = ""
-    st.session_state.progress = 0
-    st.session_state.status_message = ""
-    
-    try:
-        progress_bar = st.progress(0)
-        update_progress(progress_bar, 10, "Initializing...")
-
-        # Initialize AI Project client
-        project_client = AIProjectClient.from_connection_string(
-            credential=DefaultAzureCredential(),
-            conn_str=conn_str
-        )
-        update_progress(progress_bar, 20, "Connected to AI Project service")
-
-        # Save and upload file
-        temp_file_path = f"temp_{file_obj.name}"
-        with open(temp_file_path, "wb") as f:
-            f.write(file_obj.getvalue())
-        update_progress(progress_bar, 30, "Saved uploaded file")
-
-        # Upload the file
-        file = project_client.agents.upload_file_and_poll(
-            file_path=temp_file_path,
-            purpose=FilePurpose.AGENTS
-        )
-        print(f"Uploaded file, file ID: {file.id}")
-        update_progress(progress_bar, 40, "Uploaded file to AI service")
-
-        # Create vector store
-        vector_store = project_client.agents.create_vector_store_and_poll(
-            file_ids=[file.id],
-            name=f"vectorstore_{file_obj.name}"
-        )
-        print(f"Created vector store, vector store ID: {vector_store.id}")
-        update_progress(progress_bar, 50, "Created vector store for document search")
-
-        # Setup tools
-        toolset = ToolSet()
-        code_interpreter_tool = CodeInterpreterTool()
-        toolset.add(code_interpreter_tool)
-        print("Added Code Interpreter tool")
-        
-        file_search_tool = FileSearchTool(vector_store_ids=[vector_store.id])
-        toolset.add(file_search_tool)
-        print("Added File Search tool")
-
-        update_progress(progress_bar, 60, "Added Code Interpreter and File Search tools")
-
-        # Create agent with both capabilities
-        agent = project_client.agents.create_agent(
-            model=model,
-            name="rag-code-interpreter-agent",
-            instructions="You are a helpful agent that can analyze documents and generate Python code based on the document content. Use the file search to extract relevant information and then generate appropriate Python code for analysis when needed.",
-            toolset = toolset
-        )
-
-        print(f"Created agent, agent ID: {agent.id}")
-        update_progress(progress_bar, 70, "Created AI agent")
-
-        # Create thread and message
-        thread = project_client.agents.create_thread()
-        message = project_client.agents.create_message(
-            thread_id=thread.id,
-            role="user",
-            content=prompt
-        )
-        print(f"Created message, message ID: {message.id}")
-        update_progress(progress_bar, 80, "Sent request to agent")
-
-        # Run the agent
-        run = project_client.agents.create_and_process_run(
-            thread_id=thread.id,
-            assistant_id=agent.id
-        )
-        update_progress(progress_bar, 85, "Processing your request...")
-
-        if run.status == "failed":
-            project_client.agents.delete_agent(agent.id)
-            project_client.agents.delete_vector_store(vector_store.id)
-            os.remove(temp_file_path)
-            progress_bar.empty()
-            return f"Run failed: {run.last_error}"
-
-        update_progress(progress_bar, 90, "Getting response from agent...")
-
-        # Get the last message from the agent
-        messages = project_client.agents.list_messages(thread_id=thread.id)
-        print(f"Messages: {pformat(messages)}")
-        # Sort messages by creation time (ascending)
-        sorted_messages = sorted(messages.data, key=lambda x: x.created_at)
-        print(f"Messages: {pformat(sorted_messages)}")
-        last_msg = sorted_messages[-1]
-        content = last_msg.content
-
-        
-        # Handle multiple content types
-        result = ""
-        if last_msg and last_msg.content:
-            for content in last_msg.content:
-                content_type = getattr(content, 'type', None)
-                if content_type == 'text':
-                    result += content.text.value + "\n"
-                elif content_type == 'image_file':
-                    result += "[Image generated by the agent]\n"
-                    # Save the image file
-                    file_name = "interpreter_image_file.png"
-                    project_client.agents.save_file(
-                        file_id=content.image_file.file_id,
-                        file_name=file_name
-                    )
-                    print(f"Downloaded image, file name: {file_name}")
-                    st.session_state['interpreter_image'] = file_name
-            result = result.strip()
-        else:
-            result = "No response from agent."
-
-        # Get any generated code
-        run_details = project_client.agents.list_run_steps(
-            thread_id=thread.id,
-            run_id=run.id
-        )
-        for steps in run_details.data:
-            if getattr(steps.step_details, 'type', None) == "tool_calls":
-                for tool_call in steps.step_details.tool_calls:
-                    tool_type = getattr(tool_call, 'type', None)
-                    if tool_type == 'code_interpreter':
-                        input_value = tool_call.code_interpreter.input
-                        if input_value:
-                            print("Extracted Python code snippet")
-                            st.session_state['interpreter_code'] = input_value
-
-        # Cleanup
-        project_client.agents.delete_agent(agent.id)
-        project_client.agents.delete_vector_store(vector_store.id)
-        os.remove(temp_file_path)
-        
-        update_progress(progress_bar, 100, "Complete!")
-        time.sleep(1)
+    finally:
+        # The caller renders the final output
         progress_bar.empty()
-
-        return result
-
-    except Exception as e:
-        if 'temp_file_path' in locals():
-            os.remove(temp_file_path)
-        if 'agent' in locals():
-            project_client.agents.delete_agent(agent.id)
-        if 'vector_store' in locals():
-            project_client.agents.delete_vector_store(vector_store.id)
-        progress_bar.empty()
-        st.error(f"An error occurred: {e}")
-        return f"An error occurred: {e}"
+        live.empty()
+
+    failed = [progress for progress in files.values() if progress.status == FAILED]
+    if failed:
+        st.warning("Not searched: " + "; ".join(f"{progress.name} ({progress.error})" for progress in failed))
+    set_artifacts(code=response.code, images=response.images)
+    save_session_state()
+    return response.text
+
+# Helper Function to queue a run as a background job; show_job follows it
+def submit_job(capability, prompt, document=None):
+    if isinstance(document, list):
+        st.warning("Background jobs search a single document; turn off \"Run in background\" to search several.")
+        return
+    st.session_state["jobs"][capability] = get_job_queue().submit(capability, gpt_model, prompt, document=document, session=st.session_state["session_id"])
+    save_session_state()
+
+# Helper Function to poll the session's background job for a capability and show its result once it is done
+@st.fragment(run_every=2)
+def show_job(capability, show_output):
+    job_id = st.session_state["jobs"].get(capability)
+    if not job_id:
+        return
+    job = get_job_queue().get(job_id)
+    if job is None:
+        st.warning(f"Job {job_id} is no longer available.")
+    elif job.status in PENDING_STATUSES:
+        st.info(f"Job {job_id} is {job.status} (attempt {max(job.attempts, 1)} of {job.max_attempts}). The result will appear here, even after a reload.")
+    elif job.status == "failed":
+        st.error(f"Job {job_id} failed: {job.error}")
+    else:
+        # Loaded once; later polls reuse the session's copy until it is evicted
+        job_result = get_artifact("job_result")
+        if job_result is None or job_result[0] != job_id:
+            response = get_job_queue().result(job_id)
+            job_result = (job_id, response.text)
+            set_artifacts(job_result=job_result, code=response.code, images=response.images)
+        show_output(job_result[1])
 
 # Main screen
 st.title("AI Agent on the Fly - Azure AI Foundry Agent Service")
 
-if menu == "Code Interpreter":
+if menu == CODE_INTERPRETER:
     st.header("Agent to write code and execute in sandboxed environment")
     default_prompt = """Could you please analyse the movies and box office gross using the following data and producing a bar chart image.
 
@@ -551,89 +345,111 @@ Straight Outta Compton	2015	7.8	89%	$201.6 million
 The White Tiger	2021	7.1	91%	N/A
 Dumb Money	2023	7.2	84%	$45.1 million
 """
+    conversation = st.session_state["conversations"][CODE_INTERPRETER] if chat_mode else None
+    if conversation:
+        show_conversation(conversation)
     prompt = st.text_area("Enter your prompt:", value=default_prompt, height=300)
+
+    def show_output(result):
+        st.text_area("Output:", value=str(result), height=200)
+        show_images("Image generated by Code Interpreter")
+        if get_artifact("code"):
+            st.text_area("Python Code Snippet:", value=get_artifact("code"), height=300)
+
     if st.button("Run"):
         st.session_state.progress = 0
-        result = code_interpreter(prompt)
-        st.text_area("Output:", value=str(result), height=200)
-        if st.session_state.get('interpreter_image'):
-            img = Image.open(st.session_state['interpreter_image'])
-            st.image(img, caption="Image generated by Code Interpreter")
-        if st.session_state.get('interpreter_code'):
-            st.text_area("Python Code Snippet:", value=st.session_state['interpreter_code'], height=300)
+        if run_in_background:
+            submit_job(CODE_INTERPRETER, prompt)
+        else:
+            show_output(run_capability(CODE_INTERPRETER, prompt, conversation=conversation))
+    show_job(CODE_INTERPRETER, show_output)
     if st.button("Clear"):
+        st.session_state["jobs"].pop(CODE_INTERPRETER, None)
         st.text_area("Output:", value="", height=200)
-        st.session_state['interpreter_image'] = ''
-        st.session_state['interpreter_code'] = ''
+        clear_artifacts()
+        # Start the next question in a new thread
+        st.session_state["conversations"][CODE_INTERPRETER].reset(get_project_client(project_connstring))
+        save_session_state()
 
-elif menu == "RAG":
+elif menu == RAG:
     st.header("Retrieval Augmented Generation with Document Search")
-    uploaded_file = st.file_uploader("Choose a document file", type=["doc", "docx", "go", "html", "java", "js", "json", "md", "pdf", "php", "pptx", "py", "rb", "sh", "tex", "ts", "txt"])
+    uploaded_files = st.file_uploader("Choose document files", type=["doc", "docx", "go", "html", "java", "js", "json", "md", "pdf", "php", "pptx", "py", "rb", "sh", "tex", "ts", "txt"], accept_multiple_files=True)
+    # One document, or several indexed into one vector store and searched together
+    uploaded_file = uploaded_files[0] if len(uploaded_files) == 1 else uploaded_files or None
+    if uploaded_file is not None and prefetch_enabled:
+        # Upload and index the documents before Run is clicked
+        pipeline.prefetch(RAG, gpt_model, document=uploaded_file)
     
-    # Clear exigent andre ifnew fileloaded
-    if uploaded_file is not None and uploaded_file.name not in st.session_state.get("last_file", ""):
-        if st.session_state["rag_agent_id"] and st.session_state["project_client"]:
-            st.session_state["project_client"].agents.delete_agent(st.session_state["rag_agent_id"])
-        if st.session_state["vector_store_id"] and st.session_state["project_client"]:
-            st.session_state["project_client"].agents.delete_vector_store(st.session_state["vector_store_id"])
-        st.session_state["rag_agent_id"] = None
-        st.session_state["vector_store_id"] = None
-        st.session_state["last_file"] = uploaded_file.name
+    # Remember the latest file; its vector store is shared through the vector store cache
+    if uploaded_file is not None and document_name(uploaded_file) not in st.session_state.get("last_file", ""):
+        st.session_state["last_file"] = document_name(uploaded_file)
     
     default_prompt = "What are the key points from this document?"
+    conversation = st.session_state["conversations"][RAG] if chat_mode else None
+    if conversation:
+        show_conversation(conversation)
     prompt = st.text_area("Enter your question about the document:", value=default_prompt, height=150)
     
+
+    def show_output(result):
+        st.text_area("Response:", value=str(result), height=300)
+        show_images("Image generated by RAG")
+
     if uploaded_file is not None and st.button("Run"):
         st.session_state.progress = 0
-        result = rag_search(uploaded_file, prompt)
-        print(result)
-        st.text_area("Response:", value=str(result), height=300)
-        if st.session_state.get('interpreter_image'):
-            img = Image.open(st.session_state['interpreter_image'])
-            st.image(img, caption="Image generated by RAG")
+        if run_in_background:
+            submit_job(RAG, prompt, document=uploaded_file)
+        else:
+            result = run_capability(RAG, prompt, document=uploaded_file, conversation=conversation)
+            show_output(result)
+    show_job(RAG, show_output)
     
     if st.button("Clear"):
-        try:
-            # Clean up AI agent if it exists
-            if st.session_state["rag_agent_id"] and st.session_state["project_client"]:
-                st.session_state["project_client"].agents.delete_agent(st.session_state["rag_agent_id"])
-            
-            # Clean up vector store if it exists    
-            if st.session_state["vector_store_id"] and st.session_state["project_client"]:
-                st.session_state["project_client"].agents.delete_vector_store(st.session_state["vector_store_id"])
-        except Exception as e:
-            st.error(f"Error during cleanup: {str(e)}")
-            print(f"Error during cleanup: {str(e)}")
-
-        # Reset session state variables
-        st.session_state["rag_agent_id"] = None
-        st.session_state["vector_store_id"] = None
+        st.session_state["jobs"].pop(RAG, None)
+        # Reset session state variables; pooled agents and cached vector stores are evicted by their TTLs
         st.session_state["last_file"] = ""
-        st.session_state['interpreter_image'] = ''
+        clear_artifacts()
         st.text_area("Response:", value="", height=300)
+        st.session_state["conversations"][RAG].reset(get_project_client(project_connstring))
+        save_session_state()
 
 
-elif menu == "RAG + Code Interpreter":
+elif menu == RAG_CODE_INTERPRETER:
     st.header("Combined Document Analysis and Code Generation")
-    uploaded_file = st.file_uploader("Choose a document file", type=["doc", "docx", "go", "html", "java", "js", "json", "md", "pdf", "php", "pptx", "py", "rb", "sh", "tex", "ts", "txt"])
+    uploaded_files = st.file_uploader("Choose document files", type=["doc", "docx", "go", "html", "java", "js", "json", "md", "pdf", "php", "pptx", "py", "rb", "sh", "tex", "ts", "txt"], accept_multiple_files=True)
+    # One document, or several indexed into one vector store and searched together
+    uploaded_file = uploaded_files[0] if len(uploaded_files) == 1 else uploaded_files or None
+    if uploaded_file is not None and prefetch_enabled:
+        # Upload and index the documents before Run is clicked
+        pipeline.prefetch(RAG_CODE_INTERPRETER, gpt_model, document=uploaded_file)
     
     default_prompt = "Could you please analyse the movies and box office gross using the following data and producing a bar chart image."
+    conversation = st.session_state["conversations"][RAG_CODE_INTERPRETER] if chat_mode else None
+    if conversation:
+        show_conversation(conversation)
     prompt = st.text_area("Enter your request:", value=default_prompt, height=150)
     
+
+    def show_output(result):
+        st.text_area("Response:", value=str(result), height=300)
+        if get_artifact("code"):
+            st.text_area("Generated Python Code:", value=get_artifact("code"), height=200)
+        show_images("Generated Visualization")
+
     if uploaded_file is not None and st.button("Run"):
         st.session_state.progress = 0
-        result = rag_with_code_interpreter(uploaded_file, prompt)
-        st.text_area("Response:", value=str(result), height=300)
-        if st.session_state.get('interpreter_code'):
-            st.text_area("Generated Python Code:", value=st.session_state['interpreter_code'], height=200)
-        if st.session_state.get('interpreter_image'):
-            img = Image.open(st.session_state['interpreter_image'])
-            st.image(img, caption="Generated Visualization")
+        if run_in_background:
+            submit_job(RAG_CODE_INTERPRETER, prompt, document=uploaded_file)
+        else:
+            show_output(run_capability(RAG_CODE_INTERPRETER, prompt, document=uploaded_file, conversation=conversation))
+    show_job(RAG_CODE_INTERPRETER, show_output)
     
     if st.button("Clear"):
-        st.session_state['interpreter_image'] = ''
-        st.session_state['interpreter_code'] = ''
+        st.session_state["jobs"].pop(RAG_CODE_INTERPRETER, None)
+        clear_artifacts()
         st.text_area("Response:", value="", height=300)
+        st.session_state["conversations"][RAG_CODE_INTERPRETER].reset(get_project_client(project_connstring))
+        save_session_state()
 
 else:
     st.header("Please, choose a capability from the sidebar.")
\ No newline at end of file
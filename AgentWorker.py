@@ -0,0 +1,40 @@
+import argparse
+import os
+import sys
+import time
+
+from agent_service.client_factory import get_project_client
+from agent_service.jobs import JOB_WORKERS, start_job_workers
+from agent_service.resource_ledger import start_sweeper
+
+# Run background agent jobs outside the Streamlit process.
+# Usage: python AgentWorker.py --workers 4
+# Jobs are submitted by the app's "Run in background" toggle; set AZURE_FOUNDRY_JOB_WORKERS=0 for the
+# app to leave them all to these workers. Jobs a stopped worker was running are picked up again
+# by any worker once their lease expires.
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run queued Azure AI Foundry agent jobs.")
+    parser.add_argument("--workers", type=int, default=max(JOB_WORKERS, 1), help="Jobs run at once")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    conn_str = os.getenv("AZURE_FOUNDRY_PROJECT_CONNSTRING")
+    if not conn_str:
+        sys.exit("Set AZURE_FOUNDRY_PROJECT_CONNSTRING")
+    pool = start_job_workers(conn_str, workers=args.workers)
+    sweeper = start_sweeper(conn_str, get_project_client(conn_str))
+    print(f"Running jobs with {args.workers} workers, press Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(60)
+            print(f"Jobs: {pool.stats()}, resources: {sweeper.stats()}")
+    except KeyboardInterrupt:
+        pool.stop(timeout=5)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+# Helpers shared by the Agent on the Fly Streamlit app (AgentOnTheFly.py)
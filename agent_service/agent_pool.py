@@ -0,0 +1,221 @@
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from agent_service.resource_ledger import AGENT, get_resource_ledger
+from agent_service.telemetry import span
+
+# Process-wide pool of agents, shared by every request and Streamlit session.
+# Agents are created lazily on first use, reused while their configuration matches
+# and only deleted when evicted (idle TTL / max size) or when the process exits.
+# Once max size agents are all leased, creating another waits for one to be returned; after
+# the wait it is created anyway, and counted as overflow.
+
+DEFAULT_MAX_SIZE = int(os.getenv("AZURE_FOUNDRY_AGENT_POOL_SIZE", "8"))
+DEFAULT_IDLE_TTL = float(os.getenv("AZURE_FOUNDRY_AGENT_IDLE_TTL", "900"))
+DEFAULT_WAIT = float(os.getenv("AZURE_FOUNDRY_AGENT_POOL_WAIT", "30"))
+
+
+def as_plain(value):
+    if hasattr(value, "as_dict"):
+        return value.as_dict()
+    if isinstance(value, (list, tuple)):
+        return [as_plain(v) for v in value]
+    return value
+
+
+def toolset_signature(toolset=None, tools=None, tool_resources=None):
+    # Stable hash of the tool definitions and agent-level tool resources
+    definitions = toolset.definitions if toolset is not None else (tools or [])
+    resources = toolset.resources if toolset is not None else tool_resources
+    payload = json.dumps([as_plain(definitions), as_plain(resources)], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _PooledAgent:
+    def __init__(self, agent_id, project_client):
+        self.agent_id = agent_id
+        self.project_client = project_client
+        self.in_use = 0
+        self.last_used = time.monotonic()
+
+
+class AgentPool:
+    def __init__(self, max_size: int = DEFAULT_MAX_SIZE, idle_ttl: float = DEFAULT_IDLE_TTL,
+                 conn_str: Optional[str] = None, wait: float = DEFAULT_WAIT):
+        self.max_size = max_size
+        self.conn_str = conn_str
+        self.idle_ttl = idle_ttl
+        self.wait = wait
+        self._entries: "OrderedDict[tuple, _PooledAgent]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Notified whenever a lease ends, for creations waiting on a full pool
+        self._returned = threading.Condition(self._lock)
+        # Serializes creation per key so concurrent sessions don't create duplicate agents
+        self._creating: Dict[tuple, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Creations that waited on a full pool, and those that went past max size after waiting
+        self.waits = 0
+        self.overflows = 0
+
+    @contextmanager
+    def lease(self, project_client, model, name, instructions, toolset=None, tools=None, tool_resources=None):
+        key = (model, toolset_signature(toolset, tools, tool_resources), instructions)
+        entry = self._checkout(project_client, key, model, name, instructions, toolset, tools, tool_resources)
+        try:
+            yield entry.agent_id
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+                entry.last_used = time.monotonic()
+                self._returned.notify_all()
+            self.evict_idle()
+
+    def warm(self, project_client, model, name, instructions, toolset=None, tools=None, tool_resources=None):
+        # Creates the agent ahead of its first lease; nothing to do when it is pooled already
+        key = (model, toolset_signature(toolset, tools, tool_resources), instructions)
+        with self._lock:
+            if key in self._entries:
+                return
+        with self.lease(project_client, model, name, instructions, toolset, tools, tool_resources):
+            pass
+
+    def _checkout(self, project_client, key, model, name, instructions, toolset, tools, tool_resources):
+        with self._lock:
+            entry = self._take(key)
+            if entry:
+                return entry
+            create_lock = self._creating.setdefault(key, threading.Lock())
+
+        with create_lock:
+            try:
+                with self._lock:
+                    entry = self._take(key)
+                    if entry:
+                        return entry
+                    self.misses += 1
+                    if not self._wait_for_room():
+                        self.overflows += 1
+                        print(f"Agent pool is full ({self.max_size} agents in use), creating one more")
+
+                kwargs = {"toolset": toolset} if toolset is not None else {"tools": tools, "tool_resources": tool_resources}
+                with span("create_agent"):
+                    agent = project_client.agents.create_agent(model=model, name=name, instructions=instructions, **kwargs)
+                print(f"Created pooled agent, agent ID: {agent.id}")
+                # Owned by this process: swept if it dies before deleting the agent
+                get_resource_ledger().record(self.conn_str, AGENT, agent.id, owned=True)
+
+                entry = _PooledAgent(agent.id, project_client)
+                entry.in_use = 1
+                with self._lock:
+                    self._entries[key] = entry
+                    overflow = self._pop_overflow()
+            finally:
+                # Also after a failed creation, so the next lease for the key starts afresh
+                with self._lock:
+                    if self._creating.get(key) is create_lock:
+                        del self._creating[key]
+        self._delete(overflow)
+        return entry
+
+    def _wait_for_room(self):
+        # Caller holds self._lock; False when max size agents are still leased after the wait
+        if self._leased() < self.max_size:
+            return True
+        self.waits += 1
+        return self._returned.wait_for(lambda: self._leased() < self.max_size, timeout=self.wait)
+
+    def _leased(self):
+        # Caller holds self._lock
+        return sum(1 for entry in self._entries.values() if entry.in_use)
+
+    def _take(self, key):
+        # Caller holds self._lock
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        entry.in_use += 1
+        self.hits += 1
+        return entry
+
+    def _pop_overflow(self):
+        # Caller holds self._lock; least recently used idle agents go first
+        evicted = []
+        for key in list(self._entries):
+            if len(self._entries) <= self.max_size:
+                break
+            if self._entries[key].in_use == 0:
+                evicted.append(self._entries.pop(key))
+        return evicted
+
+    def evict_idle(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, entry in self._entries.items()
+                       if entry.in_use == 0 and now - entry.last_used > self.idle_ttl]
+            evicted = [self._entries.pop(key) for key in expired]
+        self._delete(evicted)
+
+    def _delete(self, entries):
+        for entry in entries:
+            self.evictions += 1
+            try:
+                with span("cleanup"):
+                    entry.project_client.agents.delete_agent(entry.agent_id)
+                get_resource_ledger().release(AGENT, entry.agent_id)
+                print(f"Deleted pooled agent, agent ID: {entry.agent_id}")
+            except Exception as e:
+                print(f"Error deleting pooled agent {entry.agent_id}: {e}")
+
+    def close(self):
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        self._delete(entries)
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+            in_use = self._leased()
+        lookups = self.hits + self.misses
+        return {
+            "size": size,
+            "in_use": in_use,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "waits": self.waits,
+            "overflows": self.overflows,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+# One pool per AI Project connection string, living for the whole process
+_pools: Dict[str, AgentPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_agent_pool(conn_str: Optional[str]) -> AgentPool:
+    with _pools_lock:
+        pool = _pools.get(conn_str or "")
+        if pool is None:
+            pool = _pools[conn_str or ""] = AgentPool(conn_str=conn_str)
+        return pool
+
+
+@atexit.register
+def close_agent_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
@@ -0,0 +1,235 @@
+import base64
+import json
+import os
+import queue
+import threading
+from typing import Optional
+
+from flask import Flask, Response, jsonify, request
+
+from agent_service.async_engine import MAX_CONCURRENT_RUNS
+from agent_service.capabilities import CODE_INTERPRETER, DOCUMENT_CAPABILITIES, RAG, RAG_CODE_INTERPRETER
+from agent_service.memory_budget import spool
+from agent_service.pipeline import AgentPipeline, AgentResponse
+from agent_service.rate_limit import CircuitOpenError
+from agent_service.resource_ledger import start_sweeper
+from agent_service.response_cache import RESPONSE_CACHE_ENABLED, get_response_cache
+from agent_service.telemetry import stage_metrics
+from agent_service.usage import BudgetExceededError
+
+# HTTP API over the agent pipeline, for services that call the capabilities directly. Every
+# request shares the process-wide client, agent pool, vector store cache and async engine.
+# At most AZURE_FOUNDRY_API_MAX_PENDING requests are in flight; up to AZURE_FOUNDRY_API_MAX_QUEUED
+# more wait in line for AZURE_FOUNDRY_API_QUEUE_TIMEOUT seconds, and the rest are turned away with
+# 429 instead of queueing without bound. Each request is served on a thread of its own (Flask's
+# threaded server, or the WSGI server's workers), which blocks while its run is in the async
+# engine. Prompts come as JSON or multipart form data (with the documents as `document` files),
+# and `stream` switches the response to server-sent events.
+
+MAX_PENDING = int(os.getenv("AZURE_FOUNDRY_API_MAX_PENDING", str(MAX_CONCURRENT_RUNS * 2)))
+MAX_QUEUED = int(os.getenv("AZURE_FOUNDRY_API_MAX_QUEUED", str(MAX_PENDING)))
+QUEUE_TIMEOUT = float(os.getenv("AZURE_FOUNDRY_API_QUEUE_TIMEOUT", "10"))
+# Seconds a client turned away with 429 is asked to wait before retrying
+RETRY_AFTER = 1
+
+ENDPOINTS = {
+    "/code-interpreter": CODE_INTERPRETER,
+    "/rag": RAG,
+    "/rag-code-interpreter": RAG_CODE_INTERPRETER,
+}
+
+
+class AdmissionQueue:
+    # Slots for the requests in flight, and a bounded line of requests waiting for one
+    def __init__(self, max_pending: int, max_queued: int = MAX_QUEUED, timeout: float = QUEUE_TIMEOUT):
+        self.max_pending = max_pending
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.queued = 0
+        self.rejected = 0
+
+    def acquire(self) -> bool:
+        # False when the line is full or no slot frees up in time
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                if self.queued >= self.max_queued or self.timeout <= 0:
+                    self.rejected += 1
+                    return False
+                self.queued += 1
+            try:
+                admitted = self._slots.acquire(timeout=self.timeout)
+            finally:
+                with self._lock:
+                    self.queued -= 1
+            if not admitted:
+                with self._lock:
+                    self.rejected += 1
+                return False
+        with self._lock:
+            self.in_flight += 1
+        return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": self.in_flight, "queued": self.queued, "rejected": self.rejected,
+                    "max_pending": self.max_pending, "max_queued": self.max_queued}
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def response_json(response: AgentResponse):
+    return {
+        "status": response.status,
+        "text": response.text,
+        "code": response.code,
+        # PNG bytes, base64 encoded
+        "images": [base64.b64encode(output.data).decode("ascii") for output in response.images],
+        "thread_id": response.thread_id,
+        "run_id": response.run.id if response.run is not None else None,
+        "usage": {**response.usage._asdict(), "steps": [step._asdict() for step in response.usage.steps]}
+                 if response.usage is not None else None,
+    }
+
+
+def sse(event, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _flag(value) -> bool:
+    # JSON booleans, or "1"/"true"/"yes" from form fields
+    if isinstance(value, bool):
+        return value
+    return str(value).lower() in ("1", "true", "yes")
+
+
+def _parse_request(capability):
+    # JSON body, or multipart form fields with the document as a file
+    if request.is_json:
+        fields = request.get_json(silent=True) or {}
+        document = None
+    else:
+        fields = request.form
+        documents = []
+        for upload in request.files.getlist("document"):
+            if upload.filename:
+                # Copied, as the request's files close when it ends; large ones are spooled to disk
+                documents.append(spool(upload.stream, name=os.path.basename(upload.filename)))
+        # Several documents are searched together
+        document = documents[0] if len(documents) == 1 else documents or None
+    prompt = fields.get("prompt")
+    if not prompt:
+        raise ApiError("A prompt is required")
+    if capability in DOCUMENT_CAPABILITIES and document is None:
+        raise ApiError(f"{capability} needs a document, sent as the multipart file 'document'")
+    return prompt, fields.get("model"), document, _flag(fields.get("stream", False))
+
+
+def create_app(conn_str: Optional[str] = None, model: Optional[str] = None,
+               pipeline: Optional[AgentPipeline] = None, max_pending: int = MAX_PENDING,
+               max_queued: int = MAX_QUEUED, queue_timeout: float = QUEUE_TIMEOUT) -> Flask:
+    conn_str = conn_str or os.getenv("AZURE_FOUNDRY_PROJECT_CONNSTRING")
+    default_model = model or os.getenv("AZURE_FOUNDRY_GPT_MODEL")
+    pipeline = pipeline or AgentPipeline(
+        conn_str, response_cache=get_response_cache() if RESPONSE_CACHE_ENABLED else None)
+    # Deletes the threads and other resources runs leave behind once they expire
+    start_sweeper(conn_str, pipeline.acquire_client())
+    # Admission control: one slot per request in flight, released when its run is over
+    admission = AdmissionQueue(max_pending, max_queued, queue_timeout)
+
+    app = Flask(__name__)
+
+    @app.errorhandler(ApiError)
+    def api_error(e):
+        return jsonify(error=str(e)), e.status
+
+    def run_capability(capability):
+        # Admitted before the body is read, so a request turned away never copies its documents
+        if not admission.acquire():
+            return Response(json.dumps({"error": "Too many requests in flight, retry later"}), status=429,
+                            mimetype="application/json", headers={"Retry-After": str(RETRY_AFTER)})
+        try:
+            prompt, model_name, document, stream = _parse_request(capability)
+            model_name = model_name or default_model
+            if not model_name:
+                raise ApiError("No model given and AZURE_FOUNDRY_GPT_MODEL is not set")
+        except BaseException:
+            admission.release()
+            raise
+        if stream:
+            return Response(_stream(capability, model_name, prompt, document), mimetype="text/event-stream",
+                            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+        try:
+            response = pipeline.run(capability, model_name, prompt, document=document)
+        except CircuitOpenError as e:
+            # The service is failing; clients back off like they do for 429
+            raise ApiError(str(e), 503)
+        except BudgetExceededError as e:
+            return Response(json.dumps({"error": str(e)}), status=429, mimetype="application/json",
+                            headers={"Retry-After": str(int(e.retry_after) + 1)})
+        except Exception as e:
+            print(f"Error running {capability}: {e}")
+            raise ApiError(f"{type(e).__name__}: {e}", 502)
+        finally:
+            admission.release()
+        return jsonify(response_json(response))
+
+    def _stream(capability, model_name, prompt, document):
+        # The pipeline runs on its own thread and hands progress, text and code over a queue;
+        # the slot is released when the run ends, even if the client disconnects first
+        events = queue.Queue()
+
+        def work():
+            try:
+                response = pipeline.run(
+                    capability, model_name, prompt, document=document, stream=True,
+                    on_progress=lambda fraction, message: events.put(("progress", {"fraction": fraction,
+                                                                                   "message": message})),
+                    on_event=lambda event: events.put((event.kind, {"value": event.value}))
+                )
+                events.put(("response", response_json(response)))
+            except Exception as e:
+                print(f"Error running {capability}: {e}")
+                events.put(("error", {"error": f"{type(e).__name__}: {e}"}))
+            finally:
+                admission.release()
+                events.put(None)
+
+        # Started before the response is returned, so the slot is released even if the body is never read
+        threading.Thread(target=work, name="api-stream", daemon=True).start()
+
+        def relay():
+            while True:
+                item = events.get()
+                if item is None:
+                    return
+                yield sse(*item)
+
+        return relay()
+
+    for path, capability in ENDPOINTS.items():
+        app.add_url_rule(path, endpoint=path.strip("/"), methods=["POST"],
+                         view_func=lambda capability=capability: run_capability(capability))
+
+    @app.get("/health")
+    def health():
+        return jsonify(status="ok", admission=admission.stats(), engine=pipeline.engine.stats(),
+                       usage=pipeline.usage_tracker.stats(),
+                       resource_sweeper=start_sweeper(conn_str, pipeline.acquire_client()).stats())
+
+    @app.get("/metrics")
+    def metrics():
+        return Response(stage_metrics.prometheus_text(), mimetype="text/plain; version=0.0.4")
+
+    return app
@@ -0,0 +1,250 @@
+import asyncio
+import atexit
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+from agent_service.agent_pool import get_agent_pool
+from agent_service.client_factory import create_async_credential, create_async_project_client, get_project_client
+from agent_service.run_engine import RUN_TIMEOUT, wait_for_run_async
+from agent_service.resource_ledger import THREAD, THREAD_TTL, current_session, get_resource_ledger, is_not_found, session_scope
+from agent_service.telemetry import capability_scope, span
+from agent_service.vector_store_cache import get_vector_store_cache
+
+# Process-wide asyncio engine for agent runs. Each engine owns an event loop on a background
+# thread and an azure.ai.projects.aio client, so Streamlit script threads only submit work and
+# wait on a future while many runs are in flight at once. Concurrency is bounded by a semaphore,
+# and independent setup steps (leasing the pooled agent, indexing the document, creating the
+# thread with its first message) run concurrently instead of one after another.
+
+MAX_CONCURRENT_RUNS = int(os.getenv("AZURE_FOUNDRY_MAX_CONCURRENT_RUNS", "16"))
+
+
+class AgentRequest(NamedTuple):
+    model: str
+    name: str
+    instructions: str
+    prompt: str
+    toolset: Any = None
+    tools: Any = None
+    tool_resources: Any = None
+    # Binary file object, or list of them, to search; its vector store is attached to the thread
+    document: Any = None
+    timeout: Optional[float] = RUN_TIMEOUT
+    # Existing thread to continue; the prompt is appended to it instead of starting a new one
+    thread_id: Optional[str] = None
+    # Label for the run's timing spans
+    capability: Optional[str] = None
+    # Called with a FileProgress for each document of a collection as it is ingested
+    on_file: Optional[Callable] = None
+    # prefetch.ThreadReserve to take a spare thread from instead of creating one
+    thread_reserve: Any = None
+
+
+class AgentResult(NamedTuple):
+    thread_id: str
+    run: Any
+    elapsed: float
+
+
+@asynccontextmanager
+async def _in_thread(context_manager):
+    # Enters a blocking context manager (agent pool and vector store leases) on a worker thread
+    value = await asyncio.to_thread(context_manager.__enter__)
+    try:
+        yield value
+    finally:
+        await asyncio.to_thread(context_manager.__exit__, None, None, None)
+
+
+class AsyncAgentEngine:
+    def __init__(self, conn_str: Optional[str], max_concurrency: int = MAX_CONCURRENT_RUNS,
+                 project_client=None, async_client=None):
+        self.conn_str = conn_str
+        self.max_concurrency = max_concurrency
+        # The sync client is used for the shared agent pool and vector store cache
+        self._project_client = project_client
+        self._async_client = async_client
+        self._credential = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.active = 0
+
+        self._loop = asyncio.new_event_loop()
+        # Leases block on HTTP calls, so give them enough threads to keep up with the runs
+        self._loop.set_default_executor(ThreadPoolExecutor(max_workers=max_concurrency * 2,
+                                                           thread_name_prefix="agent-engine-io"))
+        self._thread = threading.Thread(target=self._loop.run_forever, name="agent-engine", daemon=True)
+        self._thread.start()
+
+    def submit(self, request: AgentRequest, on_progress: Optional[Callable[[float, str], None]] = None) -> Future:
+        # on_progress(fraction, message) is called from the engine thread
+        with self._lock:
+            self.submitted += 1
+        # Tasks on the engine's loop don't inherit the caller's context, so the session is passed on
+        return asyncio.run_coroutine_threadsafe(self._execute(request, on_progress, current_session()), self._loop)
+
+    def run(self, request: AgentRequest, on_progress: Optional[Callable[[float, str], None]] = None) -> AgentResult:
+        return self.submit(request, on_progress).result()
+
+    async def _execute(self, request, on_progress, session=None):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        progress = on_progress or (lambda fraction, message: None)
+        # Set in this task's context, so the steps run on worker threads are labelled too
+        with capability_scope(request.capability), session_scope(session):
+            with span("queue_wait"):
+                await self._semaphore.acquire()
+            self.active += 1
+            start = time.perf_counter()
+            try:
+                thread_id, run = await self._run(request, progress)
+            except Exception:
+                self.failed += 1
+                raise
+            finally:
+                self.active -= 1
+                self._semaphore.release()
+            self.completed += 1
+            return AgentResult(thread_id, run, time.perf_counter() - start)
+
+    async def _run(self, request, progress):
+        from azure.ai.projects.models import FileSearchTool, ThreadMessageOptions
+
+        if self._project_client is None:
+            with span("client_init"):
+                self._project_client = await asyncio.to_thread(get_project_client, self.conn_str)
+        project_client = self._project_client
+        client = self._client()
+
+        async with AsyncExitStack() as leases:
+            async def acquire_agent():
+                agent_lease = get_agent_pool(self.conn_str).lease(
+                    project_client,
+                    model=request.model,
+                    name=request.name,
+                    instructions=request.instructions,
+                    toolset=request.toolset,
+                    tools=request.tools,
+                    tool_resources=request.tool_resources
+                )
+                agent_id = await leases.enter_async_context(_in_thread(agent_lease))
+                print(f"Using agent, agent ID: {agent_id}")
+                progress(0.3, "Acquired AI agent")
+                return agent_id
+
+            async def create_thread():
+                tool_resources = vector_store_id = None
+                if request.document is not None:
+                    document_lease = get_vector_store_cache(self.conn_str).lease_document(
+                        project_client, request.document, on_file=request.on_file)
+                    vector_store_id = await leases.enter_async_context(_in_thread(document_lease))
+                    print(f"Using vector store, vector store ID: {vector_store_id}")
+                    progress(0.3, "Vector store ready for document search")
+                    tool_resources = FileSearchTool(vector_store_ids=[vector_store_id]).resources
+                async def add_message(thread_id):
+                    with span("create_message"):
+                        message = await client.agents.create_message(
+                            thread_id=thread_id, role="user", content=request.prompt)
+                    print(f"Created message, message ID: {message.id}")
+                    progress(0.5, "Sent message to agent")
+                    return thread_id
+
+                if request.thread_id:
+                    try:
+                        return await add_message(request.thread_id)
+                    except Exception as e:
+                        if not is_not_found(e):
+                            raise
+                    # Deleted meanwhile, say by the sweeper after a long pause: the conversation
+                    # goes on in a new thread
+                    print(f"Conversation thread {request.thread_id} no longer exists, starting a new one")
+                    await asyncio.to_thread(get_resource_ledger().release, THREAD, request.thread_id)
+                if request.thread_reserve is not None:
+                    thread_id = await asyncio.to_thread(request.thread_reserve.take, project_client, vector_store_id)
+                    if thread_id is not None:
+                        print(f"Using spare thread, thread ID: {thread_id}")
+                        return await add_message(thread_id)
+                # The first message is sent with the thread instead of a separate create_message call
+                with span("create_thread"):
+                    thread = await client.agents.create_thread(
+                        tool_resources=tool_resources,
+                        messages=[ThreadMessageOptions(role="user", content=request.prompt)]
+                    )
+                await asyncio.to_thread(get_resource_ledger().record, self.conn_str, THREAD, thread.id, THREAD_TTL)
+                print(f"Created thread, thread ID: {thread.id}")
+                progress(0.5, "Created conversation thread")
+                return thread.id
+
+            # Wait for both before raising so a failed step never leaves a lease unreleased
+            agent_id, thread_id = await asyncio.gather(acquire_agent(), create_thread(), return_exceptions=True)
+            for outcome in (agent_id, thread_id):
+                if isinstance(outcome, BaseException):
+                    raise outcome
+
+            with span("run"):
+                run = await client.agents.create_run(thread_id=thread_id, assistant_id=agent_id)
+                progress(0.6, "Run started")
+                run = await wait_for_run_async(client, thread_id, run, timeout=request.timeout)
+        progress(1.0, "Run finished")
+        return thread_id, run
+
+    def _client(self):
+        # Created lazily on the engine's loop, which owns it from then on
+        if self._async_client is None:
+            with span("client_init"):
+                self._credential = create_async_credential()
+                self._async_client = create_async_project_client(self.conn_str, self._credential)
+        return self._async_client
+
+    async def _close_clients(self):
+        if self._async_client is not None:
+            await self._async_client.close()
+        if self._credential is not None:
+            await self._credential.close()
+
+    def close(self):
+        try:
+            asyncio.run_coroutine_threadsafe(self._close_clients(), self._loop).result(timeout=10)
+        except Exception as e:
+            print(f"Error closing async AI Project client: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=10)
+
+    def stats(self):
+        with self._lock:
+            submitted = self.submitted
+        return {
+            "max_concurrency": self.max_concurrency,
+            "active": self.active,
+            "queued": submitted - self.completed - self.failed - self.active,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+
+_engines: Dict[str, AsyncAgentEngine] = {}
+_engines_lock = threading.Lock()
+
+
+def get_async_engine(conn_str: Optional[str]) -> AsyncAgentEngine:
+    with _engines_lock:
+        engine = _engines.get(conn_str or "")
+        if engine is None:
+            engine = _engines[conn_str or ""] = AsyncAgentEngine(conn_str)
+        return engine
+
+
+@atexit.register
+def close_async_engines():
+    with _engines_lock:
+        engines = list(_engines.values())
+        _engines.clear()
+    for engine in engines:
+        engine.close()
@@ -0,0 +1,235 @@
+import csv
+import json
+import os
+import queue
+import statistics
+import threading
+import time
+from typing import Iterator, List, NamedTuple, Optional
+
+from agent_service.async_engine import AsyncAgentEngine
+from agent_service.capabilities import build_request
+from agent_service.client_factory import get_project_client
+from agent_service.messages import iter_messages, message_role
+from agent_service.resource_ledger import current_session, session_scope
+from agent_service.run_engine import code_inputs, run_status
+from agent_service.telemetry import span
+from agent_service.usage import get_usage_tracker, run_usage
+
+# Batch runs: many prompts against one capability. Every prompt gets its own thread, while the
+# pooled agent and the cached vector store for the document are shared by the whole batch.
+# Runs go through a dedicated async engine sized to the worker count, starts are spaced out by
+# an optional rate limit, and results are yielded in completion order. Runs count towards the
+# global and the session's token budgets; prompts submitted once one is used up fail with
+# BudgetExceededError.
+
+DEFAULT_WORKERS = int(os.getenv("AZURE_FOUNDRY_BATCH_WORKERS", "4"))
+
+# Prompts in a text file are separated by a line holding only this marker; a prompt may span
+# several lines, as the data tables in data/test-scripts.txt do, so lines alone don't split them
+PROMPT_SEPARATOR = "---"
+
+
+def load_prompts(path: str) -> List[str]:
+    # .jsonl files hold one {"prompt": ...} object per line; other files are plain text
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            return [json.loads(line)["prompt"] for line in f if line.strip()]
+        prompts, lines = [], []
+        for line in f.read().splitlines() + [PROMPT_SEPARATOR]:
+            if line.strip() == PROMPT_SEPARATOR:
+                prompt = "\n".join(lines).strip()
+                if prompt:
+                    prompts.append(prompt)
+                lines = []
+            else:
+                lines.append(line)
+        return prompts
+
+
+class BatchPacer:
+    # Spaces out run submissions across threads to at most `rate` per second; no limit when rate is
+    # falsy. The service calls within each run still go through agent_service.rate_limit's limiter
+    def __init__(self, rate: Optional[float] = None):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class BatchResult(NamedTuple):
+    index: int
+    prompt: str
+    status: str
+    response: str
+    latency: float
+    error: str = ""
+    thread_id: str = ""
+    run_id: str = ""
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    # The last code the run sent to the code interpreter, and the file IDs of the images it made
+    code: str = ""
+    image_ids: str = ""
+
+
+def _reply(project_client, thread_id, run_id):
+    # The run's reply text and the file IDs of its images
+    parts, image_ids = [], []
+    for message in iter_messages(project_client, thread_id, order="asc", run_id=run_id):
+        if message_role(message) != "assistant":
+            continue
+        for content in message.content or []:
+            if getattr(content, "type", None) == "text":
+                parts.append(content.text.value)
+            elif getattr(content, "type", None) == "image_file":
+                parts.append(f"[Image generated by the agent: {content.image_file.file_id}]")
+                image_ids.append(content.image_file.file_id)
+    return "\n".join(parts), image_ids
+
+
+def _run_steps(project_client, thread_id, run_id):
+    # Read once per finished run, for its per-step token usage and its code
+    try:
+        with span("list_run_steps"):
+            return project_client.agents.list_run_steps(thread_id=thread_id, run_id=run_id).data
+    except Exception as e:
+        print(f"Error listing the steps of run {run_id}: {e}")
+        return []
+
+
+def run_batch(conn_str: Optional[str], capability: str, model: str, prompts: List[str], document=None,
+              workers: int = DEFAULT_WORKERS, rate: Optional[float] = None,
+              project_client=None, engine: Optional[AsyncAgentEngine] = None,
+              session: Optional[str] = None) -> Iterator[BatchResult]:
+    # The runs' resources and token usage are tagged with the session, by default the caller's
+    session = session or current_session()
+    project_client = project_client or get_project_client(conn_str)
+    owns_engine = engine is None
+    if owns_engine:
+        engine = AsyncAgentEngine(conn_str, max_concurrency=workers, project_client=project_client)
+    pacer = BatchPacer(rate)
+    usage_tracker = get_usage_tracker()
+    finished = queue.Queue()
+
+    def submit_all():
+        for index, prompt in enumerate(prompts):
+            pacer.acquire()
+            start = time.perf_counter()
+            reservation = None
+            try:
+                reservation = usage_tracker.reserve(session)
+                # The engine picks up the session from the submitting context
+                with session_scope(session):
+                    future = engine.submit(build_request(capability, model, prompt, document=document))
+            except Exception as e:
+                usage_tracker.release(reservation)
+                finished.put((index, prompt, time.perf_counter() - start, None, e, None))
+                continue
+            future.add_done_callback(lambda f, index=index, prompt=prompt, start=start, reservation=reservation:
+                                     finished.put((index, prompt, time.perf_counter() - start, f, None, reservation)))
+
+    submitter = threading.Thread(target=submit_all, name="batch-submit", daemon=True)
+    submitter.start()
+    try:
+        for _ in prompts:
+            index, prompt, latency, future, error, reservation = finished.get()
+            result, usage = _result(project_client, index, prompt, latency, future, error)
+            if future is not None and future.exception() is None:
+                usage_tracker.record(capability, model, session, result.run_id, usage, reservation)
+            else:
+                usage_tracker.release(reservation)
+            yield result
+    finally:
+        submitter.join()
+        if owns_engine:
+            engine.close()
+
+
+def _result(project_client, index, prompt, latency, future, error):
+    # The prompt's result, and the run's token usage with its steps
+    if error is None:
+        error = future.exception()
+    if error is not None:
+        return BatchResult(index, prompt, "error", "", latency, error=f"{type(error).__name__}: {error}"), None
+
+    outcome = future.result()
+    status = run_status(outcome.run)
+    steps = _run_steps(project_client, outcome.thread_id, outcome.run.id)
+    usage = run_usage(outcome.run, steps)
+    tokens = {"prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens} if usage else {}
+    ids = {"thread_id": outcome.thread_id, "run_id": outcome.run.id}
+    if status != "completed":
+        return BatchResult(index, prompt, status, "", latency, error=str(outcome.run.last_error or ""),
+                           **ids, **tokens), usage
+    codes = [code for step in steps for code in code_inputs(step)]
+    try:
+        response, image_ids = _reply(project_client, outcome.thread_id, outcome.run.id)
+    except Exception as e:
+        return BatchResult(index, prompt, "error", "", latency, error=f"{type(e).__name__}: {e}",
+                           **ids, **tokens), usage
+    return BatchResult(index, prompt, status, response, latency, **ids, **tokens,
+                       code=codes[-1] if codes else "", image_ids=" ".join(image_ids)), usage
+
+
+class ResultWriter:
+    # Appends each result to a .jsonl or .csv file as soon as it is available
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "w", encoding="utf-8", newline="")
+        self._csv = None
+        if path.endswith(".csv"):
+            self._csv = csv.DictWriter(self._file, fieldnames=BatchResult._fields)
+            self._csv.writeheader()
+
+    def write(self, result: BatchResult):
+        if self._csv is not None:
+            self._csv.writerow(result._asdict())
+        else:
+            self._file.write(json.dumps(result._asdict()) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def summarize(results: List[BatchResult], elapsed: float):
+    latencies = sorted(result.latency for result in results)
+    failures = {}
+    for result in results:
+        if result.status != "completed":
+            reason = result.error.split(":", 1)[0] if result.status == "error" else result.status
+            failures[reason] = failures.get(reason, 0) + 1
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else 0.0
+
+    return {
+        "prompts": len(results),
+        "completed": sum(1 for result in results if result.status == "completed"),
+        "failed": sum(failures.values()),
+        "failures": failures,
+        "elapsed": elapsed,
+        "throughput": len(results) / elapsed if elapsed else 0.0,
+        "latency_mean": statistics.fmean(latencies) if latencies else 0.0,
+        "latency_p50": percentile(0.50),
+        "latency_p95": percentile(0.95),
+        "latency_max": latencies[-1] if latencies else 0.0,
+        "prompt_tokens": sum(result.prompt_tokens for result in results),
+        "completion_tokens": sum(result.completion_tokens for result in results),
+    }
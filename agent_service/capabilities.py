@@ -0,0 +1,62 @@
+from agent_service.async_engine import AgentRequest
+
+# Agent definitions for the capabilities offered by the app and the batch runner. Requests
+# built here share pooled agents, because the pool keys on model, tools and instructions.
+
+CODE_INTERPRETER = "Code Interpreter"
+RAG = "RAG"
+RAG_CODE_INTERPRETER = "RAG + Code Interpreter"
+CAPABILITIES = (CODE_INTERPRETER, RAG, RAG_CODE_INTERPRETER)
+
+# Capabilities that search an uploaded document
+DOCUMENT_CAPABILITIES = (RAG, RAG_CODE_INTERPRETER)
+
+
+def build_request(capability: str, model: str, prompt: str, document=None) -> AgentRequest:
+    if capability in DOCUMENT_CAPABILITIES and document is None:
+        raise ValueError(f"{capability} needs a document to search")
+    return agent_request(capability, model)._replace(prompt=prompt, document=document)
+
+
+def agent_request(capability: str, model: str) -> AgentRequest:
+    # The capability's agent without a prompt or document, enough to create the agent ahead of a run
+    from azure.ai.projects.models import CodeInterpreterTool, FileSearchTool, ToolSet
+
+    if capability == CODE_INTERPRETER:
+        toolset = ToolSet()
+        toolset.add(CodeInterpreterTool())
+        return AgentRequest(
+            model=model,
+            name="code-interpreter-agent",
+            instructions="You are a helpful data analyst. You can use Python to perform required calculations.",
+            prompt="",
+            toolset=toolset,
+            capability=capability
+        )
+
+    if capability == RAG:
+        # The vector store is attached to each thread so the agent itself can be pooled
+        file_search_tool = FileSearchTool()
+        return AgentRequest(
+            model=model,
+            name="rag-agent",
+            instructions="You are a helpful agent which provides answer ONLY from the search.",
+            prompt="",
+            tools=file_search_tool.definitions,
+            tool_resources=file_search_tool.resources,
+            capability=capability
+        )
+
+    if capability != RAG_CODE_INTERPRETER:
+        raise ValueError(f"Unknown capability: {capability}")
+    toolset = ToolSet()
+    toolset.add(CodeInterpreterTool())
+    toolset.add(FileSearchTool())
+    return AgentRequest(
+        model=model,
+        name="rag-code-interpreter-agent",
+        instructions="You are a helpful agent that can analyze documents and generate Python code based on the document content. Use the file search to extract relevant information and then generate appropriate Python code for analysis when needed.",
+        prompt="",
+        toolset=toolset,
+        capability=capability
+    )
@@ -0,0 +1,146 @@
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from agent_service.rate_limit import rate_limited
+
+# Process-wide AIProjectClient factory. One client (and one HTTP connection pool) is
+# shared by every request and Streamlit session for a given connection string, and a
+# single credential is shared by all clients so tokens are fetched once and reused
+# until they are about to expire. The Azure SDK modules are imported on first use, so pages
+# and processes that never reach the service don't pay for loading them.
+
+HTTP_POOL_SIZE = int(os.getenv("AZURE_FOUNDRY_HTTP_POOL_SIZE", "32"))
+# Refresh tokens this many seconds before they expire
+TOKEN_REFRESH_MARGIN = 300
+
+_metrics = {"client_creations": 0, "token_requests": 0, "token_refreshes": 0}
+_metrics_lock = threading.Lock()
+
+
+def _count(name):
+    with _metrics_lock:
+        _metrics[name] += 1
+
+
+def client_metrics():
+    with _metrics_lock:
+        return dict(_metrics)
+
+
+class CachingCredential:
+    # Wraps a TokenCredential and caches each token until shortly before it expires
+
+    def __init__(self, credential):
+        self._credential = credential
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def get_token(self, *scopes, claims=None, tenant_id=None, **kwargs):
+        _count("token_requests")
+        key = (scopes, claims, tenant_id)
+        token = self._tokens.get(key)
+        if token and token.expires_on - TOKEN_REFRESH_MARGIN > time.time():
+            return token
+        with self._lock:
+            token = self._tokens.get(key)
+            if token and token.expires_on - TOKEN_REFRESH_MARGIN > time.time():
+                return token
+            token = self._credential.get_token(*scopes, claims=claims, tenant_id=tenant_id, **kwargs)
+            self._tokens[key] = token
+            _count("token_refreshes")
+            return token
+
+    def close(self):
+        close = getattr(self._credential, "close", None)
+        if callable(close):
+            close()
+
+
+def create_http_transport(pool_size: int = HTTP_POOL_SIZE):
+    # Keep-alive requests session with a connection pool sized for concurrent sessions
+    import requests
+    from azure.core.pipeline.transport import RequestsTransport
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return RequestsTransport(session=session, session_owner=False)
+
+
+_credential: Optional[CachingCredential] = None
+_clients: Dict[str, object] = {}
+_clients_lock = threading.Lock()
+
+
+def get_credential() -> CachingCredential:
+    global _credential
+    with _clients_lock:
+        if _credential is None:
+            from azure.identity import DefaultAzureCredential
+
+            _credential = CachingCredential(DefaultAzureCredential())
+        return _credential
+
+
+def get_project_client(conn_str: str):
+    client = _clients.get(conn_str)
+    if client is not None:
+        return client
+    credential = get_credential()
+    with _clients_lock:
+        client = _clients.get(conn_str)
+        if client is None:
+            from azure.ai.projects import AIProjectClient
+
+            client = AIProjectClient.from_connection_string(
+                credential=credential,
+                conn_str=conn_str,
+                transport=create_http_transport(),
+                # Retries, with throttling and a circuit breaker, are left to the rate limiter
+                retry_total=0
+            )
+            _clients[conn_str] = rate_limited(client, conn_str)
+            _count("client_creations")
+            print("Created shared AI Project client")
+        return client
+
+
+class AsyncCachingCredential:
+    # CachingCredential for the azure.ai.projects.aio client; one per event loop
+
+    def __init__(self, credential):
+        self._credential = credential
+        self._tokens = {}
+
+    async def get_token(self, *scopes, claims=None, tenant_id=None, **kwargs):
+        _count("token_requests")
+        key = (scopes, claims, tenant_id)
+        token = self._tokens.get(key)
+        if token and token.expires_on - TOKEN_REFRESH_MARGIN > time.time():
+            return token
+        token = await self._credential.get_token(*scopes, claims=claims, tenant_id=tenant_id, **kwargs)
+        self._tokens[key] = token
+        _count("token_refreshes")
+        return token
+
+    async def close(self):
+        await self._credential.close()
+
+
+def create_async_credential() -> AsyncCachingCredential:
+    from azure.identity.aio import DefaultAzureCredential as AsyncDefaultAzureCredential
+
+    return AsyncCachingCredential(AsyncDefaultAzureCredential())
+
+
+def create_async_project_client(conn_str: str, credential):
+    # Async clients are bound to the event loop that uses them, so callers own their lifetime
+    from azure.ai.projects.aio import AIProjectClient as AsyncAIProjectClient
+
+    client = AsyncAIProjectClient.from_connection_string(credential=credential, conn_str=conn_str, retry_total=0)
+    _count("client_creations")
+    print("Created async AI Project client")
+    return rate_limited(client, conn_str, is_async=True)
@@ -0,0 +1,66 @@
+from typing import List, Optional
+
+from agent_service.resource_ledger import THREAD, THREAD_TTL, get_resource_ledger
+from agent_service.telemetry import span
+
+# Multi-turn conversations: each session keeps one thread per capability and appends follow-up
+# questions to it, so the agent keeps its context and thread setup is paid once.
+
+# Turns kept for display; the thread on the service keeps the whole conversation
+MAX_TURNS = 40
+
+
+class Conversation:
+    # Lives in st.session_state; `document` is the name of the file the thread searches, if any
+    def __init__(self, capability: str):
+        self.capability = capability
+        self.thread_id: Optional[str] = None
+        self.document: Optional[str] = None
+        self.turns: List[tuple] = []
+
+    @classmethod
+    def from_state(cls, capability: str, state: Optional[dict]) -> "Conversation":
+        # Restores a conversation saved with state(), such as from the session store
+        conversation = cls(capability)
+        if state:
+            conversation.thread_id = state.get("thread_id")
+            conversation.document = state.get("document")
+            conversation.turns = [tuple(turn) for turn in state.get("turns", [])]
+        return conversation
+
+    def state(self) -> dict:
+        return {"thread_id": self.thread_id, "document": self.document, "turns": [list(turn) for turn in self.turns]}
+
+    def thread_for(self, document: Optional[str] = None) -> Optional[str]:
+        # The thread's vector store is fixed when it is created, so a new document starts over
+        if self.thread_id and document != self.document:
+            return None
+        return self.thread_id
+
+    def record(self, thread_id: str, document: Optional[str], prompt: str, reply: str):
+        if thread_id != self.thread_id:
+            self.turns = []
+        self.thread_id = thread_id
+        self.document = document
+        self.turns.append(("user", prompt))
+        self.turns.append(("assistant", reply))
+        del self.turns[:-MAX_TURNS]
+        # Kept while the conversation goes on; the sweeper deletes it once the session is abandoned
+        get_resource_ledger().touch(THREAD, thread_id, THREAD_TTL)
+
+    def reset(self, project_client=None):
+        # Deletes the thread on the service when a client is given
+        thread_id, self.thread_id, self.document, self.turns = self.thread_id, None, None, []
+        if thread_id and project_client is not None:
+            delete_thread(project_client, thread_id)
+        return thread_id
+
+
+def delete_thread(project_client, thread_id):
+    try:
+        with span("cleanup"):
+            project_client.agents.delete_thread(thread_id)
+        get_resource_ledger().release(THREAD, thread_id)
+        print(f"Deleted conversation thread, thread ID: {thread_id}")
+    except Exception as e:
+        print(f"Error deleting conversation thread {thread_id}: {e}")
@@ -0,0 +1,61 @@
+import logging
+import os
+from logging.handlers import RotatingFileHandler
+from pprint import PrettyPrinter
+
+# Opt-in debug log for full SDK objects (message lists, runs) that are too large for stdout.
+# Off unless AZURE_FOUNDRY_DEBUG_LOG names a file; each entry is truncated and the file is
+# rotated at a fixed size, so enabling it never grows memory or disk use without bound. Entries
+# stop being formatted once they reach the limit, and replies printed to stdout are truncated too.
+
+DEBUG_LOG_PATH = os.getenv("AZURE_FOUNDRY_DEBUG_LOG")
+DEBUG_LOG_MAX_BYTES = int(os.getenv("AZURE_FOUNDRY_DEBUG_LOG_MAX_BYTES", str(1024 * 1024)))
+MAX_ENTRY_CHARS = 4000
+# Characters of a reply printed to stdout
+MAX_PRINT_CHARS = 500
+
+_logger = logging.getLogger("agent_service.debug")
+_logger.propagate = False
+if DEBUG_LOG_PATH:
+    _handler = RotatingFileHandler(DEBUG_LOG_PATH, maxBytes=DEBUG_LOG_MAX_BYTES, backupCount=1, encoding="utf-8")
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    _logger.addHandler(_handler)
+    _logger.setLevel(logging.DEBUG)
+
+
+class _EntryFull(Exception):
+    pass
+
+
+class _BoundedWriter:
+    # Keeps formatted text up to a limit, then stops the formatting instead of building the rest
+    def __init__(self, limit: int):
+        self.parts = []
+        self.size = 0
+        self.limit = limit
+
+    def write(self, text: str):
+        self.parts.append(text[:self.limit - self.size])
+        self.size += len(text)
+        if self.size > self.limit:
+            raise _EntryFull
+
+
+def preview(value, limit: int = MAX_PRINT_CHARS) -> str:
+    text = str(value)
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}... [{len(text) - limit} more characters]"
+
+
+def debug_log(label: str, value):
+    # The value is only formatted when the log is enabled
+    if not DEBUG_LOG_PATH:
+        return
+    writer = _BoundedWriter(MAX_ENTRY_CHARS)
+    try:
+        PrettyPrinter(stream=writer).pprint(value)
+        text = "".join(writer.parts).rstrip("\n")
+    except _EntryFull:
+        text = f"{''.join(writer.parts)}... [truncated]"
+    _logger.debug("%s: %s", label, text)
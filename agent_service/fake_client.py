@@ -0,0 +1,442 @@
+import asyncio
+import contextvars
+import itertools
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+from typing import Callable, Dict, Optional, Union
+
+from azure.core.exceptions import HttpResponseError
+
+from agent_service.streaming import replay_stream, to_sse
+
+# Local stand-in for AIProjectClient so the app helpers can be exercised offline.
+# Only the parts of `project_client.agents` used by AgentOnTheFly.py are implemented.
+# Latencies are fixed or drawn from a distribution, and service errors and failed runs can be
+# injected at a given rate; pass a seed to make a benchmark's draws repeatable.
+
+# Simulated round-trip time (seconds) per operation, roughly what the live service costs
+DEFAULT_LATENCY = {
+    "create_agent": 0.25,
+    "delete_agent": 0.15,
+    "create_thread": 0.1,
+    "delete_thread": 0.1,
+    "create_message": 0.1,
+    "create_run": 0.1,
+    "get_run": 0.05,
+    "cancel_run": 0.05,
+    "list_messages": 0.1,
+    "list_run_steps": 0.1,
+    "upload_file_and_poll": 0.5,
+    "create_vector_store_and_poll": 1.5,
+    "create_vector_store_file_batch_and_poll": 1.5,
+    "list_vector_store_file_batch_files": 0.1,
+    "get_vector_store": 0.05,
+    "delete_vector_store": 0.15,
+    "delete_file": 0.1,
+    "save_file": 0.2,
+    "get_file_content": 0.2,
+}
+
+# Simulated time (seconds) the service spends processing a run before it completes
+DEFAULT_RUN_DURATION = 1.5
+# Share of the run duration spent before the first streamed token
+FIRST_TOKEN_SHARE = 0.4
+
+TERMINAL_RUN_STATUSES = ("completed", "failed", "cancelled", "expired", "incomplete")
+
+# Latency distributions: called with the client's random.Random, return seconds
+Latency = Union[float, Callable[[random.Random], float]]
+
+
+def uniform(low: float, high: float) -> Latency:
+    return lambda rng: rng.uniform(low, high)
+
+
+def lognormal(median: float, sigma: float = 0.5) -> Latency:
+    # Right-skewed like real service latencies: most calls near the median, a long tail
+    return lambda rng: median * math.exp(rng.gauss(0, sigma))
+
+
+def scaled(latency: Dict[str, float], sigma: float = 0.5) -> Dict[str, Latency]:
+    # The given fixed latencies as log-normal distributions with the same medians
+    return {op: lognormal(delay, sigma) for op, delay in latency.items()}
+
+
+class FakeServiceError(HttpResponseError):
+    # Injected failure, shaped like the errors the SDK raises for non-2xx responses
+    def __init__(self, op, status_code=500):
+        super().__init__(message=f"Injected {status_code} error from {op}")
+        self.status_code = status_code
+
+
+# Set while an operation runs through the async client, which awaits the latency itself
+_async_call = contextvars.ContextVar("fake_async_call", default=False)
+
+# 1x1 PNG returned for generated image outputs
+FAKE_PNG = (b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x02\x00\x00\x00\x90wS\xde"
+            b"\x00\x00\x00\x0cIDATx\x9ccpK9\x01\x00\x02f\x01s\xc5\x90\x8dq\x00\x00\x00\x00IEND\xaeB`\x82")
+
+
+def _text(value):
+    return SimpleNamespace(type="text", text=SimpleNamespace(value=value, annotations=[]))
+
+
+def _image(file_id):
+    return SimpleNamespace(type="image_file", image_file=SimpleNamespace(file_id=file_id))
+
+
+class FakeAgentsOperations:
+    def __init__(self, latency: Optional[Dict[str, Latency]] = None, run_duration: Latency = DEFAULT_RUN_DURATION,
+                 reply: str = "Fake agent reply.", image: int = 0,
+                 failure_rate: Union[float, Dict[str, float]] = 0.0, failure_status: int = 500,
+                 run_failure_rate: float = 0.0, seed: Optional[int] = None):
+        self.latency = dict(DEFAULT_LATENCY if latency is None else latency)
+        self.run_duration = run_duration
+        self.reply = reply
+        # Number of images generated per reply (True counts as one)
+        self.image = int(image)
+        # Share of calls that raise FakeServiceError, overall or per operation
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        # Share of runs that end with status "failed"
+        self.run_failure_rate = run_failure_rate
+        self.calls = Counter()
+        self.failures = Counter()
+        self._random = random.Random(seed)
+        self.agents = {}
+        self.threads = {}
+        self.files = {}
+        self.vector_stores = {}
+        self.file_batches = {}
+        self.runs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _draw(self, latency: Latency) -> float:
+        if callable(latency):
+            with self._lock:
+                return max(0.0, latency(self._random))
+        return latency
+
+    def delay(self, op) -> float:
+        return self._draw(self.latency.get(op, 0))
+
+    def _call(self, op):
+        with self._lock:
+            self.calls[op] += 1
+        if not _async_call.get():
+            delay = self.delay(op)
+            if delay:
+                time.sleep(delay)
+        self._maybe_fail(op)
+
+    def _maybe_fail(self, op):
+        rate = self.failure_rate.get(op, 0.0) if isinstance(self.failure_rate, dict) else self.failure_rate
+        with self._lock:
+            failed = rate and self._random.random() < rate
+            if failed:
+                self.failures[op] += 1
+        if failed:
+            raise FakeServiceError(op, self.failure_status)
+
+    def _new_id(self, prefix):
+        with self._lock:
+            return f"{prefix}_{next(self._ids):06d}"
+
+    def _now(self):
+        return int(time.time() * 1000)
+
+    # Agents
+    def create_agent(self, model, name=None, instructions=None, toolset=None, tools=None, tool_resources=None, **kwargs):
+        self._call("create_agent")
+        agent = SimpleNamespace(id=self._new_id("asst"), model=model, name=name, instructions=instructions,
+                                tools=toolset.definitions if toolset is not None else tools)
+        self.agents[agent.id] = agent
+        return agent
+
+    def delete_agent(self, agent_id, **kwargs):
+        self._call("delete_agent")
+        if self.agents.pop(agent_id, None) is None:
+            raise KeyError(f"No agent found with id '{agent_id}'")
+        return SimpleNamespace(id=agent_id, deleted=True)
+
+    # Threads and messages
+    def create_thread(self, tool_resources=None, messages=None, **kwargs):
+        self._call("create_thread")
+        thread = SimpleNamespace(id=self._new_id("thread"), tool_resources=tool_resources, messages=[])
+        for message in messages or []:
+            thread.messages.append(SimpleNamespace(id=self._new_id("msg"), thread_id=thread.id, role=message.role,
+                                                   run_id=None, created_at=self._now(), content=[_text(message.content)]))
+        self.threads[thread.id] = thread
+        return thread
+
+    def create_message(self, thread_id, role, content, **kwargs):
+        self._call("create_message")
+        message = SimpleNamespace(id=self._new_id("msg"), thread_id=thread_id, role=role, run_id=None,
+                                  created_at=self._now(), content=[_text(content)])
+        self.threads[thread_id].messages.append(message)
+        return message
+
+    def list_messages(self, thread_id, run_id=None, limit=None, order=None, after=None, before=None, **kwargs):
+        # Same paging contract as the service: newest first by default, `after`/`before` are message ids
+        self._call("list_messages")
+        messages = list(self.threads[thread_id].messages)
+        if run_id:
+            messages = [m for m in messages if m.run_id == run_id]
+        if str(getattr(order, "value", order or "desc")) == "desc":
+            messages.reverse()
+        ids = [m.id for m in messages]
+        if after in ids:
+            messages = messages[ids.index(after) + 1:]
+        if before in ids:
+            messages = messages[:ids.index(before)]
+        limit = limit or 20
+        page = messages[:limit]
+        return SimpleNamespace(data=page, has_more=len(messages) > limit,
+                               first_id=page[0].id if page else None, last_id=page[-1].id if page else None)
+
+    def delete_thread(self, thread_id, **kwargs):
+        self._call("delete_thread")
+        if self.threads.pop(thread_id, None) is None:
+            raise KeyError(f"No thread found with id '{thread_id}'")
+        return SimpleNamespace(id=thread_id, deleted=True)
+
+    # Runs
+    def create_run(self, thread_id, assistant_id, **kwargs):
+        self._call("create_run")
+        with self._lock:
+            fail = self.run_failure_rate and self._random.random() < self.run_failure_rate
+        duration = self._draw(self.run_duration)
+        run = SimpleNamespace(id=self._new_id("run"), thread_id=thread_id, assistant_id=assistant_id,
+                              status="queued", last_error=None, usage=None, steps=[], duration=duration, fail=fail,
+                              ready_at=time.monotonic() + duration)
+        if assistant_id not in self.agents:
+            run.status = "failed"
+            run.last_error = {"code": "not_found", "message": f"No assistant found with id '{assistant_id}'."}
+        self.runs[run.id] = run
+        return run
+
+    def get_run(self, thread_id, run_id, **kwargs):
+        self._call("get_run")
+        run = self.runs[run_id]
+        if run.status not in TERMINAL_RUN_STATUSES:
+            if time.monotonic() >= run.ready_at:
+                self._complete_run(run)
+            else:
+                run.status = "in_progress"
+        return run
+
+    def cancel_run(self, thread_id, run_id, **kwargs):
+        self._call("cancel_run")
+        run = self.runs[run_id]
+        if run.status not in TERMINAL_RUN_STATUSES:
+            run.status = "cancelled"
+        return run
+
+    def list_runs(self, thread_id, limit=None, order=None, **kwargs):
+        # Newest first, like the service's default order
+        self._call("list_runs")
+        runs = [run for run in reversed(list(self.runs.values())) if run.thread_id == thread_id]
+        if str(getattr(order, "value", order or "desc")) == "asc":
+            runs.reverse()
+        return SimpleNamespace(data=runs[:limit or 20], has_more=len(runs) > (limit or 20))
+
+    def create_and_process_run(self, thread_id, assistant_id, sleep_interval=1, **kwargs):
+        # Same fixed-interval polling loop as the SDK
+        run = self.create_run(thread_id=thread_id, assistant_id=assistant_id)
+        while run.status in ("queued", "in_progress", "requires_action"):
+            time.sleep(sleep_interval)
+            run = self.get_run(thread_id=thread_id, run_id=run.id)
+        return run
+
+    def create_stream(self, thread_id, assistant_id, **kwargs):
+        run = self.create_run(thread_id=thread_id, assistant_id=assistant_id)
+        return replay_stream(self._stream_events(run))
+
+    def _stream_events(self, run):
+        # Server-sent events for the run, paced like the service: a pause before the first
+        # token, then the rest of the run duration spread over the reply's tokens
+        def run_event(event_type):
+            yield to_sse(event_type, {"id": run.id, "object": "thread.run", "status": run.status,
+                                      "thread_id": run.thread_id, "assistant_id": run.assistant_id,
+                                      "last_error": run.last_error, "usage": run.usage})
+
+        yield from run_event("thread.run.created")
+        if run.status == "failed":
+            yield from run_event("thread.run.failed")
+            yield to_sse("done", "[DONE]")
+            return
+        run.status = "in_progress"
+        yield from run_event("thread.run.in_progress")
+
+        tokens = re.findall(r"\S+\s*", self.reply) or [self.reply]
+        time.sleep(run.duration * FIRST_TOKEN_SHARE)
+        message = self._complete_run(run)
+        if message is None:
+            yield from run_event("thread.run.failed")
+            yield to_sse("done", "[DONE]")
+            return
+        for step in run.steps:
+            tool_calls = [{"id": f"call_{i}", "type": "code_interpreter",
+                           "code_interpreter": {"input": call.code_interpreter.input, "outputs": []}}
+                          for i, call in enumerate(step.step_details.tool_calls)]
+            yield to_sse("thread.run.step.completed", {"id": step.id, "object": "thread.run.step", "type": "tool_calls",
+                                                       "status": "completed", "run_id": run.id, "usage": step.usage,
+                                                       "step_details": {"type": "tool_calls", "tool_calls": tool_calls}})
+        for token in tokens:
+            time.sleep(run.duration * (1 - FIRST_TOKEN_SHARE) / len(tokens))
+            yield to_sse("thread.message.delta", {"id": message.id, "object": "thread.message.delta",
+                                                  "delta": {"content": [{"index": 0, "type": "text", "text": {"value": token}}]}})
+        content = [{"type": "text", "text": {"value": self.reply, "annotations": []}}]
+        content += [{"type": "image_file", "image_file": {"file_id": item.image_file.file_id}}
+                    for item in message.content if item.type == "image_file"]
+        yield to_sse("thread.message.completed", {"id": message.id, "object": "thread.message", "role": "assistant",
+                                                  "status": "completed", "run_id": run.id, "content": content})
+        yield from run_event("thread.run.completed")
+        yield to_sse("done", "[DONE]")
+
+    def _complete_run(self, run):
+        if run.fail:
+            run.status = "failed"
+            run.last_error = {"code": "server_error", "message": "Injected run failure."}
+            return None
+        # Token usage like the service reports it: the thread's messages are the prompt
+        prompt_tokens = 200 + sum(len(item.text.value) // 4 for message in self.threads[run.thread_id].messages
+                                  for item in message.content if item.type == "text")
+        completion_tokens = len(self.reply) // 4 + 40
+        content = [_text(self.reply)]
+        for _ in range(self.image):
+            file_id = self._new_id("assistant-img")
+            self.files[file_id] = SimpleNamespace(id=file_id, data=FAKE_PNG)
+            content.append(_image(file_id))
+        message = SimpleNamespace(id=self._new_id("msg"), thread_id=run.thread_id, role="assistant", run_id=run.id,
+                                  created_at=self._now(), content=content)
+        self.threads[run.thread_id].messages.append(message)
+        tool_call = SimpleNamespace(type="code_interpreter",
+                                    code_interpreter=SimpleNamespace(input="print('hello from the fake agent')", outputs=[]))
+        step_usage = {"prompt_tokens": prompt_tokens // 2, "completion_tokens": 40, "total_tokens": prompt_tokens // 2 + 40}
+        run.steps.append(SimpleNamespace(id=self._new_id("step"), type="tool_calls", usage=step_usage,
+                                         step_details=SimpleNamespace(type="tool_calls", tool_calls=[tool_call])))
+        run.usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                     "total_tokens": prompt_tokens + completion_tokens}
+        run.status = "completed"
+        return message
+
+    def list_run_steps(self, thread_id, run_id, **kwargs):
+        self._call("list_run_steps")
+        return SimpleNamespace(data=list(self.runs[run_id].steps))
+
+    # Files and vector stores
+    def upload_file_and_poll(self, file_path=None, purpose=None, file=None, filename=None, **kwargs):
+        self._call("upload_file_and_poll")
+        if file_path is not None:
+            with open(file_path, "rb") as f:
+                data = f.read()
+        else:
+            data = file.read() if hasattr(file, "read") else bytes(file)
+        uploaded = SimpleNamespace(id=self._new_id("assistant-file"), filename=filename or file_path,
+                                   bytes=len(data), purpose=purpose, status="processed", data=data)
+        self.files[uploaded.id] = uploaded
+        return uploaded
+
+    def create_vector_store_and_poll(self, file_ids=None, name=None, **kwargs):
+        self._call("create_vector_store_and_poll")
+        store = SimpleNamespace(id=self._new_id("vs"), name=name, file_ids=list(file_ids or []), status="completed")
+        self.vector_stores[store.id] = store
+        return store
+
+    def create_vector_store_file_batch_and_poll(self, vector_store_id, file_ids=None, **kwargs):
+        self._call("create_vector_store_file_batch_and_poll")
+        store = self.vector_stores[vector_store_id]
+        file_ids = list(file_ids or [])
+        store.file_ids.extend(file_ids)
+        batch = SimpleNamespace(id=self._new_id("vsfb"), vector_store_id=vector_store_id, status="completed",
+                                file_ids=file_ids,
+                                file_counts=SimpleNamespace(completed=len(file_ids), failed=0, in_progress=0,
+                                                            cancelled=0, total=len(file_ids)))
+        self.file_batches[batch.id] = batch
+        return batch
+
+    def list_vector_store_file_batch_files(self, vector_store_id, batch_id, filter=None, **kwargs):
+        self._call("list_vector_store_file_batch_files")
+        batch = self.file_batches[batch_id]
+        files = [SimpleNamespace(id=file_id, vector_store_id=vector_store_id, status="completed", last_error=None)
+                 for file_id in batch.file_ids]
+        return SimpleNamespace(data=[f for f in files if filter is None or f.status == filter])
+
+    def get_vector_store(self, vector_store_id, **kwargs):
+        self._call("get_vector_store")
+        if vector_store_id not in self.vector_stores:
+            raise KeyError(f"No vector store found with id '{vector_store_id}'")
+        return self.vector_stores[vector_store_id]
+
+    def delete_file(self, file_id, **kwargs):
+        self._call("delete_file")
+        if self.files.pop(file_id, None) is None:
+            raise KeyError(f"No file found with id '{file_id}'")
+        return SimpleNamespace(id=file_id, deleted=True)
+
+    def delete_vector_store(self, vector_store_id, **kwargs):
+        self._call("delete_vector_store")
+        if self.vector_stores.pop(vector_store_id, None) is None:
+            raise KeyError(f"No vector store found with id '{vector_store_id}'")
+        return SimpleNamespace(id=vector_store_id, deleted=True)
+
+    def get_file_content(self, file_id, **kwargs):
+        self._call("get_file_content")
+        data = self.files[file_id].data
+        # Streamed in chunks like the SDK's Iterator[bytes]
+        return iter([data[i:i + 65536] for i in range(0, len(data), 65536)])
+
+    def save_file(self, file_id, file_name, target_dir=None):
+        self._call("save_file")
+        path = file_name if target_dir is None else f"{target_dir}/{file_name}"
+        with open(path, "wb") as f:
+            f.write(self.files[file_id].data)
+
+
+class FakeAsyncAgentsOperations:
+    # Async view over a FakeAgentsOperations; latency is awaited instead of slept
+    def __init__(self, operations: FakeAgentsOperations):
+        self._operations = operations
+
+    def __getattr__(self, name):
+        method = getattr(self._operations, name)
+
+        async def call(*args, **kwargs):
+            delay = self._operations.delay(name)
+            if delay:
+                await asyncio.sleep(delay)
+            token = _async_call.set(True)
+            try:
+                return method(*args, **kwargs)
+            finally:
+                _async_call.reset(token)
+
+        return call
+
+
+class FakeAIProjectClient:
+    def __init__(self, **kwargs):
+        self.agents = FakeAgentsOperations(**kwargs)
+
+    @classmethod
+    def from_connection_string(cls, credential=None, conn_str=None, **kwargs):
+        return cls()
+
+    def aio(self):
+        # Async client sharing this client's agents, threads and runs
+        return FakeAsyncAIProjectClient(self.agents)
+
+
+class FakeAsyncAIProjectClient:
+    def __init__(self, operations: FakeAgentsOperations):
+        self.agents = FakeAsyncAgentsOperations(operations)
+
+    async def close(self):
+        pass
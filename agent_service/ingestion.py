@@ -0,0 +1,162 @@
+import contextvars
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from agent_service.resource_ledger import FILE, VECTOR_STORE, get_resource_ledger
+from agent_service.telemetry import span
+from agent_service.uploads import file_sha256, upload_file
+
+# Ingestion of document collections into one vector store. Documents are hashed and
+# deduplicated by content, uploaded concurrently by a bounded pool, and added to the store in
+# file batches (create_vector_store_file_batch_and_poll) instead of one store per file. Adding
+# documents to an existing store only uploads and indexes the new ones. Each document's
+# progress is reported on the calling thread as it is uploaded and indexed.
+
+UPLOAD_WORKERS = int(os.getenv("AZURE_FOUNDRY_UPLOAD_WORKERS", "8"))
+# Largest number of files the service accepts in one file batch
+FILE_BATCH_SIZE = 500
+
+# FileProgress statuses
+DUPLICATE = "duplicate"
+EXISTING = "existing"
+UPLOADED = "uploaded"
+INDEXED = "indexed"
+FAILED = "failed"
+
+
+class FileProgress(NamedTuple):
+    name: str
+    status: str
+    file_id: Optional[str] = None
+    error: Optional[str] = None
+
+
+FileCallback = Callable[[FileProgress], None]
+
+
+class IngestResult(NamedTuple):
+    vector_store_id: str
+    # Content SHA-256 -> file ID of every document in the store
+    files: Dict[str, str]
+
+
+def _no_report(progress):
+    pass
+
+
+def as_documents(document) -> List:
+    # A request's document is a single binary file object or a list of them
+    if document is None:
+        return []
+    return list(document) if isinstance(document, (list, tuple)) else [document]
+
+
+def document_name(document) -> Optional[str]:
+    documents = as_documents(document)
+    return ", ".join(sorted(d.name for d in documents)) if documents else None
+
+
+def document_sha256(document) -> Optional[str]:
+    # A single document's content hash, or a hash of a collection's sorted content hashes
+    documents = as_documents(document)
+    if not documents:
+        return None
+    if len(documents) == 1:
+        return file_sha256(documents[0])
+    return hashlib.sha256("\n".join(sorted({file_sha256(d) for d in documents})).encode("utf-8")).hexdigest()
+
+
+def hash_documents(documents, on_file: Optional[FileCallback] = None) -> Dict[str, object]:
+    # Content SHA-256 -> document; repeated contents are reported as duplicates and dropped
+    report = on_file or _no_report
+    hashed = {}
+    for document in documents:
+        sha = file_sha256(document)
+        if sha in hashed:
+            report(FileProgress(document.name, DUPLICATE))
+        else:
+            hashed[sha] = document
+    return hashed
+
+
+def _upload(project_client, document):
+    with span("upload_file"):
+        return upload_file(project_client, document, document.name)
+
+
+def ingest_documents(project_client, documents: Dict[str, object], conn_str: Optional[str] = None,
+                     vector_store_id: Optional[str] = None, indexed: Optional[Dict[str, str]] = None,
+                     name: Optional[str] = None, chunking_strategy=None, ttl: Optional[float] = None,
+                     on_file: Optional[FileCallback] = None, workers: int = UPLOAD_WORKERS) -> IngestResult:
+    # `documents` comes from hash_documents; `indexed` lists the documents already in the store
+    # `vector_store_id`, which is created when None. Documents that fail to upload or index are
+    # reported and left out of the result; only a collection with nothing indexed raises.
+    report = on_file or _no_report
+    files = dict(indexed or {})
+    pending = {}
+    for sha, document in documents.items():
+        if sha in files:
+            report(FileProgress(document.name, EXISTING, files[sha]))
+        else:
+            pending[sha] = document
+
+    ledger = get_resource_ledger()
+    uploaded = {}
+    if pending:
+        with ThreadPoolExecutor(max_workers=min(workers, len(pending)), thread_name_prefix="ingest") as executor:
+            # Each upload gets its own copy of the context, so its span keeps the capability label
+            futures = {executor.submit(contextvars.copy_context().run, _upload, project_client, document): sha
+                       for sha, document in pending.items()}
+            for future in as_completed(futures):
+                sha = futures[future]
+                document = pending[sha]
+                try:
+                    file = future.result()
+                except Exception as e:
+                    print(f"Error uploading {document.name}: {e}")
+                    report(FileProgress(document.name, FAILED, error=str(e)))
+                    continue
+                ledger.record(conn_str, FILE, file.id, ttl=ttl)
+                uploaded[sha] = file.id
+                report(FileProgress(document.name, UPLOADED, file.id))
+        print(f"Uploaded {len(uploaded)} of {len(pending)} files")
+
+    if not files and not uploaded:
+        raise RuntimeError("None of the documents could be uploaded")
+
+    if vector_store_id is None:
+        with span("create_vector_store"):
+            vector_store_id = project_client.agents.create_vector_store_and_poll(file_ids=[], name=name).id
+        ledger.record(conn_str, VECTOR_STORE, vector_store_id, ttl=ttl)
+        print(f"Created vector store, vector store ID: {vector_store_id}")
+
+    names = {file_id: pending[sha].name for sha, file_id in uploaded.items()}
+    shas = {file_id: sha for sha, file_id in uploaded.items()}
+    batch_ids = list(uploaded.values())
+    for start in range(0, len(batch_ids), FILE_BATCH_SIZE):
+        file_ids = batch_ids[start:start + FILE_BATCH_SIZE]
+        try:
+            with span("create_vector_store"):
+                batch = project_client.agents.create_vector_store_file_batch_and_poll(
+                    vector_store_id=vector_store_id, file_ids=file_ids, chunking_strategy=chunking_strategy)
+            failed = {}
+            if batch.file_counts.failed:
+                listed = project_client.agents.list_vector_store_file_batch_files(
+                    vector_store_id=vector_store_id, batch_id=batch.id, filter="failed")
+                failed = {f.id: str(getattr(f, "last_error", None) or "indexing failed") for f in listed.data}
+        except Exception as e:
+            print(f"Error indexing a batch of {len(file_ids)} files: {e}")
+            failed = {file_id: str(e) for file_id in file_ids}
+        for file_id in file_ids:
+            if file_id in failed:
+                report(FileProgress(names[file_id], FAILED, file_id, failed[file_id]))
+            else:
+                files[shas[file_id]] = file_id
+                report(FileProgress(names[file_id], INDEXED, file_id))
+        print(f"Indexed file batch, {len(file_ids) - len(failed)} of {len(file_ids)} files")
+
+    if not files:
+        raise RuntimeError("None of the documents could be indexed")
+    return IngestResult(vector_store_id, files)
@@ -0,0 +1,389 @@
+import atexit
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, NamedTuple, Optional
+
+from agent_service.memory_budget import SpooledDocument
+from agent_service.outputs import FileOutput
+from agent_service.pipeline import AgentPipeline, AgentResponse
+from agent_service.resource_ledger import current_session, session_scope
+from agent_service.response_cache import RESPONSE_CACHE_ENABLED, get_response_cache
+from agent_service.uploads import CHUNK_SIZE, file_size, iter_chunks
+from agent_service.usage import BudgetExceededError
+
+# Durable background jobs for agent runs. Jobs live in a SQLite database, so they survive
+# Streamlit reruns, closed tabs and process restarts; a pool of worker threads claims them one
+# at a time with a lease it keeps renewing while the run is in progress. A job whose worker
+# died is claimed again once its lease expires, and failed attempts are retried up to a limit.
+# Results, including generated images, are stored with the job until it is purged. Jobs that
+# would exceed the token budget wait in the queue until it allows them, without using an attempt.
+
+JOB_DB_PATH = os.getenv("AZURE_FOUNDRY_JOB_DB", ".agent_jobs.db")
+JOB_WORKERS = int(os.getenv("AZURE_FOUNDRY_JOB_WORKERS", "2"))
+# Seconds a claimed job stays with its worker without a heartbeat; longer than a run may take
+JOB_LEASE = float(os.getenv("AZURE_FOUNDRY_JOB_LEASE", "600"))
+JOB_MAX_ATTEMPTS = int(os.getenv("AZURE_FOUNDRY_JOB_MAX_ATTEMPTS", "3"))
+# Seconds finished jobs and their results are kept
+JOB_RETENTION = float(os.getenv("AZURE_FOUNDRY_JOB_RETENTION", "86400"))
+
+# Seconds an idle worker waits before checking for jobs submitted by other processes
+POLL_INTERVAL = 1.0
+
+PENDING_STATUSES = ("queued", "running")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    capability TEXT NOT NULL,
+    model TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    document_name TEXT,
+    document BLOB,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    worker TEXT,
+    lease_expires REAL,
+    text TEXT,
+    code TEXT,
+    run_status TEXT,
+    thread_id TEXT,
+    run_id TEXT,
+    error TEXT,
+    session TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS job_outputs (
+    job_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (job_id, position)
+);
+"""
+
+JOB_COLUMNS = ("id", "capability", "model", "prompt", "document_name", "status", "attempts", "max_attempts",
+               "worker", "error", "thread_id", "run_id", "created_at", "updated_at", "session")
+
+
+class Job(NamedTuple):
+    id: str
+    capability: str
+    model: str
+    prompt: str
+    document_name: Optional[str]
+    # "queued", "running", "completed" or "failed"
+    status: str
+    attempts: int
+    max_attempts: int
+    worker: Optional[str]
+    error: Optional[str]
+    thread_id: Optional[str]
+    run_id: Optional[str]
+    created_at: float
+    updated_at: float
+    # The browser session that submitted the job; its run counts against the session's token budget
+    session: Optional[str]
+
+
+class JobQueue:
+    def __init__(self, path: str = JOB_DB_PATH, lease: float = JOB_LEASE):
+        self.path = path
+        self.lease = lease
+        # Wakes this process's workers as soon as a job is submitted
+        self.submitted = threading.Event()
+        with self._db() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(SCHEMA)
+
+    @contextmanager
+    def _db(self):
+        # One short-lived connection per operation, so any thread (or process) can use the queue
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def submit(self, capability: str, model: str, prompt: str, document=None,
+               max_attempts: int = JOB_MAX_ATTEMPTS, session: Optional[str] = None) -> str:
+        # `document` is a binary file object with a name, such as Streamlit's UploadedFile. The job
+        # runs in the given session, by default the one of the calling context
+        session = session or current_session()
+        if isinstance(document, (list, tuple)):
+            raise ValueError("Background jobs search a single document")
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._db() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                rowid = db.execute(
+                    "INSERT INTO jobs (id, capability, model, prompt, document_name, status, max_attempts, "
+                    "session, created_at, updated_at) VALUES (?, ?, ?, ?, ?, 'queued', ?, ?, ?, ?)",
+                    (job_id, capability, model, prompt, document.name if document is not None else None,
+                     max_attempts, session, now, now)).lastrowid
+                if document is not None:
+                    # Written into the row chunk by chunk, without a copy of the whole document
+                    db.execute("UPDATE jobs SET document = zeroblob(?) WHERE rowid = ?", (file_size(document), rowid))
+                    with db.blobopen("jobs", "document", rowid) as blob:
+                        for chunk in iter_chunks(document):
+                            blob.write(chunk)
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        self.submitted.set()
+        print(f"Submitted job, job ID: {job_id}")
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._db() as db:
+            row = db.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return Job(*row) if row else None
+
+    def list(self, status: Optional[str] = None, limit: int = 100) -> List[Job]:
+        query = f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs"
+        params = ()
+        if status:
+            query += " WHERE status = ?"
+            params = (status,)
+        with self._db() as db:
+            rows = db.execute(query + " ORDER BY created_at DESC LIMIT ?", params + (limit,)).fetchall()
+        return [Job(*row) for row in rows]
+
+    def claim(self, worker: str) -> Optional[Job]:
+        # The oldest queued job, or a running one whose worker stopped renewing its lease
+        now = time.time()
+        with self._db() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute("UPDATE jobs SET status = 'failed', error = 'Worker stopped during the last attempt', "
+                           "worker = NULL, document = NULL, updated_at = ? "
+                           "WHERE status = 'running' AND lease_expires < ? AND attempts >= max_attempts", (now, now))
+                # A queued job's lease_expires, when set, is the time it was deferred to
+                row = db.execute("SELECT id FROM jobs WHERE (status = 'queued' AND "
+                                 "(lease_expires IS NULL OR lease_expires < ?)) OR "
+                                 "(status = 'running' AND lease_expires < ?) ORDER BY created_at LIMIT 1",
+                                 (now, now)).fetchone()
+                if row:
+                    db.execute("UPDATE jobs SET status = 'running', worker = ?, lease_expires = ?, "
+                               "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                               (worker, now + self.lease, now, row[0]))
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return self.get(row[0]) if row else None
+
+    def document(self, job_id: str):
+        # Read chunk by chunk into a copy that is spooled to disk when it is large
+        with self._db() as db:
+            row = db.execute("SELECT rowid, document_name, document IS NOT NULL FROM jobs WHERE id = ?",
+                             (job_id,)).fetchone()
+            if not row or not row[2]:
+                return None
+            document = SpooledDocument(row[1])
+            with db.blobopen("jobs", "document", row[0], readonly=True) as blob:
+                while True:
+                    chunk = blob.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    document.write(chunk)
+        document.seek(0)
+        return document
+
+    def heartbeat(self, job_ids: List[str], worker: str):
+        now = time.time()
+        with self._db() as db:
+            db.executemany("UPDATE jobs SET lease_expires = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                           [(now + self.lease, job_id, worker) for job_id in job_ids])
+
+    def complete(self, job_id: str, worker: str, response: AgentResponse):
+        now = time.time()
+        with self._db() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                # A worker that lost its lease leaves the job to whoever claimed it since
+                updated = db.execute(
+                    "UPDATE jobs SET status = 'completed', text = ?, code = ?, run_status = ?, thread_id = ?, "
+                    "run_id = ?, error = NULL, worker = NULL, document = NULL, updated_at = ? "
+                    "WHERE id = ? AND worker = ?",
+                    (response.text, response.code, response.status, response.thread_id,
+                     response.run.id if response.run is not None else None, now, job_id, worker)).rowcount
+                if updated:
+                    db.executemany("INSERT OR REPLACE INTO job_outputs (job_id, position, data) VALUES (?, ?, ?)",
+                                   [(job_id, i, output.data) for i, output in enumerate(response.images)])
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    def fail(self, job_id: str, worker: str, error: str):
+        # Back in the queue while attempts remain
+        now = time.time()
+        with self._db() as db:
+            db.execute("UPDATE jobs SET status = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END, "
+                       "document = CASE WHEN attempts < max_attempts THEN document END, "
+                       "error = ?, worker = NULL, lease_expires = NULL, updated_at = ? WHERE id = ? AND worker = ?",
+                       (error, now, job_id, worker))
+        self.submitted.set()
+
+    def defer(self, job_id: str, worker: str, delay: float, reason: str):
+        # Back in the queue for `delay` seconds, without counting the attempt
+        now = time.time()
+        with self._db() as db:
+            db.execute("UPDATE jobs SET status = 'queued', attempts = attempts - 1, error = ?, worker = NULL, "
+                       "lease_expires = ?, updated_at = ? WHERE id = ? AND worker = ?",
+                       (reason, now + delay, now, job_id, worker))
+
+    def result(self, job_id: str) -> Optional[AgentResponse]:
+        # The stored response of a completed job
+        with self._db() as db:
+            row = db.execute("SELECT text, code, run_status, thread_id, run_id FROM jobs "
+                             "WHERE id = ? AND status = 'completed'", (job_id,)).fetchone()
+            if not row:
+                return None
+            images = db.execute("SELECT data FROM job_outputs WHERE job_id = ? ORDER BY position",
+                                (job_id,)).fetchall()
+        text, code, run_status, thread_id, run_id = row
+        return AgentResponse(text, code or "", tuple(FileOutput(data, run_id=run_id) for data, in images),
+                             run_status, thread_id)
+
+    def purge(self, older_than: float = JOB_RETENTION) -> int:
+        cutoff = time.time() - older_than
+        with self._db() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute("DELETE FROM job_outputs WHERE job_id IN (SELECT id FROM jobs WHERE "
+                           "status IN ('completed', 'failed') AND updated_at < ?)", (cutoff,))
+                purged = db.execute("DELETE FROM jobs WHERE status IN ('completed', 'failed') AND updated_at < ?",
+                                    (cutoff,)).rowcount
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return purged
+
+    def stats(self) -> Dict[str, int]:
+        with self._db() as db:
+            return dict(db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+
+class JobWorkerPool:
+    def __init__(self, job_queue: JobQueue, pipeline: AgentPipeline, workers: int = JOB_WORKERS):
+        self.queue = job_queue
+        self.pipeline = pipeline
+        self.workers = workers
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._running: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        # Finished jobs past their retention are dropped on start and then hourly by the heartbeat
+        purged = self.queue.purge()
+        if purged:
+            print(f"Purged {purged} finished jobs")
+        self._threads = [threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+                         for i in range(self.workers)]
+        self._threads.append(threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True))
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def _work(self):
+        while not self._stop.is_set():
+            job = self.queue.claim(self.worker_id)
+            if job is None:
+                self.queue.submitted.wait(POLL_INTERVAL)
+                self.queue.submitted.clear()
+                continue
+            with self._lock:
+                self._running[job.id] = time.time()
+            print(f"Running job {job.id} (attempt {job.attempts} of {job.max_attempts})")
+            try:
+                # Tags the run's resources and token usage with the submitting session, and applies its budget
+                with session_scope(job.session):
+                    response = self.pipeline.run(job.capability, job.model, job.prompt,
+                                                 document=self.queue.document(job.id))
+                if response.status in ("completed", "cached"):
+                    self.queue.complete(job.id, self.worker_id, response)
+                else:
+                    self.queue.fail(job.id, self.worker_id, response.text)
+            except BudgetExceededError as e:
+                print(f"Deferring job {job.id}: {e}")
+                self.queue.defer(job.id, self.worker_id, e.retry_after, str(e))
+            except Exception as e:
+                print(f"Error running job {job.id}: {e}")
+                self.queue.fail(job.id, self.worker_id, f"{type(e).__name__}: {e}")
+            finally:
+                with self._lock:
+                    self._running.pop(job.id, None)
+
+    def _heartbeat(self):
+        last_purge = time.monotonic()
+        while not self._stop.wait(self.queue.lease / 3):
+            with self._lock:
+                job_ids = list(self._running)
+            try:
+                if job_ids:
+                    self.queue.heartbeat(job_ids, self.worker_id)
+                if time.monotonic() - last_purge > 3600:
+                    self.queue.purge()
+                    last_purge = time.monotonic()
+            except sqlite3.Error as e:
+                print(f"Error renewing job leases: {e}")
+
+    def stop(self, timeout: Optional[float] = None):
+        # Jobs still running keep their lease and are picked up again after it expires
+        self._stop.set()
+        self.queue.submitted.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            running = len(self._running)
+        return {"workers": self.workers, "running": running, **self.queue.stats()}
+
+
+_queue: Optional[JobQueue] = None
+_pool: Optional[JobWorkerPool] = None
+_jobs_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    global _queue
+    with _jobs_lock:
+        if _queue is None:
+            _queue = JobQueue()
+        return _queue
+
+
+def start_job_workers(conn_str: Optional[str], workers: int = JOB_WORKERS) -> Optional[JobWorkerPool]:
+    # One pool per process, started on first use; None when workers are disabled
+    global _pool
+    if workers <= 0:
+        return None
+    job_queue = get_job_queue()
+    with _jobs_lock:
+        if _pool is None:
+            pipeline = AgentPipeline(conn_str, response_cache=get_response_cache() if RESPONSE_CACHE_ENABLED else None)
+            _pool = JobWorkerPool(job_queue, pipeline, workers).start()
+        return _pool
+
+
+@atexit.register
+def stop_job_workers():
+    global _pool
+    with _jobs_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.stop(timeout=1)
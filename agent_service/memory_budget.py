@@ -0,0 +1,172 @@
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from agent_service.uploads import iter_chunks
+
+# Memory budgets for long-running app and API processes. Documents the service copies (API
+# uploads, background job documents, prefetch copies) are spooled to an anonymous temporary file
+# once they are larger than AZURE_FOUNDRY_SPOOL_THRESHOLD_MB, instead of being held in memory.
+# The artifacts of each browser session's last reply (images, code, job results) are kept in one
+# store instead of in st.session_state. The store has a byte budget per session and one for the
+# whole process, evicts the least recently used artifacts when a budget is exceeded, and drops
+# the artifacts of sessions idle for AZURE_FOUNDRY_ARTIFACT_TTL seconds.
+
+SPOOL_THRESHOLD = int(float(os.getenv("AZURE_FOUNDRY_SPOOL_THRESHOLD_MB", "4")) * 2**20)
+SESSION_MEMORY_BYTES = int(float(os.getenv("AZURE_FOUNDRY_SESSION_MEMORY_MB", "32")) * 2**20)
+GLOBAL_MEMORY_BYTES = int(float(os.getenv("AZURE_FOUNDRY_MEMORY_MB", "512")) * 2**20)
+ARTIFACT_TTL = float(os.getenv("AZURE_FOUNDRY_ARTIFACT_TTL", "1800"))
+
+
+class SpooledDocument(tempfile.SpooledTemporaryFile):
+    # A named binary file object, in memory up to max_size bytes and in a temporary file beyond
+    def __init__(self, name: str, max_size: int = SPOOL_THRESHOLD):
+        super().__init__(max_size=max_size)
+        self._name = name
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def spooled(self) -> bool:
+        return self._rolled
+
+
+def spool(document, name: Optional[str] = None, threshold: int = SPOOL_THRESHOLD) -> SpooledDocument:
+    # Copies a binary file object chunk by chunk, so a large document is never held in memory whole
+    copy = SpooledDocument(name or document.name, threshold)
+    for chunk in iter_chunks(document):
+        copy.write(chunk)
+    copy.seek(0)
+    return copy
+
+
+def artifact_size(value) -> int:
+    # Bytes held by an artifact: text, bytes, FileOutputs and tuples or lists of them
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    if isinstance(value, (tuple, list)):
+        return sum(artifact_size(item) for item in value)
+    data = getattr(value, "data", None)
+    return len(data) if data is not None else 0
+
+
+def rss_bytes() -> int:
+    # Resident set size of this process; 0 where /proc is not available
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+class ArtifactStore:
+    def __init__(self, session_budget: int = SESSION_MEMORY_BYTES, global_budget: int = GLOBAL_MEMORY_BYTES,
+                 ttl: float = ARTIFACT_TTL):
+        self.session_budget = session_budget
+        self.global_budget = global_budget
+        self.ttl = ttl
+        # (session, name) -> (value, size), least recently used first
+        self._artifacts: "OrderedDict[Tuple[str, str], Tuple[object, int]]" = OrderedDict()
+        self._session_bytes: Dict[str, int] = {}
+        self._last_used: Dict[str, float] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expired = 0
+        self.rejected = 0
+
+    def put(self, session: str, name: str, value) -> bool:
+        # Replaces the session's artifact; one larger than the session budget is not kept
+        size = artifact_size(value)
+        with self._lock:
+            self._drop((session, name))
+            self._last_used[session] = time.monotonic()
+            if size > self.session_budget:
+                self.rejected += 1
+                return False
+            self._artifacts[(session, name)] = (value, size)
+            self._session_bytes[session] = self._session_bytes.get(session, 0) + size
+            self._bytes += size
+            self._evict(session)
+        self.expire_idle()
+        return True
+
+    def get(self, session: str, name: str, default=None):
+        with self._lock:
+            entry = self._artifacts.get((session, name))
+            if entry is None:
+                return default
+            self._artifacts.move_to_end((session, name))
+            self._last_used[session] = time.monotonic()
+            return entry[0]
+
+    def drop(self, session: str, name: Optional[str] = None):
+        # One artifact of the session, or all of them
+        with self._lock:
+            keys = [(session, name)] if name is not None else [key for key in self._artifacts if key[0] == session]
+            for key in keys:
+                self._drop(key)
+
+    def expire_idle(self) -> int:
+        # Drops the artifacts of sessions that haven't used them for `ttl` seconds, such as closed tabs
+        cutoff = time.monotonic() - self.ttl
+        with self._lock:
+            idle = {session for session, used in self._last_used.items() if used < cutoff}
+            if not idle:
+                return 0
+            keys = [key for key in self._artifacts if key[0] in idle]
+            for key in keys:
+                self._drop(key)
+            for session in idle:
+                del self._last_used[session]
+            self.expired += len(keys)
+        return len(keys)
+
+    def _evict(self, session):
+        # The session's least recently used artifacts over its budget, then any session's over the
+        # process budget; the artifact just put is the most recently used, so it goes last
+        for key in [key for key in self._artifacts if key[0] == session]:
+            if self._session_bytes.get(session, 0) <= self.session_budget:
+                break
+            self._drop(key)
+            self.evictions += 1
+        while self._bytes > self.global_budget and len(self._artifacts) > 1:
+            self._drop(next(iter(self._artifacts)))
+            self.evictions += 1
+
+    def _drop(self, key):
+        entry = self._artifacts.pop(key, None)
+        if entry is None:
+            return
+        session = key[0]
+        self._bytes -= entry[1]
+        remaining = self._session_bytes.pop(session, 0) - entry[1]
+        if remaining > 0:
+            self._session_bytes[session] = remaining
+
+    def stats(self):
+        with self._lock:
+            return {"sessions": len(self._session_bytes), "artifacts": len(self._artifacts), "bytes": self._bytes,
+                    "evictions": self.evictions, "expired": self.expired, "rejected": self.rejected,
+                    "rss_bytes": rss_bytes()}
+
+
+_store: Optional[ArtifactStore] = None
+_store_lock = threading.Lock()
+
+
+def get_artifact_store() -> ArtifactStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ArtifactStore()
+        return _store
@@ -0,0 +1,36 @@
+from typing import Iterator, Optional
+
+from agent_service.telemetry import span
+
+# Message retrieval that only asks the service for what it needs: replies are looked up
+# newest first with a small page (filtered to the run when it is known), and longer reads
+# page lazily through the thread with the `after` cursor instead of pulling all of it.
+
+PAGE_SIZE = 20
+
+
+def message_role(message) -> str:
+    # MessageRole is a str enum on the SDK models and a plain str on the fake client
+    return str(getattr(message.role, "value", message.role))
+
+
+def iter_messages(project_client, thread_id, order: str = "desc", after: Optional[str] = None,
+                  run_id: Optional[str] = None, page_size: int = PAGE_SIZE) -> Iterator:
+    # Yields messages one page at a time; stop iterating and no further pages are requested
+    while True:
+        with span("list_messages"):
+            page = project_client.agents.list_messages(thread_id=thread_id, order=order, after=after,
+                                                       run_id=run_id, limit=page_size)
+        yield from page.data
+        if not page.has_more or not page.data:
+            return
+        after = page.last_id
+
+
+def latest_reply(project_client, thread_id, run_id: Optional[str] = None):
+    # The newest assistant message, from the given run if any; usually a single one-message page
+    messages = iter_messages(project_client, thread_id, order="desc", run_id=run_id, page_size=1)
+    for message in messages:
+        if message_role(message) == "assistant":
+            return message
+    return None
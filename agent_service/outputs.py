@@ -0,0 +1,89 @@
+import contextvars
+import hashlib
+import io
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterable, List, Optional
+
+from agent_service.telemetry import span
+
+# In-memory handling of files the agent generates (code interpreter charts). All outputs of a
+# reply are downloaded concurrently into byte buffers owned by the session and run that asked
+# for them, displayed straight from memory, and thumbnailed only when a thumbnail is shown.
+# Setting AZURE_FOUNDRY_OUTPUT_STORE also keeps a copy in a content-addressed directory.
+
+DOWNLOAD_WORKERS = int(os.getenv("AZURE_FOUNDRY_DOWNLOAD_WORKERS", "8"))
+OUTPUT_STORE = os.getenv("AZURE_FOUNDRY_OUTPUT_STORE")
+THUMBNAIL_SIZE = (320, 320)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _downloads() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS, thread_name_prefix="output-download")
+        return _executor
+
+
+class FileOutput:
+    def __init__(self, data: bytes, file_id: Optional[str] = None, run_id: Optional[str] = None):
+        self.data = data
+        self.file_id = file_id
+        self.run_id = run_id
+        self._thumbnail: Optional[bytes] = None
+
+    @property
+    def sha256(self) -> str:
+        return hashlib.sha256(self.data).hexdigest()
+
+    def thumbnail(self) -> bytes:
+        # PNG bytes, built on first use
+        if self._thumbnail is None:
+            from PIL import Image
+
+            with Image.open(io.BytesIO(self.data)) as image:
+                image.thumbnail(THUMBNAIL_SIZE)
+                buffer = io.BytesIO()
+                image.save(buffer, format="PNG")
+            self._thumbnail = buffer.getvalue()
+        return self._thumbnail
+
+
+def download_output(project_client, file_id: str, run_id: Optional[str] = None) -> FileOutput:
+    with span("file_download"):
+        output = FileOutput(b"".join(project_client.agents.get_file_content(file_id)), file_id, run_id)
+    print(f"Downloaded generated file, file ID: {file_id}")
+    if OUTPUT_STORE:
+        try:
+            persist(output, OUTPUT_STORE)
+        except OSError as e:
+            print(f"Error storing generated file {file_id}: {e}")
+    return output
+
+
+def start_download(project_client, file_id: str, run_id: Optional[str] = None) -> Future:
+    # The download's timing span keeps the capability of the run that asked for it
+    return _downloads().submit(contextvars.copy_context().run, download_output, project_client, file_id, run_id)
+
+
+def download_outputs(project_client, file_ids: Iterable[str], run_id: Optional[str] = None) -> List[FileOutput]:
+    # Concurrent downloads; results keep the order of file_ids
+    futures = [start_download(project_client, file_id, run_id) for file_id in file_ids]
+    return [future.result() for future in futures]
+
+
+def persist(output: FileOutput, store: str) -> str:
+    # Content-addressed: identical charts share one file and names never collide across sessions
+    digest = output.sha256
+    path = os.path.join(store, digest[:2], f"{digest}.png")
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(output.data)
+        os.replace(temp_path, path)
+    return path
@@ -0,0 +1,330 @@
+from concurrent.futures import wait
+from contextlib import ExitStack, contextmanager
+from typing import Any, Callable, NamedTuple, Optional, Tuple
+
+from agent_service.agent_pool import get_agent_pool
+from agent_service.async_engine import AgentRequest, get_async_engine
+from agent_service.capabilities import CODE_INTERPRETER, RAG_CODE_INTERPRETER, build_request
+from agent_service.client_factory import get_project_client
+from agent_service.conversations import Conversation
+from agent_service.debug_log import debug_log
+from agent_service.ingestion import FileProgress, document_name
+from agent_service.messages import latest_reply
+from agent_service.outputs import FileOutput, start_download
+from agent_service.prefetch import Prefetcher, get_prefetcher
+from agent_service.resource_ledger import THREAD, THREAD_TTL, current_session, get_resource_ledger, is_not_found
+from agent_service.response_cache import CachedResponse, ResponseCache, response_key
+from agent_service.run_engine import StreamEvent, code_inputs, run_status, stream_run
+from agent_service.telemetry import capability_scope, span
+from agent_service.usage import RunUsage, UsageTracker, get_usage_tracker, run_usage
+from agent_service.vector_store_cache import get_vector_store_cache
+
+# The agent pipeline behind every capability, independent of any UI: acquire the client,
+# acquire a pooled agent, acquire a thread (reusing the conversation's, a prefetched spare and
+# the cached vector store of the document), run, collect the reply, code and images, and release
+# the leases. Progress is reported through callbacks on the calling thread, so the Streamlit
+# page, the batch runner or a worker can drive it the same way.
+
+# Capabilities whose replies can carry generated code and images
+CODE_CAPABILITIES = (CODE_INTERPRETER, RAG_CODE_INTERPRETER)
+
+# How often the caller's thread checks on a run executing on the async engine, in seconds
+PROGRESS_INTERVAL = 0.2
+
+ProgressCallback = Callable[[float, str], None]
+EventCallback = Callable[[StreamEvent], None]
+FileCallback = Callable[[FileProgress], None]
+
+
+class AgentResponse(NamedTuple):
+    text: str
+    code: str = ""
+    images: Tuple[FileOutput, ...] = ()
+    # "completed", "failed" (or another final run status), or "cached" for a response cache hit
+    status: str = "completed"
+    thread_id: Optional[str] = None
+    run: Any = None
+    # Tokens the run used, when the service reported them
+    usage: Optional[RunUsage] = None
+
+
+def _no_progress(fraction, message):
+    pass
+
+
+class AgentPipeline:
+    def __init__(self, conn_str: Optional[str], project_client=None, engine=None,
+                 response_cache: Optional[ResponseCache] = None, prefetcher: Optional[Prefetcher] = None,
+                 usage_tracker: Optional[UsageTracker] = None):
+        self.conn_str = conn_str
+        self._project_client = project_client
+        self._engine = engine
+        self._prefetcher = prefetcher
+        self._usage_tracker = usage_tracker
+        # Single-turn responses are cached only when a cache is given
+        self.response_cache = response_cache
+
+    def acquire_client(self):
+        if self._project_client is None:
+            with span("client_init"):
+                self._project_client = get_project_client(self.conn_str)
+        return self._project_client
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            self._engine = get_async_engine(self.conn_str)
+        return self._engine
+
+    @property
+    def usage_tracker(self) -> UsageTracker:
+        if self._usage_tracker is None:
+            self._usage_tracker = get_usage_tracker()
+        return self._usage_tracker
+
+    @property
+    def prefetcher(self) -> Prefetcher:
+        if self._prefetcher is None:
+            self._prefetcher = get_prefetcher(self.conn_str)
+        return self._prefetcher
+
+    def prefetch(self, capability: str, model: str, document=None):
+        # Starts setting up the agent, the document's vector store and spare threads in the
+        # background, before the run is requested; returns at once
+        self.prefetcher.prefetch(capability, model, document=document)
+
+    def acquire_agent(self, request: AgentRequest):
+        # Context manager leasing a pooled agent, created on first use and shared across sessions
+        return get_agent_pool(self.conn_str).lease(
+            self.acquire_client(),
+            model=request.model,
+            name=request.name,
+            instructions=request.instructions,
+            toolset=request.toolset,
+            tools=request.tools,
+            tool_resources=request.tool_resources
+        )
+
+    @contextmanager
+    def acquire_thread(self, request: AgentRequest):
+        # Yields the thread to run on with the prompt added; the document's vector store stays
+        # leased until the run is over. A conversation whose thread was deleted meanwhile (say by
+        # the sweeper, after a long pause) goes on in a new thread
+        from azure.ai.projects.models import FileSearchTool
+
+        project_client = self.acquire_client()
+        with ExitStack() as leases:
+            thread_id = request.thread_id
+            if thread_id is not None and not self._continue_thread(project_client, thread_id, request.prompt):
+                thread_id = None
+            if thread_id is None:
+                vector_store_id = None
+                if request.document is not None:
+                    vector_store_id = leases.enter_context(get_vector_store_cache(self.conn_str).lease_document(
+                        project_client, request.document, on_file=request.on_file))
+                    print(f"Using vector store, vector store ID: {vector_store_id}")
+                thread_id = self.prefetcher.reserve.take(project_client, vector_store_id)
+                if thread_id is not None:
+                    print(f"Using spare thread, thread ID: {thread_id}")
+                else:
+                    tool_resources = FileSearchTool(vector_store_ids=[vector_store_id]).resources if vector_store_id else None
+                    with span("create_thread"):
+                        thread_id = project_client.agents.create_thread(tool_resources=tool_resources).id
+                    get_resource_ledger().record(self.conn_str, THREAD, thread_id, ttl=THREAD_TTL)
+                    print(f"Created thread, thread ID: {thread_id}")
+                self._add_message(project_client, thread_id, request.prompt)
+            yield thread_id
+
+    def _continue_thread(self, project_client, thread_id, prompt) -> bool:
+        # Adds the prompt to a conversation's thread; False when the thread no longer exists
+        try:
+            self._add_message(project_client, thread_id, prompt)
+            return True
+        except Exception as e:
+            if not is_not_found(e):
+                raise
+        print(f"Conversation thread {thread_id} no longer exists, starting a new one")
+        get_resource_ledger().release(THREAD, thread_id)
+        return False
+
+    def _add_message(self, project_client, thread_id, prompt):
+        with span("create_message"):
+            message = project_client.agents.create_message(thread_id=thread_id, role="user", content=prompt)
+        print(f"Created message, message ID: {message.id}")
+
+    def run(self, capability: str, model: str, prompt: str, document=None,
+            conversation: Optional[Conversation] = None, stream: bool = False, refresh_cache: bool = False,
+            on_progress: Optional[ProgressCallback] = None, on_event: Optional[EventCallback] = None,
+            on_file: Optional[FileCallback] = None) -> AgentResponse:
+        # on_progress(fraction, message) follows the pipeline's steps; with stream=True, on_event
+        # receives the reply's text deltas and code snippets as they arrive. `document` may be a
+        # list of documents searched together, and on_file(FileProgress) follows each one as it
+        # is ingested. refresh_cache skips the cached response but stores the new one. Raises
+        # BudgetExceededError, before anything is run, once the token budget is used up.
+        progress = on_progress or _no_progress
+        with capability_scope(capability), span("total"):
+            progress(0.1, "Initializing...")
+            self.acquire_client()
+            progress(0.2, "Connected to AI Project service")
+
+            with span("tool_setup"):
+                request = build_request(capability, model, prompt, document=document)
+            progress(0.3, "Agent tools ready")
+
+            cache_key = self._cache_key(capability, request, conversation)
+            if cache_key is not None and not refresh_cache:
+                cached = self.response_cache.get(cache_key)
+                if cached is not None:
+                    print("Answered from the response cache")
+                    progress(1.0, "Complete!")
+                    return AgentResponse(cached.text, cached.code, tuple(FileOutput(image) for image in cached.images),
+                                         status="cached")
+
+            # Cached responses cost no tokens, so only runs are held to the budget
+            session = current_session()
+            reservation = self.usage_tracker.reserve(session)
+            try:
+                documents = document_name(document)
+                request = request._replace(thread_id=self._conversation_thread(conversation, documents),
+                                           on_file=on_file)
+                if stream:
+                    response = self._run_streaming(capability, request, progress, on_event)
+                else:
+                    response = self._run_on_engine(capability, request, progress)
+                self.usage_tracker.record(capability, request.model, session,
+                                          response.run.id if response.run is not None else None, response.usage,
+                                          reservation)
+            finally:
+                # A run that raised reported no usage
+                self.usage_tracker.release(reservation)
+
+            if response.status == "completed":
+                if conversation is not None:
+                    conversation.record(response.thread_id, documents, prompt, response.text)
+                if cache_key is not None:
+                    self.response_cache.put(cache_key, CachedResponse(
+                        response.text, response.code, tuple(output.data for output in response.images)))
+            progress(1.0, "Complete!")
+            return response
+
+    def _cache_key(self, capability, request, conversation):
+        # Follow-up questions depend on the thread's history, so only single-turn runs are cached
+        if self.response_cache is None or conversation is not None:
+            return None
+        return response_key(capability, request.model, request.instructions, request.prompt, request.document,
+                            self.conn_str)
+
+    def _conversation_thread(self, conversation, document_name):
+        if conversation is None:
+            return None
+        thread_id = conversation.thread_for(document_name)
+        if conversation.thread_id and thread_id is None:
+            # The old thread searches a different document, so start over
+            conversation.reset(self.acquire_client())
+        return thread_id
+
+    def _run_on_engine(self, capability, request, progress):
+        # The engine sets up the agent and thread concurrently on its event loop; this thread only
+        # waits on the future and relays the latest stage, mapped onto 30%-70%, and the documents'
+        # progress. Its threads come from the prefetched spares too
+        stages, files = [], []
+        request = request._replace(thread_reserve=self.prefetcher.reserve)
+        on_file = request.on_file
+        if on_file is not None:
+            request = request._replace(on_file=files.append)
+        future = self.engine.submit(request, on_progress=lambda fraction, message: stages.append((fraction, message)))
+        relayed = 0
+        while not future.done() or relayed < len(files):
+            wait([future], timeout=PROGRESS_INTERVAL)
+            if stages:
+                fraction, message = stages[-1]
+                progress(0.3 + 0.4 * fraction, message)
+            for file_progress in files[relayed:]:
+                relayed += 1
+                on_file(file_progress)
+        outcome = future.result()
+        if run_status(outcome.run) != "completed":
+            return self._failed(outcome.thread_id, outcome.run)
+        progress(0.8, "Getting response from agent...")
+        return self.collect_outputs(capability, outcome.thread_id, outcome.run)
+
+    def _run_streaming(self, capability, request, progress, on_event):
+        project_client = self.acquire_client()
+        with self.acquire_agent(request) as agent_id:
+            print(f"Using agent, agent ID: {agent_id}")
+            progress(0.4, "Acquired AI agent")
+            with self.acquire_thread(request) as thread_id:
+                progress(0.6, "Sent message to agent")
+                # The reply's text deltas, joined once at the end
+                text_parts, code, downloads, steps, run = [], "", [], [], None
+                with span("run"):
+                    for event in stream_run(project_client, thread_id, agent_id):
+                        if event.kind == "message":
+                            # Like collect_outputs, the reply is the run's last message; code
+                            # interpreter runs may post others before it
+                            text_parts, downloads = [], []
+                            continue
+                        elif event.kind == "text":
+                            text_parts.append(event.value)
+                        elif event.kind == "code":
+                            print("Extracted Python code snippet")
+                            code = event.value
+                        elif event.kind == "step":
+                            steps.append(event.value)
+                            continue
+                        elif event.kind == "image":
+                            # Downloads overlap with the rest of the stream
+                            downloads.append(start_download(project_client, event.value))
+                            continue
+                        else:
+                            run = event.value
+                            continue
+                        if on_event is not None:
+                            on_event(event)
+        if run_status(run) != "completed":
+            return self._failed(thread_id, run)
+        progress(0.8, "Getting response from agent...")
+        images = tuple(download.result() for download in downloads)
+        for output in images:
+            output.run_id = run.id
+        text = "\n".join(["".join(text_parts).strip()] + ["[Image generated by the agent]"] * len(images)).strip()
+        return AgentResponse(text or "No response from agent.", code, images, run_status(run), thread_id, run,
+                             run_usage(run, steps))
+
+    def _failed(self, thread_id, run):
+        # Failed runs may still have used tokens
+        return AgentResponse(f"Run failed: {run.last_error}", status=run_status(run), thread_id=thread_id, run=run,
+                             usage=run_usage(run))
+
+    def collect_outputs(self, capability, thread_id, run) -> AgentResponse:
+        # The run's reply, without reading the rest of the thread; images download in the
+        # background, straight into memory, while the run steps are read for their usage and code
+        project_client = self.acquire_client()
+        last_msg = latest_reply(project_client, thread_id, run_id=run.id)
+        debug_log("Reply", last_msg)
+
+        downloads = []
+        lines = []
+        if last_msg and last_msg.content:
+            for content_item in last_msg.content:
+                content_type = getattr(content_item, 'type', None)
+                if content_type == 'text':
+                    lines.append(content_item.text.value)
+                elif content_type == 'image_file':
+                    lines.append("[Image generated by the agent]")
+                    downloads.append(start_download(project_client, content_item.image_file.file_id, run.id))
+            text = "\n".join(lines).strip()
+        else:
+            text = "No response from agent."
+
+        code = ""
+        # Run steps carry the per-step token usage of every run, and the code of code capabilities
+        with span("list_run_steps"):
+            steps = project_client.agents.list_run_steps(thread_id=thread_id, run_id=run.id).data
+        if capability in CODE_CAPABILITIES:
+            for step in steps:
+                for code in code_inputs(step):
+                    print("Extracted Python code snippet")
+
+        images = tuple(download.result() for download in downloads)
+        return AgentResponse(text, code, images, run_status(run), thread_id, run, run_usage(run, steps))
@@ -0,0 +1,229 @@
+import atexit
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Deque, Dict, Optional, Tuple
+
+from agent_service.agent_pool import get_agent_pool
+from agent_service.capabilities import DOCUMENT_CAPABILITIES, agent_request
+from agent_service.client_factory import get_project_client
+from agent_service.ingestion import as_documents, document_sha256
+from agent_service.memory_budget import spool
+from agent_service.resource_ledger import THREAD, THREAD_TTL, get_resource_ledger
+from agent_service.telemetry import capability_scope, span
+from agent_service.uploads import file_identity
+from agent_service.vector_store_cache import get_vector_store_cache
+
+# Speculative setup ahead of a run. Choosing a capability warms the client and creates its
+# pooled agent; uploading a document hashes, uploads and indexes it into the vector store
+# cache; and a small reserve of empty threads, per vector store, is created in the background.
+# A run started afterwards finds the agent pooled, the vector store cached and a thread ready,
+# so it only sends its message and runs. Everything happens on a few background threads and
+# failures are only logged: the run does whatever setup is still missing itself.
+
+# Spare threads kept ready for runs without a document; 0 turns the reserve off
+THREAD_RESERVE_SIZE = int(os.getenv("AZURE_FOUNDRY_THREAD_RESERVE", "2"))
+# Seconds a spare thread is handed out after it was created; the sweeper deletes it later
+SPARE_THREAD_TTL = 600
+SPARE_THREAD_GRACE = 300
+PREFETCH_WORKERS = 4
+# Prefetches remembered, so reruns of the page don't start them again, and for how many seconds;
+# after that a prefetch runs again, in case the agent or vector store was evicted meanwhile
+PREFETCH_MEMORY = 256
+PREFETCH_REFRESH = 300
+
+
+def _thread_resources(vector_store_id):
+    from azure.ai.projects.models import FileSearchTool
+
+    return FileSearchTool(vector_store_ids=[vector_store_id]).resources if vector_store_id else None
+
+
+class ThreadReserve:
+    # Empty threads created ahead of runs, by the vector store they search (None for no document)
+    def __init__(self, conn_str: Optional[str], executor: ThreadPoolExecutor, size: int = THREAD_RESERVE_SIZE,
+                 ttl: float = SPARE_THREAD_TTL):
+        self.conn_str = conn_str
+        self.size = size
+        self.ttl = ttl
+        self._executor = executor
+        self._spares: Dict[Optional[str], Deque[Tuple[str, float]]] = {}
+        # Spares wanted per vector store, and spares being created
+        self._targets: Dict[Optional[str], int] = {}
+        self._pending: Dict[Optional[str], int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.created = 0
+
+    def fill(self, project_client, vector_store_id: Optional[str] = None, count: Optional[int] = None):
+        # Keeps `count` spare threads for the vector store from now on; runs taking them trigger refills
+        if self.size <= 0:
+            return
+        with self._lock:
+            self._targets[vector_store_id] = count if count is not None else self.size
+        self._refill(project_client, vector_store_id)
+
+    def take(self, project_client, vector_store_id: Optional[str] = None) -> Optional[str]:
+        # A spare thread for the vector store, or None when none is ready; a taken spare is replaced
+        now = time.time()
+        with self._lock:
+            spares = self._spares.get(vector_store_id)
+            while spares and now - spares[0][1] > self.ttl:
+                # Expired spares are left to the sweeper
+                spares.popleft()
+            if not spares:
+                if vector_store_id in self._targets:
+                    self.misses += 1
+                return None
+            thread_id, _ = spares.pop()
+            self.hits += 1
+        # Kept as long as any other conversation thread from now on
+        get_resource_ledger().touch(THREAD, thread_id, THREAD_TTL)
+        self._refill(project_client, vector_store_id)
+        return thread_id
+
+    def _refill(self, project_client, vector_store_id):
+        with self._lock:
+            now = time.time()
+            ready = sum(1 for _, created in self._spares.get(vector_store_id, ()) if now - created <= self.ttl)
+            missing = self._targets.get(vector_store_id, 0) - ready - self._pending.get(vector_store_id, 0)
+            if missing <= 0:
+                return
+            self._pending[vector_store_id] = self._pending.get(vector_store_id, 0) + missing
+        for _ in range(missing):
+            self._executor.submit(self._create, project_client, vector_store_id)
+
+    def _create(self, project_client, vector_store_id):
+        try:
+            with span("create_thread"):
+                thread = project_client.agents.create_thread(tool_resources=_thread_resources(vector_store_id))
+            get_resource_ledger().record(self.conn_str, THREAD, thread.id, ttl=self.ttl + SPARE_THREAD_GRACE)
+            print(f"Created spare thread, thread ID: {thread.id}")
+            with self._lock:
+                self.created += 1
+                self._spares.setdefault(vector_store_id, deque()).append((thread.id, time.time()))
+        except Exception as e:
+            print(f"Error creating a spare thread: {e}")
+        finally:
+            with self._lock:
+                self._pending[vector_store_id] -= 1
+
+    def stats(self):
+        with self._lock:
+            spares = sum(len(spares) for spares in self._spares.values())
+        return {"spare_threads": spares, "hits": self.hits, "misses": self.misses, "created": self.created}
+
+
+class Prefetcher:
+    def __init__(self, conn_str: Optional[str], project_client=None, workers: int = PREFETCH_WORKERS):
+        self.conn_str = conn_str
+        self._project_client = project_client
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self.reserve = ThreadReserve(conn_str, self._executor)
+        # Prefetches by key, with when they started, most recent last; a failed one is tried again
+        # on the next call
+        self._started: "OrderedDict[tuple, Tuple[Future, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.prefetched_documents = 0
+
+    def prefetch(self, capability: str, model: str, document=None):
+        # Called on every rerun of the page: each capability, model and document is prefetched once
+        self._start(("agent", capability, model), lambda: self._warm_agent(capability, model))
+        if document is not None and capability in DOCUMENT_CAPABILITIES:
+            documents = as_documents(document)
+            # Uploads are known by their identity, so a rerun doesn't read them; an edited or renamed
+            # file is a new upload, and the vector store cache finds its content if already indexed.
+            # File objects without one are keyed by content
+            identities = [file_identity(d) for d in documents]
+            if all(identities):
+                key = ("document",) + tuple(sorted(identities))
+            else:
+                key = ("document", document_sha256(documents))
+            # The page's file objects stay with the page; the background reads its own copies, made
+            # on the background thread too and spooled to disk when they are large
+            self._start(key, lambda: self._prefetch_document(capability, documents))
+
+    def _start(self, key, func):
+        now = time.monotonic()
+        with self._lock:
+            future, started_at = self._started.get(key, (None, 0.0))
+            if future is not None and now - started_at < PREFETCH_REFRESH and not (
+                    future.done() and future.exception() is not None):
+                return
+            self._started[key] = (self._executor.submit(func), now)
+            self._started.move_to_end(key)
+            while len(self._started) > PREFETCH_MEMORY:
+                self._started.popitem(last=False)
+
+    def _warm_agent(self, capability, model):
+        with capability_scope(capability):
+            try:
+                project_client = self._client()
+                request = agent_request(capability, model)
+                get_agent_pool(self.conn_str).warm(
+                    project_client,
+                    model=request.model,
+                    name=request.name,
+                    instructions=request.instructions,
+                    toolset=request.toolset,
+                    tools=request.tools,
+                    tool_resources=request.tool_resources
+                )
+                if capability not in DOCUMENT_CAPABILITIES:
+                    self.reserve.fill(project_client)
+            except Exception as e:
+                print(f"Error prefetching the {capability} agent: {e}")
+                raise
+
+    def _prefetch_document(self, capability, documents):
+        with capability_scope(capability):
+            try:
+                project_client = self._client()
+                # Remembered by upload identity, so the run's cache lookups don't hash the upload again
+                document_sha256(documents)
+                documents = [spool(d) for d in documents]
+                document = documents[0] if len(documents) == 1 else documents
+                # Leased and released at once: the vector store stays in the cache for the run
+                with get_vector_store_cache(self.conn_str).lease_document(project_client, document) as vector_store_id:
+                    print(f"Prefetched vector store, vector store ID: {vector_store_id}")
+                self.prefetched_documents += 1
+                self.reserve.fill(project_client, vector_store_id, count=1)
+            except Exception as e:
+                print(f"Error prefetching {', '.join(d.name for d in documents)}: {e}")
+                raise
+
+    def _client(self):
+        if self._project_client is None:
+            self._project_client = get_project_client(self.conn_str)
+        return self._project_client
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        return {"documents": self.prefetched_documents, **self.reserve.stats()}
+
+
+# One prefetcher per AI Project connection string, living for the whole process
+_prefetchers: Dict[str, Prefetcher] = {}
+_prefetchers_lock = threading.Lock()
+
+
+def get_prefetcher(conn_str: Optional[str]) -> Prefetcher:
+    with _prefetchers_lock:
+        prefetcher = _prefetchers.get(conn_str or "")
+        if prefetcher is None:
+            prefetcher = _prefetchers[conn_str or ""] = Prefetcher(conn_str)
+        return prefetcher
+
+
+@atexit.register
+def close_prefetchers():
+    with _prefetchers_lock:
+        prefetchers = list(_prefetchers.values())
+        _prefetchers.clear()
+    for prefetcher in prefetchers:
+        prefetcher.close()
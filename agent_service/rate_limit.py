@@ -0,0 +1,401 @@
+import asyncio
+import email.utils
+import inspect
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, Optional
+
+# Rate-limit aware wrapper around `project_client.agents`, shared by every session of a project.
+# Each call first takes a token from its operation type's bucket, so bursts from many sessions
+# are smoothed client side instead of being throttled by the service. Throttling (429) and
+# unavailable (503) responses are retried with exponential backoff and full jitter, honouring
+# Retry-After; other server and connection errors are retried only for reads and deletes, which
+# are safe to repeat. After CIRCUIT_THRESHOLD calls in a row fail for good, the circuit opens and
+# calls fail fast for CIRCUIT_COOLDOWN seconds, then a single probe call decides whether it
+# closes again. Identical concurrent reads, deletes and vector store creations share one
+# in-flight call. The SDK's own retry policy is turned off so retries are not multiplied.
+
+# Requests per second per operation type, as "read=50,write=20,run=10,delete=20"; 0 turns a bucket off
+RATE_LIMITS = os.getenv("AZURE_FOUNDRY_RATE_LIMITS", "read=50,write=20,run=10,delete=20")
+MAX_RETRIES = int(os.getenv("AZURE_FOUNDRY_MAX_RETRIES", "5"))
+CIRCUIT_THRESHOLD = int(os.getenv("AZURE_FOUNDRY_CIRCUIT_THRESHOLD", "5"))
+CIRCUIT_COOLDOWN = float(os.getenv("AZURE_FOUNDRY_CIRCUIT_COOLDOWN", "30"))
+# Backoff before retry n is a random delay up to min(BACKOFF_MAX, BACKOFF_BASE * 2 ** n) seconds
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+
+# Statuses worth retrying for any operation: the service turned the request away without acting on it
+THROTTLED_STATUSES = (429, 503)
+# Statuses worth retrying for operations that are safe to repeat
+TRANSIENT_STATUSES = (408, 500, 502, 504)
+
+RUN_OPERATIONS = ("create_run", "create_and_process_run", "create_stream", "cancel_run",
+                  "submit_tool_outputs_to_run", "submit_tool_outputs_to_stream")
+# Writes that give the same result for the same arguments; concurrent duplicates are coalesced
+COALESCED_WRITES = ("create_vector_store", "create_vector_store_and_poll", "create_vector_store_file_batch",
+                    "create_vector_store_file_batch_and_poll")
+# Reads that return a stream, which cannot be shared between callers
+STREAMED_READS = ("get_file_content",)
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, retry_in: float):
+        super().__init__(f"The Agents service is failing, calls are paused for {retry_in:.0f}s")
+        self.retry_in = retry_in
+
+
+def parse_rate_limits(value: str) -> Dict[str, float]:
+    limits = {}
+    for item in value.split(","):
+        if "=" in item:
+            name, rate = item.split("=", 1)
+            limits[name.strip()] = float(rate)
+    return limits
+
+
+def operation_type(name: str) -> str:
+    if name in RUN_OPERATIONS:
+        return "run"
+    if name.startswith(("get_", "list_")) or name == "save_file":
+        return "read"
+    if name.startswith("delete_"):
+        return "delete"
+    return "write"
+
+
+def retry_after(error) -> Optional[float]:
+    # Seconds the service asked to wait, from retry-after-ms, x-ms-retry-after-ms or Retry-After
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    for header, scale in (("retry-after-ms", 0.001), ("x-ms-retry-after-ms", 0.001), ("Retry-After", 1.0)):
+        value = headers.get(header)
+        if value is None:
+            continue
+        try:
+            return max(0.0, float(value) * scale)
+        except ValueError:
+            pass
+        try:
+            # Retry-After may also be an HTTP date
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def _is_connection_error(error) -> bool:
+    from azure.core.exceptions import ServiceRequestError, ServiceResponseError
+
+    return isinstance(error, (ServiceRequestError, ServiceResponseError))
+
+
+def _stream_positions(args, kwargs):
+    # Where the file objects a call sends (such as an upload's) start, so that a retry can
+    # send them whole again; the SDK's own retries, which would rewind them, are turned off
+    return [(value, value.tell()) for value in (*args, *kwargs.values())
+            if hasattr(value, "read") and hasattr(value, "seek") and hasattr(value, "tell")]
+
+
+def _rewind(positions) -> bool:
+    # False when a stream can't be rewound, so the call can't be retried
+    try:
+        for stream, position in positions:
+            stream.seek(position)
+        return True
+    except (OSError, ValueError):
+        return False
+
+
+def _freeze(value):
+    # Hashable form of call arguments; objects without a value form only match themselves
+    if isinstance(value, (str, int, float, bool, type(None))):
+        return value
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    as_dict = getattr(value, "as_dict", None)
+    if callable(as_dict):
+        return (type(value).__name__, _freeze(as_dict()))
+    return (type(value).__name__, id(value))
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst or max(rate, 1.0)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        # Takes a token and returns how long to wait before using it; waiting callers queue up
+        # behind each other as the balance goes negative
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+
+
+class CircuitBreaker:
+    def __init__(self, threshold: int = CIRCUIT_THRESHOLD, cooldown: float = CIRCUIT_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened = 0
+        self._open_until = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self.failures < self.threshold:
+                return "closed"
+            return "open" if time.monotonic() < self._open_until or self._probing else "half-open"
+
+    def check(self) -> bool:
+        # Raises while open; once the cooldown is over, lets a single probe call through and
+        # returns True for it. The probe's caller must call release() when it is over
+        with self._lock:
+            if self.failures < self.threshold:
+                return False
+            now = time.monotonic()
+            if now < self._open_until or self._probing:
+                raise CircuitOpenError(max(self._open_until - now, 1.0))
+            self._probing = True
+            return True
+
+    def release(self):
+        # Ends a probe that neither succeeded nor failed, such as a cancelled one, so the next
+        # call probes again
+        with self._lock:
+            self._probing = False
+
+    def succeeded(self):
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+
+    def failed(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.failures >= self.threshold:
+                self._open_until = time.monotonic() + self.cooldown
+                self.opened += 1
+                print(f"Opened the circuit to the Agents service for {self.cooldown:.0f}s")
+
+
+class RateLimiter:
+    # Buckets, circuit breaker and in-flight calls shared by the sync and async clients of a project
+    def __init__(self, limits: Optional[Dict[str, float]] = None, max_retries: int = MAX_RETRIES,
+                 breaker: Optional[CircuitBreaker] = None, seed: Optional[int] = None):
+        limits = parse_rate_limits(RATE_LIMITS) if limits is None else limits
+        self.buckets = {name: TokenBucket(rate) for name, rate in limits.items() if rate > 0}
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+        self._random = random.Random(seed)
+        self._inflight: Dict[tuple, Future] = {}
+        self._async_inflight: Dict[tuple, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.throttled = 0
+        self.retries = 0
+        self.coalesced = 0
+        self.waited = 0.0
+
+    def _reserve(self, name) -> float:
+        bucket = self.buckets.get(operation_type(name))
+        delay = bucket.reserve() if bucket is not None else 0.0
+        with self._lock:
+            self.calls += 1
+            self.waited += delay
+        return delay
+
+    def _retry_delay(self, name, error, attempt) -> Optional[float]:
+        # Seconds to wait before retrying, or None when the error is final
+        if attempt >= self.max_retries or isinstance(error, CircuitOpenError):
+            return None
+        status = getattr(error, "status_code", None)
+        if status in THROTTLED_STATUSES:
+            with self._lock:
+                self.throttled += 1
+        elif not (operation_type(name) in ("read", "delete") and
+                  (status in TRANSIENT_STATUSES or _is_connection_error(error))):
+            return None
+        with self._lock:
+            self.retries += 1
+            backoff = self._random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+        return max(backoff, retry_after(error) or 0.0)
+
+    def _failed_for_good(self, error):
+        # Only errors that point at the service count towards opening the circuit; any other
+        # answer, such as a 404, shows the service is up
+        if isinstance(error, CircuitOpenError):
+            return
+        status = getattr(error, "status_code", None)
+        if status in THROTTLED_STATUSES + TRANSIENT_STATUSES or (
+                _is_connection_error(error) and status is None):
+            self.breaker.failed()
+        else:
+            self.breaker.succeeded()
+
+    def _key(self, name, args, kwargs):
+        if (operation_type(name) in ("read", "delete") and name not in STREAMED_READS) or name in COALESCED_WRITES:
+            return (name, _freeze(args), _freeze(kwargs))
+        return None
+
+    def call(self, name, method, args, kwargs):
+        key = self._key(name, args, kwargs)
+        if key is None:
+            return self._call(name, method, args, kwargs)
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not owner:
+            return future.result()
+        try:
+            future.set_result(self._call(name, method, args, kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._inflight[key]
+        return future.result()
+
+    def _call(self, name, method, args, kwargs):
+        # The circuit is checked once per call, so a probe's retries stay the probe
+        probe = self.breaker.check()
+        positions = _stream_positions(args, kwargs)
+        try:
+            attempt = 0
+            while True:
+                delay = self._reserve(name)
+                if delay:
+                    time.sleep(delay)
+                try:
+                    result = method(*args, **kwargs)
+                except Exception as e:
+                    delay = self._retry_delay(name, e, attempt)
+                    if delay is None or not _rewind(positions):
+                        self._failed_for_good(e)
+                        raise
+                    print(f"Retrying {name} in {delay:.1f}s after: {e}")
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+                self.breaker.succeeded()
+                return result
+        finally:
+            if probe:
+                self.breaker.release()
+
+    async def call_async(self, name, method, args, kwargs):
+        # Coalesced calls are only shared within one event loop, which the async engine owns
+        key = self._key(name, args, kwargs)
+        if key is None:
+            return await self._call_async(name, method, args, kwargs)
+        future = self._async_inflight.get(key)
+        if future is not None:
+            with self._lock:
+                self.coalesced += 1
+            return await asyncio.shield(future)
+        future = self._async_inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await self._call_async(name, method, args, kwargs)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            # Marks the exception as retrieved when nobody else was waiting on it
+            future.exception()
+            raise
+        finally:
+            del self._async_inflight[key]
+
+    async def _call_async(self, name, method, args, kwargs):
+        probe = self.breaker.check()
+        positions = _stream_positions(args, kwargs)
+        try:
+            attempt = 0
+            while True:
+                delay = self._reserve(name)
+                if delay:
+                    await asyncio.sleep(delay)
+                try:
+                    result = await method(*args, **kwargs)
+                except Exception as e:
+                    delay = self._retry_delay(name, e, attempt)
+                    if delay is None or not _rewind(positions):
+                        self._failed_for_good(e)
+                        raise
+                    print(f"Retrying {name} in {delay:.1f}s after: {e}")
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    continue
+                self.breaker.succeeded()
+                return result
+        finally:
+            # Also ends a probe cancelled by its caller
+            if probe:
+                self.breaker.release()
+
+    def stats(self):
+        with self._lock:
+            return {"calls": self.calls, "throttled": self.throttled, "retries": self.retries,
+                    "coalesced": self.coalesced, "waited": round(self.waited, 2),
+                    "circuit": self.breaker.state, "circuit_opened": self.breaker.opened}
+
+
+class RateLimitedAgents:
+    # Drop-in for `project_client.agents`; on the async client only coroutine methods are limited,
+    # and attributes other than methods pass through
+    def __init__(self, operations, limiter: RateLimiter, is_async: bool = False):
+        self._operations = operations
+        self.limiter = limiter
+        self.is_async = is_async
+
+    def __getattr__(self, name):
+        method = getattr(self._operations, name)
+        if name.startswith("_") or not callable(method):
+            return method
+        if inspect.iscoroutinefunction(method):
+            async def call_async(*args, **kwargs):
+                return await self.limiter.call_async(name, method, args, kwargs)
+            return call_async
+        if self.is_async:
+            return method
+
+        def call(*args, **kwargs):
+            return self.limiter.call(name, method, args, kwargs)
+        return call
+
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(conn_str: Optional[str]) -> RateLimiter:
+    with _limiters_lock:
+        limiter = _limiters.get(conn_str or "")
+        if limiter is None:
+            limiter = _limiters[conn_str or ""] = RateLimiter()
+        return limiter
+
+
+def rate_limited(project_client, conn_str: Optional[str], is_async: bool = False):
+    # Routes the client's agents calls through the project's rate limiter
+    if isinstance(project_client.agents, RateLimitedAgents):
+        return project_client
+    project_client.agents = RateLimitedAgents(project_client.agents, get_rate_limiter(conn_str), is_async)
+    return project_client
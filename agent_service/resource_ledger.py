@@ -0,0 +1,332 @@
+import atexit
+import contextvars
+import hashlib
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, List, NamedTuple, Optional
+
+from agent_service.telemetry import span
+
+# Ledger of every remote resource the app creates (agents, threads, files, vector stores),
+# kept in a SQLite database shared by all app, API and worker processes on the machine. Each
+# entry is tagged with the project, the session and process that created it, and an expiry.
+# A background sweeper deletes, in concurrent batches, the resources that expired and those
+# owned by processes that stopped sending heartbeats, so nothing leaks when a handler raises,
+# a run ends in an unexpected state or a process dies.
+
+LEDGER_PATH = os.getenv("AZURE_FOUNDRY_RESOURCE_LEDGER", ".resource_ledger.db")
+# Seconds a thread is kept after its last use
+THREAD_TTL = float(os.getenv("AZURE_FOUNDRY_THREAD_TTL", "86400"))
+SWEEP_INTERVAL = float(os.getenv("AZURE_FOUNDRY_SWEEP_INTERVAL", "300"))
+SWEEP_CONCURRENCY = int(os.getenv("AZURE_FOUNDRY_SWEEP_CONCURRENCY", "8"))
+SWEEP_BATCH_SIZE = 100
+# Seconds between a process's heartbeats, and without one before its resources are orphaned
+HEARTBEAT_INTERVAL = 60
+OWNER_TIMEOUT = 5 * HEARTBEAT_INTERVAL
+# Deletions are retried on later sweeps, then dropped from the ledger
+MAX_DELETE_ATTEMPTS = 5
+
+AGENT = "agent"
+THREAD = "thread"
+FILE = "file"
+VECTOR_STORE = "vector_store"
+
+# Dependents go first: threads and agents before the vector stores they use, stores before files
+SWEEP_ORDER = (THREAD, AGENT, VECTOR_STORE, FILE)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS resources (
+    kind TEXT NOT NULL,
+    resource_id TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    session TEXT,
+    owner TEXT,
+    created_at REAL NOT NULL,
+    expires_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (kind, resource_id)
+);
+CREATE INDEX IF NOT EXISTS resources_by_expiry ON resources (scope, expires_at);
+CREATE TABLE IF NOT EXISTS owners (
+    owner TEXT PRIMARY KEY,
+    last_seen REAL NOT NULL
+);
+"""
+
+_session = contextvars.ContextVar("ledger_session", default=None)
+
+
+@contextmanager
+def session_scope(session: Optional[str]):
+    # Resources recorded in this context are tagged with the session
+    token = _session.set(session)
+    try:
+        yield
+    finally:
+        _session.reset(token)
+
+
+def current_session() -> Optional[str]:
+    return _session.get()
+
+
+def ledger_scope(conn_str: Optional[str]) -> str:
+    # Entries are kept per project without writing the connection string to disk
+    return hashlib.sha256((conn_str or "").encode("utf-8")).hexdigest()[:16]
+
+
+class Resource(NamedTuple):
+    kind: str
+    resource_id: str
+    scope: str
+    session: Optional[str]
+    owner: Optional[str]
+    created_at: float
+    expires_at: Optional[float]
+    attempts: int
+
+
+class ResourceLedger:
+    def __init__(self, path: Optional[str] = LEDGER_PATH):
+        # A falsy path turns the ledger off
+        self.path = path
+        self.owner = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._heartbeat: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        if path:
+            with self._db() as db:
+                db.execute("PRAGMA journal_mode=WAL")
+                db.executescript(SCHEMA)
+
+    @contextmanager
+    def _db(self):
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def record(self, conn_str: Optional[str], kind: str, resource_id: str, ttl: Optional[float] = None,
+               owned: bool = False):
+        # owned: the resource only lives as long as this process (pooled agents); otherwise it
+        # expires ttl seconds from now, or lives until released when ttl is None
+        if not self.path:
+            return
+        now = time.time()
+        try:
+            with self._db() as db:
+                db.execute("INSERT OR REPLACE INTO resources (kind, resource_id, scope, session, owner, created_at, "
+                           "expires_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                           (kind, resource_id, ledger_scope(conn_str), current_session(),
+                            self.owner if owned else None, now, now + ttl if ttl is not None else None))
+            if owned:
+                self._start_heartbeat()
+        except sqlite3.Error as e:
+            print(f"Error recording {kind} {resource_id} in the resource ledger: {e}")
+
+    def touch(self, kind: str, resource_id: str, ttl: float):
+        # Pushes the expiry back when the resource is used again
+        if not self.path:
+            return
+        try:
+            with self._db() as db:
+                db.execute("UPDATE resources SET expires_at = ? WHERE kind = ? AND resource_id = ?",
+                           (time.time() + ttl, kind, resource_id))
+        except sqlite3.Error as e:
+            print(f"Error updating {kind} {resource_id} in the resource ledger: {e}")
+
+    def touch_many(self, kind: str, resource_ids, ttl: float):
+        if not self.path:
+            return
+        expires_at = time.time() + ttl
+        try:
+            with self._db() as db:
+                # One transaction for the whole collection
+                db.execute("BEGIN")
+                db.executemany("UPDATE resources SET expires_at = ? WHERE kind = ? AND resource_id = ?",
+                               [(expires_at, kind, resource_id) for resource_id in resource_ids])
+                db.execute("COMMIT")
+        except sqlite3.Error as e:
+            print(f"Error updating {kind}s in the resource ledger: {e}")
+
+    def release(self, kind: str, resource_id: str):
+        # The resource was deleted
+        if not self.path:
+            return
+        try:
+            with self._db() as db:
+                db.execute("DELETE FROM resources WHERE kind = ? AND resource_id = ?", (kind, resource_id))
+        except sqlite3.Error as e:
+            print(f"Error releasing {kind} {resource_id} from the resource ledger: {e}")
+
+    def _start_heartbeat(self):
+        with self._lock:
+            if self._heartbeat is not None:
+                return
+            self._heartbeat = threading.Thread(target=self._beat, name="ledger-heartbeat", daemon=True)
+        self._beat_once()
+        self._heartbeat.start()
+
+    def _beat_once(self):
+        with self._db() as db:
+            db.execute("INSERT OR REPLACE INTO owners (owner, last_seen) VALUES (?, ?)", (self.owner, time.time()))
+
+    def _beat(self):
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            try:
+                self._beat_once()
+            except sqlite3.Error as e:
+                print(f"Error sending resource ledger heartbeat: {e}")
+
+    def claim_due(self, conn_str: Optional[str], limit: int = SWEEP_BATCH_SIZE) -> List[Resource]:
+        # Takes expired and orphaned entries off the ledger; failed deletions are put back
+        if not self.path:
+            return []
+        now = time.time()
+        with self._db() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = db.execute(
+                    "SELECT kind, resource_id, scope, session, owner, created_at, expires_at, attempts FROM resources "
+                    "WHERE scope = ? AND ((expires_at IS NOT NULL AND expires_at < ?) OR (owner IS NOT NULL AND "
+                    "owner != ? AND owner NOT IN (SELECT owner FROM owners WHERE last_seen >= ?))) LIMIT ?",
+                    (ledger_scope(conn_str), now, self.owner, now - OWNER_TIMEOUT, limit)).fetchall()
+                db.executemany("DELETE FROM resources WHERE kind = ? AND resource_id = ?",
+                               [(row[0], row[1]) for row in rows])
+                db.execute("DELETE FROM owners WHERE last_seen < ?", (now - OWNER_TIMEOUT,))
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return [Resource(*row) for row in rows]
+
+    def retry_later(self, resource: Resource, delay: float):
+        if resource.attempts + 1 >= MAX_DELETE_ATTEMPTS:
+            print(f"Giving up on deleting {resource.kind} {resource.resource_id}")
+            return
+        with self._db() as db:
+            db.execute("INSERT OR IGNORE INTO resources (kind, resource_id, scope, session, owner, created_at, "
+                       "expires_at, attempts) VALUES (?, ?, ?, ?, NULL, ?, ?, ?)",
+                       (resource.kind, resource.resource_id, resource.scope, resource.session, resource.created_at,
+                        time.time() + delay, resource.attempts + 1))
+
+    def stats(self) -> Dict[str, int]:
+        if not self.path:
+            return {}
+        with self._db() as db:
+            return dict(db.execute("SELECT kind, COUNT(*) FROM resources GROUP BY kind").fetchall())
+
+
+def is_not_found(error) -> bool:
+    # azure.core raises ResourceNotFoundError (404); the fake client raises KeyError
+    return getattr(error, "status_code", None) == 404 or isinstance(error, KeyError)
+
+
+class ResourceSweeper:
+    def __init__(self, conn_str: Optional[str], project_client, ledger: ResourceLedger,
+                 interval: float = SWEEP_INTERVAL, concurrency: int = SWEEP_CONCURRENCY):
+        self.conn_str = conn_str
+        self.project_client = project_client
+        self.ledger = ledger
+        self.interval = interval
+        self.concurrency = concurrency
+        self.deleted = 0
+        self.failed = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="resource-sweeper", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _loop(self):
+        # The first sweep runs right away, cleaning up after processes that died before this one started
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Error sweeping remote resources: {e}")
+            if self._stop.wait(self.interval):
+                return
+
+    def sweep(self) -> int:
+        deleted = 0
+        while not self._stop.is_set():
+            batch = self.ledger.claim_due(self.conn_str)
+            if not batch:
+                break
+            for kind in SWEEP_ORDER:
+                resources = [resource for resource in batch if resource.kind == kind]
+                if resources:
+                    with span("cleanup"), ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                        deleted += sum(executor.map(self._delete, resources))
+        if deleted:
+            print(f"Swept {deleted} expired or orphaned resources")
+        return deleted
+
+    def _delete(self, resource: Resource) -> bool:
+        agents = self.project_client.agents
+        delete = {AGENT: agents.delete_agent, THREAD: agents.delete_thread,
+                  FILE: agents.delete_file, VECTOR_STORE: agents.delete_vector_store}[resource.kind]
+        try:
+            delete(resource.resource_id)
+        except Exception as e:
+            if not is_not_found(e):
+                print(f"Error deleting {resource.kind} {resource.resource_id}: {e}")
+                self.failed += 1
+                self.ledger.retry_later(resource, self.interval)
+                return False
+        self.deleted += 1
+        return True
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=5)
+
+    def stats(self):
+        return {"deleted": self.deleted, "failed": self.failed, **self.ledger.stats()}
+
+
+_ledger: Optional[ResourceLedger] = None
+_sweepers: Dict[str, ResourceSweeper] = {}
+_ledger_lock = threading.Lock()
+
+
+def get_resource_ledger() -> ResourceLedger:
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = ResourceLedger()
+        return _ledger
+
+
+def start_sweeper(conn_str: Optional[str], project_client) -> ResourceSweeper:
+    # One sweeper per project and process
+    ledger = get_resource_ledger()
+    with _ledger_lock:
+        sweeper = _sweepers.get(conn_str or "")
+        if sweeper is None:
+            sweeper = _sweepers[conn_str or ""] = ResourceSweeper(conn_str, project_client, ledger).start()
+        return sweeper
+
+
+def get_sweeper(conn_str: Optional[str]) -> Optional[ResourceSweeper]:
+    # The project's running sweeper, without starting one
+    with _ledger_lock:
+        return _sweepers.get(conn_str or "")
+
+
+@atexit.register
+def stop_sweepers():
+    with _ledger_lock:
+        sweepers = list(_sweepers.values())
+        _sweepers.clear()
+    for sweeper in sweepers:
+        sweeper.stop()
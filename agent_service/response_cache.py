@@ -0,0 +1,236 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional, Tuple
+
+from agent_service.ingestion import document_sha256
+
+# Exact-match cache of agent responses, keyed by capability, model, instructions, the prompt
+# with whitespace normalized and the SHA-256 of the searched document (or documents). Entries keep the reply
+# text, the generated code and image bytes, live in a size-bounded in-memory LRU backed by a
+# size-bounded directory on disk, and expire after a per-entry TTL. Opt-in: nothing is cached
+# unless AZURE_FOUNDRY_RESPONSE_CACHE is set.
+
+RESPONSE_CACHE_ENABLED = os.getenv("AZURE_FOUNDRY_RESPONSE_CACHE", "").lower() in ("1", "true", "yes")
+CACHE_DIR = os.getenv("AZURE_FOUNDRY_RESPONSE_CACHE_DIR", ".response_cache")
+DEFAULT_MAX_MEMORY_BYTES = int(float(os.getenv("AZURE_FOUNDRY_RESPONSE_CACHE_MEMORY_MB", "64")) * 2**20)
+DEFAULT_MAX_DISK_BYTES = int(float(os.getenv("AZURE_FOUNDRY_RESPONSE_CACHE_DISK_MB", "512")) * 2**20)
+DEFAULT_TTL = float(os.getenv("AZURE_FOUNDRY_RESPONSE_CACHE_TTL", "3600"))
+# Seconds after which a temporary file on disk is taken as left behind by a crashed writer
+STALE_TEMP_SECONDS = 3600
+
+
+class CachedResponse(NamedTuple):
+    text: str
+    code: str = ""
+    # PNG bytes of the images the agent generated
+    images: Tuple[bytes, ...] = ()
+
+    def size(self) -> int:
+        return len(self.text.encode("utf-8")) + len(self.code.encode("utf-8")) + sum(len(image) for image in self.images)
+
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(prompt.split())
+
+
+def response_key(capability: str, model: str, instructions: str, prompt: str, document=None,
+                 conn_str: Optional[str] = None) -> str:
+    payload = json.dumps([
+        hashlib.sha256((conn_str or "").encode("utf-8")).hexdigest(),
+        capability,
+        model,
+        instructions,
+        normalize_prompt(prompt),
+        document_sha256(document),
+    ])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, directory: Optional[str] = CACHE_DIR, max_memory_bytes: int = DEFAULT_MAX_MEMORY_BYTES,
+                 max_disk_bytes: int = DEFAULT_MAX_DISK_BYTES, ttl: float = DEFAULT_TTL):
+        self.directory = directory
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl = ttl
+        # key -> (expires_at, response)
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and entry[0] > now:
+                self._memory.move_to_end(key)
+                return self._hit(entry[1])
+            if entry:
+                self._drop(key)
+
+        entry = self._read(key, now)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, *entry)
+            return self._hit(entry[1])
+
+    def _hit(self, response):
+        # Caller holds self._lock
+        self.hits += 1
+        self.bytes_saved += response.size()
+        return response
+
+    def put(self, key: str, response: CachedResponse, ttl: Optional[float] = None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._remember(key, expires_at, response)
+        self._write(key, expires_at, response)
+
+    def _remember(self, key, expires_at, response):
+        # Caller holds self._lock; least recently used entries go first
+        if key in self._memory:
+            self._drop(key)
+        if response.size() > self.max_memory_bytes:
+            return
+        self._memory[key] = (expires_at, response)
+        self._memory_bytes += response.size()
+        while self._memory_bytes > self.max_memory_bytes:
+            self._drop(next(iter(self._memory)))
+
+    def _drop(self, key):
+        # Caller holds self._lock
+        _, response = self._memory.pop(key)
+        self._memory_bytes -= response.size()
+
+    def _paths(self, key, images=0):
+        base = os.path.join(self.directory, key)
+        return f"{base}.json", [f"{base}.{i}.png" for i in range(images)]
+
+    def _read(self, key, now):
+        if not self.directory:
+            return None
+        meta_path, _ = self._paths(key)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            _, image_paths = self._paths(key, meta["images"])
+            if meta["expires_at"] <= now:
+                self._remove([meta_path] + image_paths)
+                return None
+            images = []
+            for path in image_paths:
+                with open(path, "rb") as f:
+                    images.append(f.read())
+            # Recently read entries are the last to be evicted from disk
+            os.utime(meta_path)
+            return meta["expires_at"], CachedResponse(meta["text"], meta["code"], tuple(images))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Error reading cached response {key}: {e}")
+            return None
+
+    def _write(self, key, expires_at, response):
+        if not self.directory:
+            return
+        meta_path, image_paths = self._paths(key, len(response.images))
+        try:
+            # Images first and the metadata last, so readers never see a partial entry
+            for path, image in zip(image_paths, response.images):
+                self._publish(path, image)
+            self._publish(meta_path, json.dumps({"text": response.text, "code": response.code,
+                                                 "images": len(response.images),
+                                                 "expires_at": expires_at}).encode("utf-8"))
+        except Exception as e:
+            print(f"Error writing cached response {key}: {e}")
+        try:
+            self._evict_disk()
+        except OSError as e:
+            # The response was already served; a failed eviction is retried on the next write
+            print(f"Error evicting cached responses: {e}")
+
+    def _publish(self, path, data: bytes):
+        # Each writer has a temporary file of its own, renamed into place once complete, so
+        # concurrent writers of the same entry never interleave their writes in one file
+        with tempfile.NamedTemporaryFile(dir=self.directory, prefix=f"{os.path.basename(path)}.", suffix=".tmp",
+                                         delete=False) as f:
+            f.write(data)
+        try:
+            os.replace(f.name, path)
+        except BaseException:
+            self._remove([f.name])
+            raise
+
+    def _evict_disk(self):
+        # Entries whose metadata was least recently written or read go first. Files may be replaced
+        # or removed by other writers meanwhile, so each one is looked at on its own
+        entries = {}
+        now = time.time()
+        for item in os.scandir(self.directory):
+            try:
+                stat = item.stat()
+            except OSError:
+                continue
+            if item.name.endswith(".tmp"):
+                # Another writer's file in progress, or one a crashed writer left behind
+                if now - stat.st_mtime > STALE_TEMP_SECONDS:
+                    self._remove([item.path])
+                continue
+            entry = entries.setdefault(item.name.split(".", 1)[0], {"paths": [], "size": 0, "used": 0.0})
+            entry["paths"].append(item.path)
+            entry["size"] += stat.st_size
+            if item.name.endswith(".json"):
+                entry["used"] = stat.st_mtime
+        total = sum(entry["size"] for entry in entries.values())
+        for entry in sorted(entries.values(), key=lambda entry: entry["used"]):
+            if total <= self.max_disk_bytes:
+                break
+            self._remove(entry["paths"])
+            total -= entry["size"]
+
+    def _remove(self, paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "bytes_saved": self.bytes_saved,
+            }
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    # Keys include the project, so one cache serves every connection string
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
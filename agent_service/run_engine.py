@@ -0,0 +1,176 @@
+import asyncio
+import os
+import queue
+import random
+import threading
+import time
+from typing import Any, Iterator, List, NamedTuple, Optional
+
+from agent_service.streaming import record_events
+
+# Run execution: start a run and wait for it with exponential backoff instead of the
+# SDK's fixed one second polling loop, returning as soon as the run reaches a final state.
+
+RUN_TIMEOUT = float(os.getenv("AZURE_FOUNDRY_RUN_TIMEOUT", "300"))
+
+ACTIVE_RUN_STATUSES = ("queued", "in_progress", "requires_action", "cancelling")
+
+# Backoff schedule between status checks, in seconds
+INITIAL_POLL_DELAY = 0.1
+MAX_POLL_DELAY = 1.0
+POLL_BACKOFF = 1.5
+
+
+def run_status(run):
+    # ThreadRun.status is a str enum on the SDK models and a plain str on the fake client
+    return str(getattr(run.status, "value", run.status))
+
+
+def code_inputs(step) -> List[str]:
+    # The code a run step sent to the code interpreter, one entry per tool call
+    return [tool_call.code_interpreter.input
+            for tool_call in getattr(step.step_details, "tool_calls", None) or []
+            if getattr(tool_call, "type", None) == "code_interpreter" and tool_call.code_interpreter.input]
+
+
+def backoff_delays(initial: float = INITIAL_POLL_DELAY, cap: float = MAX_POLL_DELAY, factor: float = POLL_BACKOFF):
+    # Exponential backoff with "equal jitter": each delay is drawn from [d/2, d]
+    delay = initial
+    while True:
+        yield random.uniform(delay / 2, delay)
+        delay = min(cap, delay * factor)
+
+
+def wait_for_run(project_client, thread_id, run, timeout: Optional[float] = RUN_TIMEOUT):
+    deadline = time.monotonic() + timeout if timeout else None
+    delays = backoff_delays()
+    while run_status(run) in ACTIVE_RUN_STATUSES:
+        if run_status(run) == "requires_action":
+            # None of the agents in this app use client-side function tools
+            print(f"Run {run.id} requires action, cancelling it")
+            project_client.agents.cancel_run(thread_id=thread_id, run_id=run.id)
+        delay = next(delays)
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                project_client.agents.cancel_run(thread_id=thread_id, run_id=run.id)
+                raise TimeoutError(f"Run {run.id} did not finish within {timeout:g} seconds")
+            delay = min(delay, remaining)
+        time.sleep(delay)
+        run = project_client.agents.get_run(thread_id=thread_id, run_id=run.id)
+    return run
+
+
+async def wait_for_run_async(project_client, thread_id, run, timeout: Optional[float] = RUN_TIMEOUT):
+    # Same schedule as wait_for_run, for the azure.ai.projects.aio client
+    deadline = time.monotonic() + timeout if timeout else None
+    delays = backoff_delays()
+    while run_status(run) in ACTIVE_RUN_STATUSES:
+        if run_status(run) == "requires_action":
+            print(f"Run {run.id} requires action, cancelling it")
+            await project_client.agents.cancel_run(thread_id=thread_id, run_id=run.id)
+        delay = next(delays)
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                await project_client.agents.cancel_run(thread_id=thread_id, run_id=run.id)
+                raise TimeoutError(f"Run {run.id} did not finish within {timeout:g} seconds")
+            delay = min(delay, remaining)
+        await asyncio.sleep(delay)
+        run = await project_client.agents.get_run(thread_id=thread_id, run_id=run.id)
+    return run
+
+
+def execute_run(project_client, thread_id, agent_id, timeout: Optional[float] = RUN_TIMEOUT):
+    run = project_client.agents.create_run(thread_id=thread_id, assistant_id=agent_id)
+    return wait_for_run(project_client, thread_id, run, timeout=timeout)
+
+
+class StreamEvent(NamedTuple):
+    # kind is "message" (a new message starts, by id), "text" (message delta), "step" (completed run
+    # step), "code" (code interpreter input), "image" (file id) or "run"
+    kind: str
+    value: Any
+
+
+FINAL_RUN_EVENTS = ("thread.run.completed", "thread.run.failed", "thread.run.cancelled",
+                    "thread.run.expired", "thread.run.incomplete")
+
+# Put on the queue once the stream ends
+_STREAM_END = object()
+
+
+def _read_stream(events, received: queue.Queue):
+    # Reads the stream on a worker thread, so a stalled stream can't block its reader past the deadline
+    try:
+        for event in events:
+            received.put(event)
+        received.put(_STREAM_END)
+    except BaseException as e:
+        received.put(e)
+
+
+def _stream_timeout(project_client, thread_id, run, timeout):
+    # Cancels the run (looked up on the thread when its creation event never arrived)
+    if run is None:
+        runs = project_client.agents.list_runs(thread_id=thread_id, limit=1).data
+        if not runs:
+            return TimeoutError(f"Run stream did not start within {timeout:g} seconds")
+        run = runs[0]
+    project_client.agents.cancel_run(thread_id=thread_id, run_id=run.id)
+    return TimeoutError(f"Run {run.id} did not finish within {timeout:g} seconds")
+
+
+def stream_run(project_client, thread_id, agent_id, timeout: Optional[float] = RUN_TIMEOUT,
+               record_to: Optional[str] = None) -> Iterator[StreamEvent]:
+    # Yields text deltas, run steps, code snippets and images as they arrive, then the final run.
+    # The deadline holds even while the stream is silent: the run is then cancelled and
+    # TimeoutError raised, as wait_for_run does
+    deadline = time.monotonic() + timeout if timeout else None
+    run = message_id = None
+    with project_client.agents.create_stream(thread_id=thread_id, assistant_id=agent_id) as events:
+        if record_to:
+            events = record_events(events, record_to)
+        received = queue.Queue()
+        threading.Thread(target=_read_stream, args=(events, received), daemon=True, name="run-stream").start()
+        while True:
+            try:
+                item = received.get(timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                raise _stream_timeout(project_client, thread_id, run, timeout) from None
+            if item is _STREAM_END:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            event_type, event_data, _ = item
+            if event_type.startswith("thread.message.") and event_data.id != message_id:
+                message_id = event_data.id
+                yield StreamEvent("message", message_id)
+            if event_type == "thread.message.delta":
+                if event_data.text:
+                    yield StreamEvent("text", event_data.text)
+            elif event_type == "thread.run.step.completed":
+                yield StreamEvent("step", event_data)
+                for code in code_inputs(event_data):
+                    yield StreamEvent("code", code)
+            elif event_type == "thread.message.completed":
+                for content in event_data.content or []:
+                    if getattr(content, "type", None) == "image_file":
+                        yield StreamEvent("image", content.image_file.file_id)
+            elif event_type.startswith("thread.run.") and not event_type.startswith("thread.run.step"):
+                run = event_data
+                if event_type in FINAL_RUN_EVENTS:
+                    break
+            elif event_type == "error":
+                raise RuntimeError(f"Run stream error: {event_data}")
+
+            if deadline is not None and time.monotonic() > deadline:
+                raise _stream_timeout(project_client, thread_id, run, timeout)
+
+    if run is None:
+        raise RuntimeError("Run stream ended before the run was created")
+    if run_status(run) in ACTIVE_RUN_STATUSES:
+        # The stream closed early; fall back to polling for the final state, within what is left
+        remaining = max(0.001, deadline - time.monotonic()) if deadline is not None else None
+        run = wait_for_run(project_client, thread_id, run, timeout=remaining)
+    yield StreamEvent("run", run)
@@ -0,0 +1,168 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, NamedTuple, Optional
+
+# Per-session state of the Streamlit page (the last document, conversation threads, background
+# jobs), kept in a SQLite database in WAL mode instead of one JSON file that every session
+# overwrote. Each value is its own row, so saving a session only writes the keys that changed,
+# and sessions never see or clean up each other's state. Sessions are scanned and purged by
+# the time they were last saved.
+
+SESSION_STORE_PATH = os.getenv("AZURE_FOUNDRY_SESSION_STORE", ".session_store.db")
+# Seconds a session's state is kept after it was last saved
+SESSION_TTL = float(os.getenv("AZURE_FOUNDRY_SESSION_TTL", "86400"))
+# Seconds between purges of abandoned sessions by a process
+PURGE_INTERVAL = 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_by_age ON sessions (updated_at);
+CREATE TABLE IF NOT EXISTS session_values (
+    session TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (session, key)
+);
+"""
+
+
+class SessionRecord(NamedTuple):
+    session: str
+    created_at: float
+    updated_at: float
+
+
+class SessionStore:
+    def __init__(self, path: Optional[str] = SESSION_STORE_PATH):
+        # A falsy path turns the store off: nothing is saved and every session starts empty
+        self.path = path
+        self._purged_at = 0.0
+        self._lock = threading.Lock()
+        if path:
+            with self._db() as db:
+                db.execute("PRAGMA journal_mode=WAL")
+                db.executescript(SCHEMA)
+
+    @contextmanager
+    def _db(self):
+        # One short-lived connection per operation, so any session's thread (or process) can use it
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        # In WAL mode this only risks the last saves on a power loss, not corruption
+        db.execute("PRAGMA synchronous=NORMAL")
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def save(self, session: str, **values):
+        # Upserts the given keys only; values must be JSON serializable, and None deletes a key
+        if not self.path:
+            return
+        now = time.time()
+        try:
+            with self._db() as db:
+                db.execute("BEGIN IMMEDIATE")
+                try:
+                    db.execute("INSERT INTO sessions (session, created_at, updated_at) VALUES (?, ?, ?) "
+                               "ON CONFLICT (session) DO UPDATE SET updated_at = excluded.updated_at",
+                               (session, now, now))
+                    db.executemany("DELETE FROM session_values WHERE session = ? AND key = ?",
+                                   [(session, key) for key, value in values.items() if value is None])
+                    db.executemany("INSERT INTO session_values (session, key, value) VALUES (?, ?, ?) "
+                                   "ON CONFLICT (session, key) DO UPDATE SET value = excluded.value "
+                                   "WHERE value != excluded.value",
+                                   [(session, key, json.dumps(value)) for key, value in values.items()
+                                    if value is not None])
+                    db.execute("COMMIT")
+                except BaseException:
+                    db.execute("ROLLBACK")
+                    raise
+        except sqlite3.Error as e:
+            print(f"Error saving session state: {e}")
+
+    def load(self, session: str) -> Dict[str, object]:
+        if not self.path:
+            return {}
+        try:
+            with self._db() as db:
+                rows = db.execute("SELECT key, value FROM session_values WHERE session = ?", (session,)).fetchall()
+        except sqlite3.Error as e:
+            print(f"Error loading session state: {e}")
+            return {}
+        return {key: json.loads(value) for key, value in rows}
+
+    def scan(self, older_than: Optional[float] = None, limit: int = 100) -> List[SessionRecord]:
+        # Sessions last saved more than `older_than` seconds ago (all of them when None), oldest first
+        if not self.path:
+            return []
+        cutoff = time.time() - older_than if older_than is not None else float("inf")
+        with self._db() as db:
+            rows = db.execute("SELECT session, created_at, updated_at FROM sessions WHERE updated_at < ? "
+                              "ORDER BY updated_at LIMIT ?", (cutoff, limit)).fetchall()
+        return [SessionRecord(*row) for row in rows]
+
+    def delete(self, sessions: List[str]) -> int:
+        if not self.path or not sessions:
+            return 0
+        with self._db() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.executemany("DELETE FROM session_values WHERE session = ?", [(s,) for s in sessions])
+                deleted = db.executemany("DELETE FROM sessions WHERE session = ?", [(s,) for s in sessions]).rowcount
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return deleted
+
+    def purge(self, older_than: float = SESSION_TTL) -> int:
+        # Deletes the state of abandoned sessions, a batch at a time
+        purged = 0
+        while True:
+            sessions = [record.session for record in self.scan(older_than, limit=500)]
+            if not sessions:
+                return purged
+            purged += self.delete(sessions)
+
+    def purge_if_due(self, older_than: float = SESSION_TTL) -> int:
+        # Purges at most once every PURGE_INTERVAL seconds per process
+        with self._lock:
+            if self._purged_at and time.monotonic() - self._purged_at < PURGE_INTERVAL:
+                return 0
+            self._purged_at = time.monotonic()
+        try:
+            purged = self.purge(older_than)
+        except sqlite3.Error as e:
+            print(f"Error purging session state: {e}")
+            return 0
+        if purged:
+            print(f"Purged the state of {purged} abandoned sessions")
+        return purged
+
+    def stats(self) -> Dict[str, int]:
+        if not self.path:
+            return {}
+        with self._db() as db:
+            sessions, = db.execute("SELECT COUNT(*) FROM sessions").fetchone()
+            values, = db.execute("SELECT COUNT(*) FROM session_values").fetchone()
+        return {"sessions": sessions, "values": values}
+
+
+_store: Optional[SessionStore] = None
+_store_lock = threading.Lock()
+
+
+def get_session_store() -> SessionStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SessionStore()
+        return _store
@@ -0,0 +1,41 @@
+import json
+import time
+from typing import Iterable, Iterator, Union
+
+# Record and replay agent run event streams in the service's server-sent events format,
+# so streaming code paths can be exercised without the service.
+
+
+def to_sse(event_type, data) -> bytes:
+    if hasattr(data, "as_dict"):
+        data = data.as_dict()
+    payload = data if isinstance(data, str) else json.dumps(data)
+    return f"event: {event_type}\ndata: {payload}\n\n".encode("utf-8")
+
+
+def record_events(events: Iterable, path: str) -> Iterator:
+    # Pass (event_type, event_data, func_return) tuples through while appending them to `path`
+    with open(path, "ab") as f:
+        for event in events:
+            f.write(to_sse(event[0], event[1]))
+            yield event
+
+
+def _chunks(source: Union[str, bytes, Iterable[bytes]], delay: float) -> Iterator[bytes]:
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            source = f.read()
+    if isinstance(source, bytes):
+        source = [event + b"\n\n" for event in source.split(b"\n\n") if event.strip()]
+    for chunk in source:
+        if delay:
+            time.sleep(delay)
+        yield chunk
+
+
+def replay_stream(source: Union[str, bytes, Iterable[bytes]], delay: float = 0.0):
+    # `source` is a recording path, raw SSE bytes or an iterable of SSE events;
+    # `delay` is slept before each event to simulate generation time. Returns an AgentRunStream.
+    from azure.ai.projects.models import AgentEventHandler, AgentRunStream
+
+    return AgentRunStream(_chunks(source, delay), lambda run, handler: None, AgentEventHandler())
@@ -0,0 +1,149 @@
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+try:
+    from opentelemetry import trace
+except ImportError:
+    trace = None
+
+# Per-stage timing spans for agent runs. Every span is recorded per (capability, stage) with a
+# cumulative count/sum and a window of recent durations for p50/p95/p99, and is also emitted as
+# an OpenTelemetry span when the opentelemetry package is installed (exported by whatever
+# tracer provider the process configures). The recorded stages are served in the Prometheus
+# text format on AZURE_FOUNDRY_METRICS_PORT when it is set.
+
+METRICS_PORT = os.getenv("AZURE_FOUNDRY_METRICS_PORT")
+# Recent durations kept per capability and stage for the percentiles
+WINDOW_SIZE = 1024
+QUANTILES = (0.5, 0.95, 0.99)
+
+_capability = contextvars.ContextVar("agent_capability", default=None)
+_tracer = trace.get_tracer("agent_service") if trace is not None else None
+
+
+@contextmanager
+def capability_scope(capability: Optional[str]):
+    # Spans recorded in this context (and in threads or tasks started from it) carry the capability
+    token = _capability.set(capability)
+    try:
+        yield
+    finally:
+        _capability.reset(token)
+
+
+class _Stage:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+        self.recent = deque(maxlen=WINDOW_SIZE)
+
+
+class StageMetrics:
+    def __init__(self):
+        self._stages: Dict[tuple, _Stage] = {}
+        self._lock = threading.Lock()
+
+    def record(self, capability: Optional[str], stage: str, duration: float, error: bool = False):
+        with self._lock:
+            entry = self._stages.setdefault((capability or "none", stage), _Stage())
+            entry.count += 1
+            entry.total += duration
+            entry.errors += error
+            entry.recent.append(duration)
+
+    def summary(self):
+        with self._lock:
+            stages = [(key, entry.count, entry.total, entry.errors, sorted(entry.recent))
+                      for key, entry in self._stages.items()]
+        rows = []
+        for (capability, stage), count, total, errors, recent in sorted(stages):
+            row = {"capability": capability, "stage": stage, "count": count, "errors": errors, "sum": total}
+            for q in QUANTILES:
+                row[f"p{round(q * 100)}"] = recent[min(len(recent) - 1, int(q * len(recent)))]
+            rows.append(row)
+        return rows
+
+    def prometheus_text(self) -> str:
+        lines = [
+            "# HELP agent_stage_duration_seconds Duration of agent run stages",
+            "# TYPE agent_stage_duration_seconds summary",
+        ]
+        errors = []
+        for row in self.summary():
+            labels = f'capability="{row["capability"]}",stage="{row["stage"]}"'
+            for q in QUANTILES:
+                lines.append(f'agent_stage_duration_seconds{{{labels},quantile="{q}"}} {row[f"p{round(q * 100)}"]:.6f}')
+            lines.append(f"agent_stage_duration_seconds_sum{{{labels}}} {row['sum']:.6f}")
+            lines.append(f"agent_stage_duration_seconds_count{{{labels}}} {row['count']}")
+            errors.append(f"agent_stage_errors_total{{{labels}}} {row['errors']}")
+        lines += ["# HELP agent_stage_errors_total Agent run stages that raised",
+                  "# TYPE agent_stage_errors_total counter"] + errors
+        return "\n".join(lines) + "\n"
+
+
+stage_metrics = StageMetrics()
+
+
+@contextmanager
+def span(stage: str, **attributes):
+    capability = _capability.get()
+    otel_span = None
+    if _tracer is not None:
+        otel_span = _tracer.start_as_current_span(
+            f"agent.{stage}", attributes={"agent.capability": capability or "none", **attributes})
+        otel_span.__enter__()
+    start = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        stage_metrics.record(capability, stage, time.perf_counter() - start, error)
+        if otel_span is not None:
+            otel_span.__exit__(None, None, None)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = stage_metrics.prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: Optional[str] = METRICS_PORT):
+    # Serves /metrics once per process; a no-op when no port is configured
+    global _server
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer(("0.0.0.0", int(port)), _MetricsHandler)
+            except OSError as e:
+                print(f"Error starting metrics server on port {port}: {e}")
+                return None
+            threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+            print(f"Serving stage metrics on http://0.0.0.0:{port}/metrics")
+        return _server
@@ -0,0 +1,101 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+# Upload helpers that work on Streamlit's UploadedFile (a BytesIO) in place: hashing walks a
+# memoryview over the upload buffer in chunks and uploads hand the buffer straight to the SDK,
+# so no full copy of the document is made and nothing is written to the working directory.
+# The buffer comes from getvalue(), which shares the bytes the BytesIO was created from;
+# getbuffer() would give the BytesIO a private copy of them for as long as it lives.
+
+CHUNK_SIZE = 1024 * 1024
+# Content hashes remembered by upload identity, so reruns of the page and later runs on the same
+# upload don't read and hash it again
+HASH_MEMORY = 256
+
+_hashes: "OrderedDict[tuple, str]" = OrderedDict()
+_hashes_lock = threading.Lock()
+
+
+def iter_chunks(file_obj, chunk_size: int = CHUNK_SIZE):
+    getvalue = getattr(file_obj, "getvalue", None)
+    if getvalue is not None:
+        with memoryview(getvalue()) as view:
+            for start in range(0, len(view), chunk_size):
+                yield view[start:start + chunk_size]
+        return
+    file_obj.seek(0)
+    while True:
+        chunk = file_obj.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+    file_obj.seek(0)
+
+
+def file_identity(file_obj) -> Optional[tuple]:
+    # Streamlit gives every upload its own file_id, kept across reruns of the page; other file
+    # objects have no identity and are hashed every time
+    file_id = getattr(file_obj, "file_id", None)
+    if file_id is None:
+        return None
+    return file_id, getattr(file_obj, "name", None), file_size(file_obj)
+
+
+def file_sha256(file_obj, chunk_size: int = CHUNK_SIZE) -> str:
+    identity = file_identity(file_obj)
+    if identity is not None:
+        with _hashes_lock:
+            sha = _hashes.get(identity)
+            if sha is not None:
+                _hashes.move_to_end(identity)
+                return sha
+    digest = hashlib.sha256()
+    for chunk in iter_chunks(file_obj, chunk_size):
+        digest.update(chunk)
+    sha = digest.hexdigest()
+    if identity is not None:
+        with _hashes_lock:
+            _hashes[identity] = sha
+            while len(_hashes) > HASH_MEMORY:
+                _hashes.popitem(last=False)
+    return sha
+
+
+def file_size(file_obj) -> int:
+    size = getattr(file_obj, "size", None)
+    if size is not None:
+        return size
+    position = file_obj.tell()
+    file_obj.seek(0, os.SEEK_END)
+    size = file_obj.tell()
+    file_obj.seek(position)
+    return size
+
+
+def upload_file(project_client, file_obj, filename: str, purpose=None):
+    from azure.ai.projects.models import FilePurpose
+
+    purpose = purpose or FilePurpose.AGENTS
+    file_obj.seek(0)
+    try:
+        return project_client.agents.upload_file_and_poll(file=file_obj, filename=filename, purpose=purpose)
+    except TypeError:
+        # SDK builds that only accept a path: spool to a uniquely named temporary file
+        pass
+
+    suffix = f"_{os.path.basename(filename)}"
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as f:
+        temp_file_path = f.name
+        for chunk in iter_chunks(file_obj):
+            f.write(chunk)
+    try:
+        return project_client.agents.upload_file_and_poll(file_path=temp_file_path, purpose=purpose)
+    finally:
+        try:
+            os.remove(temp_file_path)
+        except OSError as e:
+            print(f"Error removing temporary upload {temp_file_path}: {e}")
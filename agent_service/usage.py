@@ -0,0 +1,297 @@
+import atexit
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# Token accounting for agent runs. The usage the service reports on each run and run step is
+# kept in a window of recent runs and in per-hour totals by capability, model and session, which
+# are rolled up into a SQLite database shared by the app, API and worker processes every
+# AZURE_FOUNDRY_USAGE_ROLLUP_INTERVAL seconds, or after every run while a budget is set. Token
+# budgets, global and per session, count the tokens of the hours within AZURE_FOUNDRY_BUDGET_WINDOW;
+# runs over budget are refused with a BudgetExceededError saying when to retry. A run admitted
+# under a budget reserves an estimate of its tokens until its usage is recorded, so concurrent runs
+# of a process can't all pass the check at once. Runs in flight in other processes are not seen
+# until they finish, so a budget may still be overshot by those runs.
+
+USAGE_DB_PATH = os.getenv("AZURE_FOUNDRY_USAGE_DB", ".usage.db")
+# Tokens all runs may use within the budget window, and tokens one browser session may use; 0 is unlimited
+TOKEN_BUDGET = int(os.getenv("AZURE_FOUNDRY_TOKEN_BUDGET", "0"))
+SESSION_TOKEN_BUDGET = int(os.getenv("AZURE_FOUNDRY_SESSION_TOKEN_BUDGET", "0"))
+BUDGET_WINDOW = float(os.getenv("AZURE_FOUNDRY_BUDGET_WINDOW", "86400"))
+ROLLUP_INTERVAL = float(os.getenv("AZURE_FOUNDRY_USAGE_ROLLUP_INTERVAL", "60"))
+# Totals are kept per hour; budgets drop an hour's tokens once the whole hour left the window
+BUCKET_SECONDS = 3600
+# Recent runs kept in memory, and days of hourly totals kept on disk
+WINDOW_SIZE = 1024
+RETENTION_DAYS = 90
+# Tokens reserved for a run before any run of the process reported its usage; later reservations
+# use the mean of the recent runs
+RUN_TOKEN_ESTIMATE = 2000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage_rollups (
+    bucket INTEGER NOT NULL,
+    capability TEXT NOT NULL,
+    model TEXT NOT NULL,
+    session TEXT NOT NULL,
+    runs INTEGER NOT NULL,
+    prompt_tokens INTEGER NOT NULL,
+    completion_tokens INTEGER NOT NULL,
+    total_tokens INTEGER NOT NULL,
+    PRIMARY KEY (bucket, capability, model, session)
+);
+CREATE INDEX IF NOT EXISTS usage_by_session ON usage_rollups (session, bucket);
+"""
+
+
+class BudgetExceededError(Exception):
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        # Seconds until the oldest hour of usage leaves the budget window
+        self.retry_after = retry_after
+
+
+class StepUsage(NamedTuple):
+    step_id: str
+    type: Optional[str]
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+
+
+class RunUsage(NamedTuple):
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+    steps: Tuple[StepUsage, ...] = ()
+
+
+class UsageRecord(NamedTuple):
+    timestamp: float
+    capability: str
+    model: str
+    session: Optional[str]
+    run_id: Optional[str]
+    usage: RunUsage
+
+
+def _tokens(usage) -> Optional[Tuple[int, int, int]]:
+    # RunCompletionUsage and RunStepCompletionUsage on the SDK, a dict on the fake client
+    if usage is None:
+        return None
+    get = usage.get if isinstance(usage, dict) else lambda name: getattr(usage, name, None)
+    prompt, completion = get("prompt_tokens") or 0, get("completion_tokens") or 0
+    return prompt, completion, get("total_tokens") or prompt + completion
+
+
+def run_usage(run, steps=()) -> Optional[RunUsage]:
+    # The run's token usage with that of the given run steps, or None when the service reported none
+    tokens = _tokens(getattr(run, "usage", None))
+    if tokens is None:
+        return None
+    step_usages = []
+    for step in steps:
+        step_tokens = _tokens(getattr(step, "usage", None))
+        if step_tokens is not None:
+            step_type = getattr(step, "type", None) or getattr(getattr(step, "step_details", None), "type", None)
+            step_usages.append(StepUsage(step.id, str(getattr(step_type, "value", step_type)), *step_tokens))
+    return RunUsage(*tokens, steps=tuple(step_usages))
+
+
+def _bucket(timestamp: float) -> int:
+    return int(timestamp // BUCKET_SECONDS) * BUCKET_SECONDS
+
+
+class UsageTracker:
+    def __init__(self, path: Optional[str] = USAGE_DB_PATH, token_budget: int = TOKEN_BUDGET,
+                 session_budget: int = SESSION_TOKEN_BUDGET, window: float = BUDGET_WINDOW,
+                 rollup_interval: float = ROLLUP_INTERVAL):
+        # A falsy path keeps the totals in this process only
+        self.path = path
+        self.token_budget = token_budget
+        self.session_budget = session_budget
+        self.window = window
+        self.rollup_interval = rollup_interval
+        self._recent = deque(maxlen=WINDOW_SIZE)
+        # Totals since the last rollup by (bucket, capability, model, session): runs, prompt, completion, total
+        self._pending: Dict[tuple, List[int]] = {}
+        # Totals of this process by (capability, model)
+        self._totals: Dict[tuple, List[int]] = {}
+        # Runs admitted but not yet recorded: reservation -> (session, estimated tokens)
+        self._reserved: Dict[int, Tuple[Optional[str], int]] = {}
+        self._next_reservation = 0
+        self._lock = threading.Lock()
+        self._rolled_up_at = time.monotonic()
+        self.rejected = 0
+        if path:
+            with self._db() as db:
+                db.execute("PRAGMA journal_mode=WAL")
+                db.executescript(SCHEMA)
+
+    @contextmanager
+    def _db(self):
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def record(self, capability: str, model: str, session: Optional[str], run_id: Optional[str],
+               usage: Optional[RunUsage], reservation: Optional[int] = None):
+        # Settles the run's reservation, if any, in the same step as its usage is counted
+        if usage is None:
+            self.release(reservation)
+            return
+        now = time.time()
+        counts = (1, usage.prompt_tokens, usage.completion_tokens, usage.total_tokens)
+        with self._lock:
+            self._reserved.pop(reservation, None)
+            self._recent.append(UsageRecord(now, capability, model, session, run_id, usage))
+            for totals, key in ((self._pending, (_bucket(now), capability, model, session or "")),
+                                (self._totals, (capability, model))):
+                entry = totals.setdefault(key, [0, 0, 0, 0])
+                for i, count in enumerate(counts):
+                    entry[i] += count
+        self.roll_up_if_due()
+
+    def roll_up_if_due(self):
+        # Budgets count every process's usage, so while one is set each run is written at once
+        with self._lock:
+            budgeted = self.path and (self.token_budget or self.session_budget)
+            if not budgeted and time.monotonic() - self._rolled_up_at < self.rollup_interval:
+                return
+            if not self.path:
+                # Without a database the hourly totals stay here, for as long as budgets count them
+                self._rolled_up_at = time.monotonic()
+                cutoff = _bucket(time.time() - self.window)
+                self._pending = {key: counts for key, counts in self._pending.items() if key[0] >= cutoff}
+                return
+        self.roll_up()
+
+    def roll_up(self):
+        # Adds the totals since the last rollup to the database, in one transaction
+        if not self.path:
+            return
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._rolled_up_at = time.monotonic()
+        if not pending:
+            return
+        try:
+            with self._db() as db:
+                db.execute("BEGIN IMMEDIATE")
+                try:
+                    db.executemany(
+                        "INSERT INTO usage_rollups (bucket, capability, model, session, runs, prompt_tokens, "
+                        "completion_tokens, total_tokens) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                        "ON CONFLICT (bucket, capability, model, session) DO UPDATE SET "
+                        "runs = runs + excluded.runs, prompt_tokens = prompt_tokens + excluded.prompt_tokens, "
+                        "completion_tokens = completion_tokens + excluded.completion_tokens, "
+                        "total_tokens = total_tokens + excluded.total_tokens",
+                        [key + tuple(counts) for key, counts in pending.items()])
+                    db.execute("DELETE FROM usage_rollups WHERE bucket < ?", (time.time() - RETENTION_DAYS * 86400,))
+                    db.execute("COMMIT")
+                except BaseException:
+                    db.execute("ROLLBACK")
+                    raise
+        except sqlite3.Error as e:
+            # Kept for the next rollup
+            print(f"Error rolling up token usage: {e}")
+            with self._lock:
+                for key, counts in pending.items():
+                    entry = self._pending.setdefault(key, [0, 0, 0, 0])
+                    for i, count in enumerate(counts):
+                        entry[i] += count
+
+    def spent(self, session: Optional[str] = None) -> int:
+        # Tokens used within the budget window, by all sessions or by one
+        cutoff = _bucket(time.time() - self.window)
+        with self._lock:
+            spent = sum(counts[3] for (bucket, _, _, pending_session), counts in self._pending.items()
+                        if bucket >= cutoff and (session is None or pending_session == session))
+        if self.path:
+            query, params = "SELECT SUM(total_tokens) FROM usage_rollups WHERE bucket >= ?", (cutoff,)
+            if session is not None:
+                query, params = query + " AND session = ?", (cutoff, session)
+            with self._db() as db:
+                spent += db.execute(query, params).fetchone()[0] or 0
+        return spent
+
+    def reserve(self, session: Optional[str] = None) -> Optional[int]:
+        # Admits a run, counting the tokens reserved by runs still in flight, and reserves an
+        # estimate of its own until record() or release(). Raises BudgetExceededError when the
+        # global or the session's budget is used up; returns None when no budget is set
+        if not self.token_budget and not (self.session_budget and session):
+            return None
+        spent = self.spent() if self.token_budget else 0
+        session_spent = self.spent(session) if self.session_budget and session else 0
+        retry_after = BUCKET_SECONDS - (time.time() - self.window) % BUCKET_SECONDS
+        with self._lock:
+            reserved = sum(tokens for _, tokens in self._reserved.values())
+            session_reserved = sum(tokens for owner, tokens in self._reserved.values() if owner == session)
+            if self.token_budget and spent + reserved >= self.token_budget:
+                self.rejected += 1
+                raise BudgetExceededError(f"The token budget of {self.token_budget} tokens is used up", retry_after)
+            if self.session_budget and session and session_spent + session_reserved >= self.session_budget:
+                self.rejected += 1
+                raise BudgetExceededError(
+                    f"This session's token budget of {self.session_budget} tokens is used up", retry_after)
+            self._next_reservation += 1
+            self._reserved[self._next_reservation] = (session, self._estimate())
+            return self._next_reservation
+
+    def release(self, reservation: Optional[int]):
+        # Drops the reservation of a run that reported no usage, such as one that failed to start
+        if reservation is None:
+            return
+        with self._lock:
+            self._reserved.pop(reservation, None)
+
+    def _estimate(self) -> int:
+        if not self._recent:
+            return RUN_TOKEN_ESTIMATE
+        return sum(record.usage.total_tokens for record in self._recent) // len(self._recent)
+
+    def recent(self, limit: int = 20) -> List[UsageRecord]:
+        with self._lock:
+            return list(self._recent)[-limit:]
+
+    def summary(self):
+        # This process's totals by capability and model
+        with self._lock:
+            totals = sorted(self._totals.items())
+        return [{"capability": capability, "model": model, "runs": runs, "prompt_tokens": prompt,
+                 "completion_tokens": completion, "total_tokens": total}
+                for (capability, model), (runs, prompt, completion, total) in totals]
+
+    def stats(self):
+        with self._lock:
+            runs, prompt, completion, total = (sum(counts[i] for counts in self._totals.values()) for i in range(4))
+            rejected = self.rejected
+            in_flight = len(self._reserved)
+        return {"runs": runs, "prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": total,
+                "rejected": rejected, "in_flight": in_flight}
+
+
+_tracker: Optional[UsageTracker] = None
+_tracker_lock = threading.Lock()
+
+
+def get_usage_tracker() -> UsageTracker:
+    global _tracker
+    with _tracker_lock:
+        if _tracker is None:
+            _tracker = UsageTracker()
+        return _tracker
+
+
+@atexit.register
+def roll_up_usage():
+    with _tracker_lock:
+        tracker = _tracker
+    if tracker is not None:
+        tracker.roll_up()
@@ -0,0 +1,438 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from agent_service.agent_pool import as_plain
+from agent_service.ingestion import (EXISTING, UPLOAD_WORKERS, FileProgress, as_documents, hash_documents,
+                                     ingest_documents)
+from agent_service.resource_ledger import FILE, VECTOR_STORE, get_resource_ledger
+from agent_service.telemetry import span
+from agent_service.uploads import file_sha256, file_size, upload_file
+
+# Process-wide cache of uploaded documents and their vector stores, keyed by the SHA-256 of
+# the file contents plus the chunking settings. Uploading the same document again, from any
+# session, reuses the existing vector store instead of uploading and indexing it again.
+# Collections of documents share one store; a cached collection that holds some of a new
+# collection's documents is extended with the others.
+# Entries are reference counted while runs use them, evicted (and deleted remotely) by
+# LRU/TTL, and kept in a SQLite index shared by the app, API and worker processes, so the cache
+# survives restarts and processes reuse each other's stores. Every lease is also recorded in the
+# index, and a process only deletes a store it evicts when no process holds a lease on it and
+# none used it since this one did; otherwise it only forgets the entry.
+
+CACHE_INDEX_PATH = os.getenv("AZURE_FOUNDRY_VECTOR_STORE_CACHE", ".vector_store_cache.db")
+DEFAULT_MAX_ENTRIES = int(os.getenv("AZURE_FOUNDRY_VECTOR_STORE_CACHE_SIZE", "32"))
+DEFAULT_TTL = float(os.getenv("AZURE_FOUNDRY_VECTOR_STORE_TTL", "86400"))
+# Extra seconds the resource ledger keeps a cached vector store past the cache's own TTL, so the
+# cache evicts it first; the ledger only sweeps stores whose cache is gone
+LEDGER_GRACE = 3600
+# Seconds a lease counts for other processes; longer than any run, so that the leases of a
+# process that died don't keep its stores forever
+LEASE_TIMEOUT = 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    scope TEXT NOT NULL,
+    key TEXT NOT NULL,
+    entry TEXT NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (scope, key)
+);
+CREATE TABLE IF NOT EXISTS leases (
+    lease TEXT PRIMARY KEY,
+    vector_store_id TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS leases_by_store ON leases (vector_store_id, expires_at);
+"""
+
+
+def _chunking(chunking_strategy) -> str:
+    return json.dumps(as_plain(chunking_strategy), sort_keys=True, default=str) if chunking_strategy else "auto"
+
+
+def content_key(file_obj, chunking_strategy=None) -> str:
+    return f"{file_sha256(file_obj)}:{_chunking(chunking_strategy)}"
+
+
+def collection_key(hashes, chunking: str) -> str:
+    digest = hashlib.sha256("\n".join(sorted(hashes)).encode("utf-8")).hexdigest()
+    return f"collection:{digest}:{chunking}"
+
+
+def _scope(conn_str: Optional[str]) -> str:
+    # Index entries are kept per project without writing the connection string to disk
+    return hashlib.sha256((conn_str or "").encode("utf-8")).hexdigest()[:16]
+
+
+class VectorStoreCache:
+    def __init__(self, conn_str: Optional[str] = None, index_path: Optional[str] = CACHE_INDEX_PATH,
+                 max_entries: int = DEFAULT_MAX_ENTRIES, ttl: float = DEFAULT_TTL):
+        self.conn_str = conn_str
+        self.scope = _scope(conn_str)
+        self.index_path = index_path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: Dict[str, dict] = {}
+        self._refs: Dict[str, int] = {}
+        # Entries loaded from disk are checked against the service once before reuse
+        self._unverified = set()
+        self._lock = threading.Lock()
+        self._creating: Dict[str, threading.Lock] = {}
+        self._project_client = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if index_path:
+            with self._db() as db:
+                db.execute("PRAGMA journal_mode=WAL")
+                db.executescript(SCHEMA)
+        self._load()
+
+    @contextmanager
+    def _db(self):
+        # One short-lived connection per operation, so any thread (or process) can use the index
+        db = sqlite3.connect(self.index_path, timeout=30, isolation_level=None)
+        try:
+            yield db
+        finally:
+            db.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self._db() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    @contextmanager
+    def lease(self, project_client, file_obj, filename: str, chunking_strategy=None):
+        # `file_obj` is a binary file object such as Streamlit's UploadedFile
+        key = content_key(file_obj, chunking_strategy)
+        entry, lease_id = self._checkout(project_client, key, file_obj, filename, chunking_strategy)
+        try:
+            yield entry["vector_store_id"]
+        finally:
+            self._release(key, entry, lease_id)
+
+    def lease_document(self, project_client, document, on_file=None):
+        # Context manager over the vector store of a request's document, or list of documents
+        documents = as_documents(document)
+        if len(documents) == 1:
+            return self.lease(project_client, documents[0], documents[0].name)
+        return self.lease_documents(project_client, documents, on_file=on_file)
+
+    @contextmanager
+    def lease_documents(self, project_client, documents, chunking_strategy=None, on_file=None):
+        # One vector store for a collection of documents; on_file(FileProgress) follows each document
+        key, entry, lease_id = self._checkout_collection(project_client, documents, chunking_strategy, on_file)
+        try:
+            yield entry["vector_store_id"]
+        finally:
+            self._release(key, entry, lease_id)
+
+    def _release(self, key, entry, lease_id):
+        with self._lock:
+            self._refs[key] -= 1
+            entry["last_used"] = time.time()
+        if lease_id:
+            try:
+                with self._transaction() as db:
+                    db.execute("DELETE FROM leases WHERE lease = ?", (lease_id,))
+                    db.execute("UPDATE entries SET last_used = ? WHERE scope = ? AND key = ?",
+                               (entry["last_used"], self.scope, key))
+            except sqlite3.Error as e:
+                # The lease runs out by itself
+                print(f"Error releasing cached vector store {entry['vector_store_id']}: {e}")
+        self.evict()
+
+    def _hit(self, project_client, key):
+        # The cached entry for key, leased, and its lease's ID, or (None, None); called under the
+        # key's create lock. Entries other processes added to the index since this one loaded it
+        # are found too
+        with self._lock:
+            entry = self._entries.get(key)
+            verify = key in self._unverified
+        if entry is None:
+            entry = self._shared_entry(key)
+            verify = entry is not None
+        if entry and verify and not self._exists(project_client, entry):
+            print(f"Cached vector store {entry['vector_store_id']} no longer exists")
+            with self._lock:
+                self._entries.pop(key, None)
+            entry = None
+        lease_id = None
+        if entry:
+            entry["last_used"] = time.time()
+            lease_id = self._lease_shared(key, entry)
+            if lease_id is None:
+                print(f"Cached vector store {entry['vector_store_id']} was evicted by another process")
+                with self._lock:
+                    self._entries.pop(key, None)
+                entry = None
+        with self._lock:
+            self._unverified.discard(key)
+            if entry:
+                self.hits += 1
+                self._entries[key] = entry
+                self._refs[key] = self._refs.get(key, 0) + 1
+            else:
+                self.misses += 1
+        return entry, lease_id
+
+    def _shared_entry(self, key) -> Optional[dict]:
+        if not self.index_path:
+            return None
+        try:
+            with self._db() as db:
+                row = db.execute("SELECT entry FROM entries WHERE scope = ? AND key = ?", (self.scope, key)).fetchone()
+        except sqlite3.Error as e:
+            print(f"Error reading the vector store cache index: {e}")
+            return None
+        return json.loads(row[0]) if row else None
+
+    def _lease_shared(self, key, entry, created: bool = False) -> Optional[str]:
+        # Records a lease on the entry's store for other processes, and its use in the index.
+        # Returns the lease's ID ("" without an index), or None when another process evicted the
+        # entry meanwhile
+        if not self.index_path:
+            return ""
+        lease_id = uuid.uuid4().hex
+        try:
+            with self._transaction() as db:
+                if created:
+                    db.execute("INSERT INTO entries (scope, key, entry, last_used) VALUES (?, ?, ?, ?) "
+                               "ON CONFLICT (scope, key) DO UPDATE SET entry = excluded.entry, "
+                               "last_used = excluded.last_used",
+                               (self.scope, key, json.dumps(entry), entry["last_used"]))
+                elif not db.execute("UPDATE entries SET last_used = ? WHERE scope = ? AND key = ?",
+                                    (entry["last_used"], self.scope, key)).rowcount:
+                    return None
+                db.execute("INSERT INTO leases (lease, vector_store_id, expires_at) VALUES (?, ?, ?)",
+                           (lease_id, entry["vector_store_id"], time.time() + LEASE_TIMEOUT))
+        except sqlite3.Error as e:
+            # The run goes ahead; other processes only see the entry's last use
+            print(f"Error updating the vector store cache index: {e}")
+            return ""
+        return lease_id
+
+    def _claim(self, key, entry) -> bool:
+        # Takes the entry out of the index when no process holds a lease on its store and none used
+        # it since this one did; only then may this process delete or extend the store
+        if not self.index_path:
+            return True
+        now = time.time()
+        try:
+            with self._transaction() as db:
+                db.execute("DELETE FROM leases WHERE expires_at <= ?", (now,))
+                leased, = db.execute("SELECT COUNT(*) FROM leases WHERE vector_store_id = ?",
+                                     (entry["vector_store_id"],)).fetchone()
+                row = db.execute("SELECT last_used FROM entries WHERE scope = ? AND key = ?",
+                                 (self.scope, key)).fetchone()
+                # A missing row was claimed by another process, which deletes the store
+                if leased or row is None or row[0] > entry["last_used"]:
+                    return False
+                db.execute("DELETE FROM entries WHERE scope = ? AND key = ?", (self.scope, key))
+        except sqlite3.Error as e:
+            print(f"Error updating the vector store cache index: {e}")
+            return False
+        return True
+
+    def _checkout(self, project_client, key, file_obj, filename, chunking_strategy):
+        self._project_client = project_client
+        with self._lock:
+            create_lock = self._creating.setdefault(key, threading.Lock())
+
+        with create_lock:
+            entry, lease_id = self._hit(project_client, key)
+            if entry:
+                ledger = get_resource_ledger()
+                ledger.touch(VECTOR_STORE, entry["vector_store_id"], self.ttl + LEDGER_GRACE)
+                ledger.touch(FILE, entry["file_id"], self.ttl + LEDGER_GRACE)
+                return entry, lease_id
+
+            ledger = get_resource_ledger()
+            with span("upload_file"):
+                file = upload_file(project_client, file_obj, filename)
+            ledger.record(self.conn_str, FILE, file.id, ttl=self.ttl + LEDGER_GRACE)
+            print(f"Uploaded file, file ID: {file.id}")
+            with span("create_vector_store"):
+                vector_store = project_client.agents.create_vector_store_and_poll(
+                    file_ids=[file.id],
+                    name=f"vectorstore_{filename}",
+                    chunking_strategy=chunking_strategy
+                )
+            ledger.record(self.conn_str, VECTOR_STORE, vector_store.id, ttl=self.ttl + LEDGER_GRACE)
+            print(f"Created vector store, vector store ID: {vector_store.id}")
+
+            now = time.time()
+            entry = {"file_id": file.id, "vector_store_id": vector_store.id, "filename": filename,
+                     "bytes": file_size(file_obj), "created_at": now, "last_used": now}
+            with self._lock:
+                self._entries[key] = entry
+                self._refs[key] = self._refs.get(key, 0) + 1
+            return entry, self._lease_shared(key, entry, created=True)
+
+    def _checkout_collection(self, project_client, documents, chunking_strategy, on_file):
+        self._project_client = project_client
+        hashed = hash_documents(documents, on_file)
+        chunking = _chunking(chunking_strategy)
+        key = collection_key(hashed, chunking)
+        with self._lock:
+            create_lock = self._creating.setdefault(key, threading.Lock())
+
+        with create_lock:
+            ledger = get_resource_ledger()
+            entry, lease_id = self._hit(project_client, key)
+            if entry:
+                ledger.touch(VECTOR_STORE, entry["vector_store_id"], self.ttl + LEDGER_GRACE)
+                ledger.touch_many(FILE, entry["files"].values(), self.ttl + LEDGER_GRACE)
+                if on_file is not None:
+                    for sha, document in hashed.items():
+                        on_file(FileProgress(document.name, EXISTING, entry["files"][sha]))
+                return key, entry, lease_id
+
+            base = self._take_subset(project_client, hashed, chunking)
+            try:
+                result = ingest_documents(
+                    project_client, hashed, conn_str=self.conn_str,
+                    vector_store_id=base["vector_store_id"] if base else None,
+                    indexed=base["files"] if base else None,
+                    name=f"vectorstore_{len(hashed)}_documents",
+                    chunking_strategy=chunking_strategy,
+                    ttl=self.ttl + LEDGER_GRACE,
+                    on_file=on_file
+                )
+            except Exception:
+                if base:
+                    # The store may have been extended halfway
+                    self._delete(base)
+                raise
+            if base:
+                print(f"Extended cached vector store, vector store ID: {base['vector_store_id']}")
+                ledger.touch(VECTOR_STORE, base["vector_store_id"], self.ttl + LEDGER_GRACE)
+                ledger.touch_many(FILE, base["files"].values(), self.ttl + LEDGER_GRACE)
+
+            # Documents that failed to upload or index are left out of the key, so a later lease
+            # of the same collection extends this store with them
+            key = collection_key(result.files, chunking)
+            now = time.time()
+            entry = {"vector_store_id": result.vector_store_id, "files": result.files, "chunking": chunking,
+                     "filename": f"{len(result.files)} documents",
+                     "bytes": sum(file_size(hashed[sha]) for sha in result.files),
+                     "created_at": base["created_at"] if base else now, "last_used": now}
+            with self._lock:
+                self._entries[key] = entry
+                self._refs[key] = self._refs.get(key, 0) + 1
+            return key, entry, self._lease_shared(key, entry, created=True)
+
+    def _take_subset(self, project_client, hashed, chunking):
+        # Takes the largest idle cached collection whose documents are all in `hashed`, to extend it;
+        # collections other processes are using are left alone
+        with self._lock:
+            candidates = [(len(entry["files"]), key) for key, entry in self._entries.items()
+                          if "files" in entry and entry["chunking"] == chunking and not self._refs.get(key)
+                          and entry["files"].keys() <= hashed.keys()]
+            if not candidates:
+                return None
+            base_key = max(candidates)[1]
+            base = self._entries.pop(base_key)
+            verify = base_key in self._unverified
+            self._unverified.discard(base_key)
+        if not self._claim(base_key, base):
+            return None
+        if verify and not self._exists(project_client, base):
+            print(f"Cached vector store {base['vector_store_id']} no longer exists")
+            return None
+        return base
+
+    def _exists(self, project_client, entry):
+        try:
+            project_client.agents.get_vector_store(entry["vector_store_id"])
+            return True
+        except Exception:
+            return False
+
+    def evict(self):
+        now = time.time()
+        with self._lock:
+            idle = sorted((entry["last_used"], key) for key, entry in self._entries.items()
+                          if not self._refs.get(key))
+            overflow = len(self._entries) - self.max_entries
+            evicted = []
+            for last_used, key in idle:
+                if now - last_used > self.ttl or overflow > 0:
+                    evicted.append((key, self._entries.pop(key)))
+                    overflow -= 1
+        for key, entry in evicted:
+            if self._claim(key, entry):
+                self._delete(entry)
+            else:
+                # Another process still uses the store; it deletes it once it evicts the entry
+                print(f"Forgot cached vector store {entry['vector_store_id']}, still used by another process")
+
+    def _delete(self, entry):
+        self.evictions += 1
+        if self._project_client is None:
+            return
+        try:
+            with span("cleanup"):
+                self._project_client.agents.delete_vector_store(entry["vector_store_id"])
+                # Collections hold several files, deleted concurrently
+                file_ids = list(entry["files"].values()) if "files" in entry else [entry["file_id"]]
+                with ThreadPoolExecutor(max_workers=min(UPLOAD_WORKERS, len(file_ids))) as executor:
+                    list(executor.map(self._project_client.agents.delete_file, file_ids))
+            get_resource_ledger().release(VECTOR_STORE, entry["vector_store_id"])
+            for file_id in file_ids:
+                get_resource_ledger().release(FILE, file_id)
+            print(f"Evicted cached vector store, vector store ID: {entry['vector_store_id']}")
+        except Exception as e:
+            print(f"Error deleting cached vector store {entry['vector_store_id']}: {e}")
+
+    def _load(self):
+        if not self.index_path:
+            return
+        try:
+            with self._db() as db:
+                rows = db.execute("SELECT key, entry FROM entries WHERE scope = ?", (self.scope,)).fetchall()
+            self._entries = {key: json.loads(entry) for key, entry in rows}
+            self._unverified = set(self._entries)
+        except sqlite3.Error as e:
+            print(f"Error loading vector store cache index: {e}")
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+            cached_bytes = sum(entry["bytes"] for entry in self._entries.values())
+        lookups = self.hits + self.misses
+        return {
+            "size": size,
+            "bytes": cached_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+_caches: Dict[str, VectorStoreCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_vector_store_cache(conn_str: Optional[str]) -> VectorStoreCache:
+    with _caches_lock:
+        cache = _caches.get(conn_str or "")
+        if cache is None:
+            cache = _caches[conn_str or ""] = VectorStoreCache(conn_str)
+        return cache
@@ -0,0 +1,72 @@
+# Offline comparison of per-request create/delete_agent against the shared agent pool.
+# Usage: python -m benchmarks.agent_pool [requests] [sessions]
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from azure.ai.projects.models import ToolSet, CodeInterpreterTool
+
+from agent_service.agent_pool import AgentPool
+from agent_service.fake_client import FakeAIProjectClient
+
+MODEL = "gpt-4o"
+INSTRUCTIONS = "You are a helpful data analyst. You can use Python to perform required calculations."
+
+
+def code_interpreter_toolset():
+    toolset = ToolSet()
+    toolset.add(CodeInterpreterTool())
+    return toolset
+
+
+def run_without_pool(client, prompt):
+    agent = client.agents.create_agent(model=MODEL, name="code-interpreter-agent",
+                                       instructions=INSTRUCTIONS, toolset=code_interpreter_toolset())
+    thread = client.agents.create_thread()
+    client.agents.create_message(thread_id=thread.id, role="user", content=prompt)
+    client.agents.create_and_process_run(thread_id=thread.id, assistant_id=agent.id)
+    client.agents.delete_agent(agent.id)
+
+
+def run_with_pool(client, pool, prompt):
+    with pool.lease(client, model=MODEL, name="code-interpreter-agent",
+                    instructions=INSTRUCTIONS, toolset=code_interpreter_toolset()) as agent_id:
+        thread = client.agents.create_thread()
+        client.agents.create_message(thread_id=thread.id, role="user", content=prompt)
+        client.agents.create_and_process_run(thread_id=thread.id, assistant_id=agent_id)
+
+
+def measure(label, func, requests, sessions):
+    latencies = []
+
+    def timed(i):
+        start = time.perf_counter()
+        func(f"prompt {i}")
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as executor:
+        list(executor.map(timed, range(requests)))
+    elapsed = time.perf_counter() - start
+    print(f"{label:<12} mean {sum(latencies) / len(latencies) * 1000:8.1f} ms   "
+          f"total {elapsed:6.2f} s   throughput {requests / elapsed:6.2f} req/s")
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    sessions = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+    client = FakeAIProjectClient()
+    measure("no pool", lambda prompt: run_without_pool(client, prompt), requests, sessions)
+    print(f"  agent calls: {dict(client.agents.calls)}")
+
+    client = FakeAIProjectClient()
+    pool = AgentPool()
+    measure("agent pool", lambda prompt: run_with_pool(client, pool, prompt), requests, sessions)
+    print(f"  pool stats:  {pool.stats()}")
+    pool.close()
+    print(f"  agent calls: {dict(client.agents.calls)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# Offline load test of the async engine: throughput and latency versus concurrency, with the
+# blocking per-session path (one script thread per run) as the baseline.
+# Usage: python -m benchmarks.async_engine [runs per level]
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from azure.ai.projects.models import ToolSet, CodeInterpreterTool
+
+from agent_service.agent_pool import AgentPool
+from agent_service.async_engine import AgentRequest, AsyncAgentEngine
+from agent_service.fake_client import FakeAIProjectClient
+from agent_service.run_engine import execute_run
+
+CONCURRENCY = (1, 2, 4, 8, 16, 32)
+MODEL = "gpt-4o"
+INSTRUCTIONS = "You are a helpful data analyst. You can use Python to perform required calculations."
+
+
+def code_interpreter_toolset():
+    toolset = ToolSet()
+    toolset.add(CodeInterpreterTool())
+    return toolset
+
+
+def request(i):
+    return AgentRequest(model=MODEL, name="code-interpreter-agent", instructions=INSTRUCTIONS,
+                        prompt=f"prompt {i}", toolset=code_interpreter_toolset())
+
+
+def blocking_run(client, pool, i, start):
+    # What a script thread did before: every step waits for the previous one
+    with pool.lease(client, model=MODEL, name="code-interpreter-agent",
+                    instructions=INSTRUCTIONS, toolset=code_interpreter_toolset()) as agent_id:
+        thread = client.agents.create_thread()
+        client.agents.create_message(thread_id=thread.id, role="user", content=f"prompt {i}")
+        execute_run(client, thread.id, agent_id)
+    return time.perf_counter() - start
+
+
+def measure_blocking(runs, concurrency):
+    client = FakeAIProjectClient()
+    pool = AgentPool()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(lambda i: blocking_run(client, pool, i, start), range(runs)))
+    elapsed = time.perf_counter() - start
+    pool.close()
+    return runs / elapsed, latencies
+
+
+def measure_async(runs, concurrency):
+    client = FakeAIProjectClient()
+    engine = AsyncAgentEngine(f"benchmark-{concurrency}", max_concurrency=concurrency,
+                              project_client=client, async_client=client.aio())
+    latencies = []
+    start = time.perf_counter()
+    futures = [engine.submit(request(i)) for i in range(runs)]
+    for future in futures:
+        future.result()
+        # Measured from submission, so time queued behind the concurrency limit counts too
+        latencies.append(time.perf_counter() - start)
+    elapsed = time.perf_counter() - start
+    engine.close()
+    return runs / elapsed, latencies
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    print(f"{runs} code interpreter runs per level against the fake service")
+    print(f"{'concurrency':>11} {'blocking runs/s':>16} {'p50':>7} {'async runs/s':>13} {'p50':>7}")
+    for concurrency in CONCURRENCY:
+        blocking_throughput, blocking_latencies = measure_blocking(runs, concurrency)
+        async_throughput, async_latencies = measure_async(runs, concurrency)
+        print(f"{concurrency:>11} {blocking_throughput:>16.2f} {statistics.median(blocking_latencies):>6.2f}s "
+              f"{async_throughput:>13.2f} {statistics.median(async_latencies):>6.2f}s")
+
+
+if __name__ == "__main__":
+    main()
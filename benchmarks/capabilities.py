@@ -0,0 +1,103 @@
+# Offline end-to-end benchmark of the three capabilities against the fake service, with
+# log-normal latencies and optional failure injection. Each request goes through the agent
+# pipeline the app uses, non-streaming: the run executes on the async engine, then the reply,
+# code and generated images are collected. Reports latency percentiles, throughput, failures
+# and client-side CPU time and peak traced memory per request.
+# Usage: python -m benchmarks.capabilities [requests] [concurrency] [failure rate]
+import io
+import os
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+# Keep the vector store cache index and the resource ledger out of the working directory
+os.environ.setdefault("AZURE_FOUNDRY_VECTOR_STORE_CACHE", "")
+os.environ.setdefault("AZURE_FOUNDRY_RESOURCE_LEDGER", "")
+
+from agent_service.async_engine import AsyncAgentEngine
+from agent_service.capabilities import CAPABILITIES, DOCUMENT_CAPABILITIES
+from agent_service.fake_client import DEFAULT_LATENCY, FakeAIProjectClient, lognormal, scaled
+from agent_service.pipeline import AgentPipeline
+
+MODEL = "gpt-4o"
+DOCUMENT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "movies.md")
+
+
+def load_document():
+    with open(DOCUMENT, "rb") as f:
+        document = io.BytesIO(f.read())
+    document.name = os.path.basename(DOCUMENT)
+    return document
+
+
+def request_once(pipeline, capability, document, i):
+    start = time.perf_counter()
+    response = pipeline.run(capability, MODEL, f"prompt {i}",
+                            document=document if capability in DOCUMENT_CAPABILITIES else None)
+    if response.status != "completed":
+        raise RuntimeError(response.text)
+    return time.perf_counter() - start
+
+
+def run_requests(capability, requests, concurrency, failure_rate, label):
+    client = FakeAIProjectClient(latency=scaled(DEFAULT_LATENCY), run_duration=lognormal(1.5, 0.3), image=1,
+                                 failure_rate=failure_rate, run_failure_rate=failure_rate, seed=0)
+    # A new connection string per pass, so each pass starts with an empty agent pool and cache
+    conn_str = f"benchmark-{label}-{capability}"
+    engine = AsyncAgentEngine(conn_str, max_concurrency=concurrency, project_client=client, async_client=client.aio())
+    pipeline = AgentPipeline(conn_str, project_client=client, engine=engine)
+    document = load_document()
+    latencies, failures = [], 0
+
+    def attempt(i):
+        try:
+            return request_once(pipeline, capability, document, i)
+        except Exception:
+            return None
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for latency in executor.map(attempt, range(requests)):
+                if latency is None:
+                    failures += 1
+                else:
+                    latencies.append(latency)
+    finally:
+        engine.close()
+    return latencies, failures
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))] if values else 0.0
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    failure_rate = float(sys.argv[3]) if len(sys.argv) > 3 else 0.0
+    print(f"{requests} requests per capability, {concurrency} at a time, failure rate {failure_rate:g}")
+    print(f"{'capability':<24} {'req/s':>6} {'p50':>7} {'p95':>7} {'p99':>7} {'failed':>6} "
+          f"{'cpu/req':>9} {'peak/req':>9}")
+    for capability in CAPABILITIES:
+        cpu_start = time.process_time()
+        start = time.perf_counter()
+        latencies, failures = run_requests(capability, requests, concurrency, failure_rate, "timed")
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu_start
+
+        # Memory is measured in a separate pass, since tracing slows the client down
+        tracemalloc.start()
+        run_requests(capability, concurrency, concurrency, 0.0, "traced")
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print(f"{capability:<24} {requests / elapsed:>6.2f} "
+              f"{percentile(latencies, 0.50):>6.2f}s {percentile(latencies, 0.95):>6.2f}s "
+              f"{percentile(latencies, 0.99):>6.2f}s {failures:>6} "
+              f"{cpu / requests * 1000:>7.1f}ms {peak / concurrency / 1024:>7.0f}KB")
+
+
+if __name__ == "__main__":
+    main()
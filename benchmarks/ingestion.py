@@ -0,0 +1,74 @@
+# Offline benchmark of document collection ingestion against the fake service: one file at a
+# time against the bounded upload pool, and adding a few documents to an indexed collection
+# incrementally against rebuilding its vector store.
+# Usage: python -m benchmarks.ingestion [documents] [workers]
+import io
+import os
+import sys
+import time
+
+# Keep the vector store cache index and the resource ledger out of the working directory
+os.environ.setdefault("AZURE_FOUNDRY_VECTOR_STORE_CACHE", "")
+os.environ.setdefault("AZURE_FOUNDRY_RESOURCE_LEDGER", "")
+
+from agent_service.fake_client import DEFAULT_LATENCY, FakeAIProjectClient, scaled
+from agent_service.ingestion import hash_documents, ingest_documents
+from agent_service.vector_store_cache import VectorStoreCache
+
+
+def make_documents(count, offset=0):
+    documents = []
+    for i in range(offset, offset + count):
+        document = io.BytesIO(f"Document {i}\n".encode("utf-8") * 200)
+        document.name = f"document_{i}.md"
+        documents.append(document)
+    return documents
+
+
+def timed(label, func):
+    start = time.perf_counter()
+    client = func()
+    elapsed = time.perf_counter() - start
+    calls = client.agents.calls
+    print(f"{label:<28} {elapsed:7.2f}s   uploads {calls['upload_file_and_poll']:>4}   "
+          f"file batches {calls['create_vector_store_file_batch_and_poll']:>3}")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    documents = make_documents(count)
+    added = make_documents(max(count // 10, 1), offset=count)
+    print(f"{count} documents, {workers} upload workers, {len(added)} added afterwards")
+
+    def ingest(workers):
+        def run():
+            client = FakeAIProjectClient(latency=scaled(DEFAULT_LATENCY))
+            ingest_documents(client, hash_documents(documents), workers=workers)
+            return client
+        return run
+
+    def extend(incremental):
+        def run():
+            client = FakeAIProjectClient(latency={})
+            cache = VectorStoreCache("benchmark", index_path=None)
+            with cache.lease_documents(client, documents):
+                pass
+            if not incremental:
+                # What a rebuild costs: a new cache, so nothing is reused
+                cache = VectorStoreCache("benchmark-rebuild", index_path=None)
+            client.agents.calls.clear()
+            client.agents.latency = scaled(DEFAULT_LATENCY)
+            with cache.lease_documents(client, documents + added):
+                pass
+            return client
+        return run
+
+    timed("sequential upload", ingest(1))
+    timed("concurrent upload", ingest(workers))
+    timed("add documents, rebuild", extend(False))
+    timed("add documents, incremental", extend(True))
+
+
+if __name__ == "__main__":
+    main()
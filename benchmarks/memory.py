@@ -0,0 +1,82 @@
+# Offline benchmark of the app process's memory with many concurrent browser sessions. Each
+# session uploads a document, which is copied for a background job or prefetch, and gets a reply
+# with generated images and code. Before: the document copied into memory as the prefetcher used
+# to (through the upload's getbuffer(), which also gives the upload a private copy of its bytes),
+# and the artifacts kept in each session's state for as long as the process lives. After: the
+# copy spooled to disk and the artifacts kept in the artifact store under its memory budget.
+# The uploads count in both cases, as Streamlit holds them while the sessions are open. Each case
+# runs in a fresh interpreter and reports the growth of its resident set size, in total and per
+# session. Needs /proc (Linux).
+# Usage: python -m benchmarks.memory [sessions] [document MB] [memory budget MB]
+import io
+import json
+import os
+import subprocess
+import sys
+
+from agent_service.memory_budget import ArtifactStore, rss_bytes, spool
+from agent_service.outputs import FileOutput
+from agent_service.uploads import CHUNK_SIZE
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMAGES_PER_REPLY = 2
+IMAGE_BYTES = 512 * 1024
+CODE = "import matplotlib.pyplot as plt\nplt.bar(titles, gross)\nplt.savefig('chart.png')\n" * 50
+
+
+def simulate(mode, sessions, document_mb, budget_mb):
+    baseline = rss_bytes()
+    uploads, copies, session_states = [], [], []
+    artifacts = ArtifactStore(global_budget=int(budget_mb * 2**20))
+    for session in range(sessions):
+        upload = io.BytesIO(os.urandom(int(document_mb * 2**20)))
+        upload.name = f"report_{session}.pdf"
+        uploads.append(upload)
+        images = tuple(FileOutput(os.urandom(IMAGE_BYTES)) for _ in range(IMAGES_PER_REPLY))
+        if mode == "before":
+            with upload.getbuffer() as view:
+                copy = io.BytesIO(b"".join(bytes(view[start:start + CHUNK_SIZE])
+                                           for start in range(0, len(view), CHUNK_SIZE)))
+            copy.name = upload.name
+            session_states.append({"interpreter_images": list(images), "interpreter_code": CODE})
+        else:
+            copy = spool(upload)
+            artifacts.put(f"{session:032x}", "images", images)
+            artifacts.put(f"{session:032x}", "code", CODE)
+        copies.append(copy)
+    growth = rss_bytes() - baseline
+    for copy in copies:
+        copy.close()
+    return {"rss": growth, "artifacts": artifacts.stats()["bytes"] if mode == "after" else None}
+
+
+def measure(mode, sessions, document_mb, budget_mb):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    output = subprocess.run([sys.executable, "-m", "benchmarks.memory", "--case", mode, str(sessions),
+                             str(document_mb), str(budget_mb)], cwd=ROOT, env=env, capture_output=True,
+                            text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    if sys.argv[1:2] == ["--case"]:
+        mode, sessions, document_mb, budget_mb = sys.argv[2], int(sys.argv[3]), float(sys.argv[4]), float(sys.argv[5])
+        print(json.dumps(simulate(mode, sessions, document_mb, budget_mb)))
+        return
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    document_mb = float(sys.argv[2]) if len(sys.argv) > 2 else 8.0
+    budget_mb = float(sys.argv[3]) if len(sys.argv) > 3 else 16.0
+    if not rss_bytes():
+        print("This benchmark reads the resident set size from /proc, which this platform doesn't have")
+        return
+    print(f"{document_mb:g} MB documents, {IMAGES_PER_REPLY} images of {IMAGE_BYTES // 1024} KB per reply, "
+          f"{budget_mb:g} MB artifact budget")
+    print(f"{'sessions':>8} {'before':>10} {'per session':>12} {'after':>10} {'per session':>12}")
+    for count in sorted({max(1, sessions // 4), max(1, sessions // 2), sessions}):
+        before = measure("before", count, document_mb, budget_mb)["rss"] / 2**20
+        after = measure("after", count, document_mb, budget_mb)["rss"] / 2**20
+        print(f"{count:>8} {before:>8.1f}MB {before / count:>10.2f}MB {after:>8.1f}MB {after / count:>10.2f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# Offline benchmark of speculative prefetch against the fake service: the time from clicking Run
+# to the finished reply for each capability, starting cold against starting after the page has
+# prefetched the agent, the document's vector store and spare threads while the user typed.
+# Runs stream their reply, as the page does by default.
+# Usage: python -m benchmarks.prefetch [runs] [think time in seconds]
+import io
+import os
+import statistics
+import sys
+import time
+
+# Keep the vector store cache index and the resource ledger out of the working directory
+os.environ.setdefault("AZURE_FOUNDRY_VECTOR_STORE_CACHE", "")
+os.environ.setdefault("AZURE_FOUNDRY_RESOURCE_LEDGER", "")
+
+from agent_service.capabilities import CAPABILITIES, DOCUMENT_CAPABILITIES
+from agent_service.fake_client import DEFAULT_LATENCY, FakeAIProjectClient, scaled
+from agent_service.pipeline import AgentPipeline
+from agent_service.prefetch import Prefetcher
+
+MODEL = "gpt-4o"
+
+
+def make_document(i):
+    document = io.BytesIO(f"Document {i}\n".encode("utf-8") * 200)
+    document.name = f"document_{i}.md"
+    return document
+
+
+def time_to_reply(capability, i, think_time, prefetch):
+    # A new connection string per run, so every run starts with an empty agent pool and cache
+    conn_str = f"benchmark-prefetch-{prefetch}-{capability}-{i}"
+    client = FakeAIProjectClient(latency=scaled(DEFAULT_LATENCY), run_duration=1.0)
+    prefetcher = Prefetcher(conn_str, project_client=client)
+    pipeline = AgentPipeline(conn_str, project_client=client, prefetcher=prefetcher)
+    document = make_document(i) if capability in DOCUMENT_CAPABILITIES else None
+    try:
+        if prefetch:
+            pipeline.prefetch(capability, MODEL, document=document)
+        time.sleep(think_time)
+        start = time.perf_counter()
+        response = pipeline.run(capability, MODEL, f"prompt {i}", document=document, stream=True)
+        if response.status != "completed":
+            raise RuntimeError(response.text)
+        return time.perf_counter() - start
+    finally:
+        prefetcher.close()
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    think_time = float(sys.argv[2]) if len(sys.argv) > 2 else 5.0
+    print(f"{runs} runs per capability, {think_time:g}s between choosing the capability and clicking Run")
+    print(f"{'capability':<24} {'cold p50':>10} {'prefetched p50':>15}")
+    for capability in CAPABILITIES:
+        cold = [time_to_reply(capability, i, 0.0, False) for i in range(runs)]
+        warm = [time_to_reply(capability, i, think_time, True) for i in range(runs)]
+        print(f"{capability:<24} {statistics.median(cold):9.2f}s {statistics.median(warm):14.2f}s")
+
+
+if __name__ == "__main__":
+    main()
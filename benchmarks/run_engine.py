@@ -0,0 +1,51 @@
+# Offline comparison of the SDK's create_and_process_run (plus the fixed sleeps the app
+# used to add after it) against run_engine.execute_run.
+# Usage: python -m benchmarks.run_engine [runs per duration]
+import statistics
+import sys
+import time
+
+from agent_service.fake_client import FakeAIProjectClient
+from agent_service.run_engine import execute_run
+
+# time.sleep(10) after the run plus time.sleep(1) before hiding the progress bar
+LEGACY_FIXED_SLEEP = 11.0
+RUN_DURATIONS = (0.5, 1.5, 4.0)
+
+
+def legacy_run(client, thread_id, agent_id):
+    client.agents.create_and_process_run(thread_id=thread_id, assistant_id=agent_id)
+
+
+def engine_run(client, thread_id, agent_id):
+    execute_run(client, thread_id, agent_id)
+
+
+def measure(client, agent_id, func, runs):
+    latencies = []
+    polls_before = client.agents.calls["get_run"]
+    for _ in range(runs):
+        thread = client.agents.create_thread()
+        start = time.perf_counter()
+        func(client, thread.id, agent_id)
+        latencies.append(time.perf_counter() - start)
+    polls = (client.agents.calls["get_run"] - polls_before) / runs
+    return statistics.mean(latencies), polls
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    print(f"{'run time':>9} {'legacy':>10} {'+sleeps':>10} {'engine':>10} {'polls':>13} {'saved':>8}")
+    for duration in RUN_DURATIONS:
+        client = FakeAIProjectClient(run_duration=duration)
+        agent = client.agents.create_agent(model="gpt-4o", name="bench-agent", instructions="bench")
+        legacy, legacy_polls = measure(client, agent.id, legacy_run, runs)
+        engine, engine_polls = measure(client, agent.id, engine_run, runs)
+        with_sleeps = legacy + LEGACY_FIXED_SLEEP
+        print(f"{duration:>8.1f}s {legacy:>9.2f}s {with_sleeps:>9.2f}s {engine:>9.2f}s "
+              f"{legacy_polls:>5.1f} -> {engine_polls:>4.1f} {with_sleeps - engine:>7.2f}s")
+    print(f"'+sleeps' adds the {LEGACY_FIXED_SLEEP:g}s of fixed sleeps the handlers used to do after each run")
+
+
+if __name__ == "__main__":
+    main()
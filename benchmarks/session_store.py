@@ -0,0 +1,75 @@
+# Offline benchmark of the session store: many sessions saving their state at once, as when
+# hundreds of browser sessions finish runs together, against rewriting one JSON file per save
+# as the page used to. Then scans and purges the saved sessions by age.
+# Usage: python -m benchmarks.session_store [sessions] [saves per session]
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from agent_service.session_store import SessionStore
+
+
+def state(session, i):
+    # A conversation that grows by a turn per save, the rest unchanged
+    turns = [turn for n in range(i + 1) for turn in (["user", f"Question {n}"], ["assistant", f"Answer {n}. " * 20])]
+    return {"last_file": "movies.md", "jobs": {},
+            "conversations": {"RAG": {"thread_id": f"thread_{session}", "document": "movies.md", "turns": turns}}}
+
+
+def timed(label, sessions, saves, save):
+    latencies = []
+    lock = threading.Lock()
+
+    def run(session):
+        for i in range(saves):
+            start = time.perf_counter()
+            save(session, state(session, i))
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=min(sessions, 64)) as executor:
+        list(executor.map(run, [f"{n:032x}" for n in range(sessions)]))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    print(f"{label:<24} {sessions * saves / elapsed:8.0f} saves/s   p50 {statistics.median(latencies) * 1000:6.2f}ms   "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:6.2f}ms")
+
+
+def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    saves = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    print(f"{sessions} concurrent sessions, {saves} saves each")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "state.json")
+        shared = {}
+        lock = threading.Lock()
+
+        def save_file(session, value):
+            # Without the lock the sessions' writes would clobber each other
+            with lock:
+                shared[session] = value
+                with open(path, "w") as f:
+                    json.dump(shared, f)
+
+        timed("one JSON file", sessions, saves, save_file)
+
+        store = SessionStore(os.path.join(directory, "sessions.db"))
+        timed("session store", sessions, saves, lambda session, value: store.save(session, **value))
+
+        start = time.perf_counter()
+        scanned = store.scan(older_than=0, limit=sessions)
+        scan_time = time.perf_counter() - start
+        start = time.perf_counter()
+        purged = store.purge(older_than=0)
+        print(f"scan {len(scanned)} sessions {scan_time * 1000:.1f}ms, purge {purged} sessions "
+              f"{(time.perf_counter() - start) * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# Offline benchmark of the Streamlit page's startup: the cold first run of AgentOnTheFly.py
+# in a fresh interpreter (module imports, process-wide setup, first render) and the script
+# time of each rerun after it. Runs the page headless with Streamlit's AppTest; nothing
+# reaches the service, since startup only connects on a background thread.
+# Usage: python -m benchmarks.startup [cold starts] [reruns]
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+imported = time.perf_counter()
+at = AppTest.from_file(sys.argv[1], default_timeout=60)
+first = time.perf_counter()
+at.run()
+first = time.perf_counter() - first
+reruns = []
+for _ in range(int(sys.argv[2])):
+    rerun = time.perf_counter()
+    at.run()
+    reruns.append(time.perf_counter() - rerun)
+print(json.dumps({"streamlit_import": imported - start, "first_run": first, "reruns": reruns,
+                  "errors": [str(e.value) for e in at.exception]}))
+"""
+
+
+def cold_start(reruns):
+    env = dict(os.environ,
+               AZURE_FOUNDRY_PROJECT_CONNSTRING="eastus.api.azureml.ms;subscription;group;project",
+               AZURE_FOUNDRY_GPT_MODEL="gpt-4o",
+               # Keep the benchmark's state out of the working directory
+               AZURE_FOUNDRY_RESOURCE_LEDGER="",
+               AZURE_FOUNDRY_VECTOR_STORE_CACHE="",
+               PYTHONPATH=ROOT)
+    with tempfile.TemporaryDirectory() as directory:
+        output = subprocess.run([sys.executable, "-c", CHILD, os.path.join(ROOT, "AgentOnTheFly.py"), str(reruns)],
+                                cwd=directory, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    starts = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    reruns = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    print(f"{starts} cold starts, {reruns} reruns each")
+    print(f"{'start':<6} {'streamlit':>10} {'first run':>10} {'rerun p50':>10} {'rerun max':>10}")
+    for i in range(starts):
+        result = cold_start(reruns)
+        if result["errors"]:
+            print(f"Page raised: {result['errors']}")
+        times = sorted(result["reruns"])
+        print(f"{i + 1:<6} {result['streamlit_import'] * 1000:>8.0f}ms {result['first_run'] * 1000:>8.0f}ms "
+              f"{times[len(times) // 2] * 1000:>8.1f}ms {times[-1] * 1000:>8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
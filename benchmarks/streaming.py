@@ -0,0 +1,66 @@
+# Offline comparison of time-to-first-token for polling versus streaming runs, plus a
+# replay of a recorded event stream through the same code path the UI uses.
+# Usage: python -m benchmarks.streaming [recording.sse]
+import sys
+import time
+
+from agent_service.fake_client import FakeAIProjectClient
+from agent_service.run_engine import execute_run, stream_run
+from agent_service.streaming import replay_stream
+
+RUN_DURATIONS = (1.5, 4.0, 8.0)
+REPLY = ("The bar chart shows box office gross per movie. Pretty Woman leads with $463.4 million, "
+         "followed by The Wolf of Wall Street and Slumdog Millionaire.")
+DEFAULT_RECORDING = "data/sample-run-stream.sse"
+
+
+def polling_first_token(client, thread_id, agent_id):
+    start = time.perf_counter()
+    execute_run(client, thread_id, agent_id)
+    client.agents.list_messages(thread_id=thread_id)
+    # Nothing is shown until the whole reply has been fetched
+    elapsed = time.perf_counter() - start
+    return elapsed, elapsed
+
+
+def streaming_first_token(client, thread_id, agent_id):
+    start = time.perf_counter()
+    first_token = None
+    for event in stream_run(client, thread_id, agent_id):
+        if event.kind == "text" and first_token is None:
+            first_token = time.perf_counter() - start
+    return first_token, time.perf_counter() - start
+
+
+class _ReplayAgents:
+    def __init__(self, path):
+        self.path = path
+
+    def create_stream(self, thread_id, assistant_id, **kwargs):
+        return replay_stream(self.path)
+
+
+class _ReplayClient:
+    def __init__(self, path):
+        self.agents = _ReplayAgents(path)
+
+
+def main():
+    recording = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_RECORDING
+    print(f"{'run time':>9} {'poll TTFT':>10} {'stream TTFT':>12} {'stream total':>13}")
+    for duration in RUN_DURATIONS:
+        client = FakeAIProjectClient(run_duration=duration, reply=REPLY)
+        agent = client.agents.create_agent(model="gpt-4o", name="bench-agent", instructions="bench")
+        poll_ttft, _ = polling_first_token(client, client.agents.create_thread().id, agent.id)
+        stream_ttft, stream_total = streaming_first_token(client, client.agents.create_thread().id, agent.id)
+        print(f"{duration:>8.1f}s {poll_ttft:>9.2f}s {stream_ttft:>11.2f}s {stream_total:>12.2f}s")
+
+    start = time.perf_counter()
+    kinds = [event.kind for event in stream_run(_ReplayClient(recording), "thread", "agent")]
+    elapsed = time.perf_counter() - start
+    print(f"Replayed {recording}: {kinds.count('text')} text deltas, {kinds.count('code')} code, "
+          f"{kinds.count('image')} images in {elapsed * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
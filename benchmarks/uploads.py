@@ -0,0 +1,56 @@
+# Offline comparison of peak Python memory for the old temp-file upload path against
+# uploading the UploadedFile buffer in place.
+# Usage: python -m benchmarks.uploads [size in MB]
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+from azure.ai.projects.models import FilePurpose
+
+from agent_service.fake_client import FakeAIProjectClient
+from agent_service.uploads import file_sha256, upload_file
+
+
+def legacy_upload(client, file_obj):
+    # getvalue() copy, written to temp_<name> in the working directory, then uploaded by path
+    temp_file_path = f"temp_{file_obj.name}"
+    with open(temp_file_path, "wb") as f:
+        f.write(file_obj.getvalue())
+    try:
+        return client.agents.upload_file_and_poll(file_path=temp_file_path, purpose=FilePurpose.AGENTS)
+    finally:
+        os.remove(temp_file_path)
+
+
+def in_place_upload(client, file_obj):
+    file_sha256(file_obj)
+    return upload_file(client, file_obj, file_obj.name)
+
+
+def measure(label, func, client, file_obj):
+    tracemalloc.start()
+    start = time.perf_counter()
+    func(client, file_obj)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # Drop the fake service's stored copy so it doesn't count against the next run
+    client.agents.files.clear()
+    print(f"{label:<10} peak {peak / 2**20:8.1f} MB   {elapsed * 1000:8.1f} ms")
+
+
+def main():
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    file_obj = io.BytesIO(os.urandom(size_mb * 2**20))
+    file_obj.name = "benchmark.pdf"
+    # The fake service reads each upload once, like the SDK does when it builds the request body
+    client = FakeAIProjectClient(latency={})
+    print(f"Uploading a {size_mb} MB document (the upload buffer itself is not counted)")
+    measure("temp file", legacy_upload, client, file_obj)
+    measure("in place", in_place_upload, client, file_obj)
+
+
+if __name__ == "__main__":
+    main()
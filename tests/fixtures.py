@@ -0,0 +1,50 @@
+import unittest
+import uuid
+from unittest import mock
+
+from agent_service import resource_ledger, vector_store_cache
+from agent_service.agent_pool import get_agent_pool
+from agent_service.fake_client import FakeAIProjectClient
+from agent_service.pipeline import AgentPipeline
+from agent_service.resource_ledger import ResourceLedger
+from agent_service.usage import UsageTracker
+from agent_service.vector_store_cache import VectorStoreCache
+
+
+class FakeServiceTestCase(unittest.TestCase):
+    # Runs against a fake Agents service under a project (connection string) of its own, so the
+    # process-wide engine, agent pool and caches start afresh; the resource ledger and the vector
+    # store cache index are kept in memory, and every client the code creates is the fake one
+    run_duration = 0.05
+    # Images generated per reply
+    images = 0
+
+    def setUp(self):
+        self.conn_str = f"test-{uuid.uuid4().hex}"
+        self.service = FakeAIProjectClient(latency={}, run_duration=self.run_duration, image=self.images)
+        self.patch_object(resource_ledger, "_ledger", ResourceLedger(None))
+        self.patch_dict(vector_store_cache._caches, {self.conn_str: VectorStoreCache(self.conn_str, index_path=None)})
+        self.patch("azure.ai.projects.AIProjectClient.from_connection_string", return_value=self.service)
+        self.patch("azure.ai.projects.aio.AIProjectClient.from_connection_string",
+                   side_effect=lambda **kwargs: self.service.aio())
+        # Deletes the pooled agents while the ledger is still the test's
+        self.addCleanup(lambda: get_agent_pool(self.conn_str).close())
+
+    def patch(self, target, **kwargs):
+        patcher = mock.patch(target, **kwargs)
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+    def patch_object(self, target, attribute, value):
+        patcher = mock.patch.object(target, attribute, value)
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+    def patch_dict(self, target, values):
+        patcher = mock.patch.dict(target, values)
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+    def make_pipeline(self, **kwargs) -> AgentPipeline:
+        kwargs.setdefault("usage_tracker", UsageTracker(None))
+        return AgentPipeline(self.conn_str, project_client=self.service, **kwargs)
@@ -0,0 +1,68 @@
+import threading
+import time
+import unittest
+
+from agent_service.agent_pool import AgentPool
+from agent_service.fake_client import FakeAIProjectClient
+from tests.fixtures import FakeServiceTestCase
+
+
+class FlakyClient:
+    # The fake service, failing the first `failures` agent creations
+    def __init__(self, failures):
+        self.service = FakeAIProjectClient(latency={})
+        self.agents = self
+        self.failures = failures
+
+    def __getattr__(self, name):
+        return getattr(self.service.agents, name)
+
+    def create_agent(self, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("agent creation failed")
+        return self.service.agents.create_agent(**kwargs)
+
+
+class PoolBoundTest(FakeServiceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.pool = AgentPool(max_size=1, wait=5)
+        self.addCleanup(self.pool.close)
+
+    def lease(self, name, client=None):
+        return self.pool.lease(client or self.service, model="gpt-4o", name=name, instructions=name)
+
+    def test_creation_waits_for_a_leased_agent_when_the_pool_is_full(self):
+        leased = []
+        with self.lease("first") as first_id:
+            waiter = threading.Thread(target=lambda: leased.append(self.lease("second").__enter__()))
+            waiter.start()
+            time.sleep(0.2)
+            # Still waiting: only one agent may be leased
+            self.assertEqual(leased, [])
+        waiter.join(5)
+        self.assertEqual(len(leased), 1)
+        # The first agent, idle by then, made room for the second
+        self.assertNotIn(first_id, self.service.agents.agents)
+        self.assertEqual(self.pool.stats()["size"], 1)
+        self.assertEqual((self.pool.waits, self.pool.overflows), (1, 0))
+
+    def test_creation_past_the_wait_is_counted_as_overflow(self):
+        self.pool.wait = 0.1
+        with self.lease("first"), self.lease("second"):
+            stats = self.pool.stats()
+        self.assertEqual((stats["size"], stats["in_use"], stats["overflows"]), (2, 2, 1))
+
+    def test_failed_creation_does_not_leave_its_lock(self):
+        client = FlakyClient(failures=1)
+        with self.assertRaises(RuntimeError):
+            with self.lease("agent", client):
+                pass
+        self.assertEqual(self.pool._creating, {})
+        with self.lease("agent", client) as agent_id:
+            self.assertIn(agent_id, client.service.agents.agents)
+
+
+if __name__ == "__main__":
+    unittest.main()
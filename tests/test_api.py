@@ -0,0 +1,89 @@
+import io
+import threading
+import time
+import unittest
+
+from agent_service.api import AdmissionQueue, create_app
+from agent_service.pipeline import AgentResponse
+from tests.fixtures import FakeServiceTestCase
+
+
+class AdmissionQueueTest(unittest.TestCase):
+    def test_request_waits_in_line_for_a_slot(self):
+        admission = AdmissionQueue(max_pending=1, max_queued=1, timeout=5)
+        self.assertTrue(admission.acquire())
+        threading.Timer(0.1, admission.release).start()
+        started = time.monotonic()
+        self.assertTrue(admission.acquire())
+        self.assertGreaterEqual(time.monotonic() - started, 0.05)
+        self.assertEqual(admission.stats()["in_flight"], 1)
+
+    def test_request_waiting_too_long_is_turned_away(self):
+        admission = AdmissionQueue(max_pending=1, max_queued=1, timeout=0.05)
+        admission.acquire()
+        self.assertFalse(admission.acquire())
+        self.assertEqual(admission.stats()["rejected"], 1)
+
+    def test_request_finding_the_line_full_is_turned_away_at_once(self):
+        admission = AdmissionQueue(max_pending=1, max_queued=1, timeout=5)
+        admission.acquire()
+        waiter = threading.Thread(target=admission.acquire)
+        waiter.start()
+        while not admission.stats()["queued"]:
+            time.sleep(0.01)
+        started = time.monotonic()
+        self.assertFalse(admission.acquire())
+        self.assertLess(time.monotonic() - started, 1)
+        admission.release()
+        waiter.join()
+        self.assertEqual(admission.stats(), {"in_flight": 1, "queued": 0, "rejected": 1, "max_pending": 1,
+                                             "max_queued": 1})
+
+
+class BlockingPipeline:
+    # Stands in for AgentPipeline: each run waits until the test lets it finish
+    def __init__(self, client):
+        self.client = client
+        self.started = threading.Event()
+        self.finish = threading.Event()
+
+    def acquire_client(self):
+        return self.client
+
+    def run(self, capability, model, prompt, document=None, **kwargs):
+        self.started.set()
+        self.finish.wait(10)
+        return AgentResponse("reply")
+
+
+class AdmissionOrderTest(FakeServiceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.pipeline = BlockingPipeline(self.service)
+        self.app = create_app(self.conn_str, "gpt-4o", self.pipeline, max_pending=1, max_queued=0)
+        self.spooled = self.patch("agent_service.api.spool", side_effect=lambda stream, name: io.BytesIO())
+
+    def post_document(self):
+        return self.app.test_client().post("/rag", data={"prompt": "hi", "document": (io.BytesIO(b"doc"), "doc.md")},
+                                           content_type="multipart/form-data")
+
+    def test_request_turned_away_does_not_copy_its_documents(self):
+        busy = threading.Thread(target=lambda: self.app.test_client().post("/code-interpreter",
+                                                                          json={"prompt": "hi"}))
+        busy.start()
+        self.assertTrue(self.pipeline.started.wait(5))
+        self.assertEqual(self.post_document().status_code, 429)
+        self.pipeline.finish.set()
+        busy.join()
+        self.spooled.assert_not_called()
+
+    def test_invalid_request_gives_its_slot_back(self):
+        client = self.app.test_client()
+        self.assertEqual(client.post("/rag", json={"prompt": "hi"}).status_code, 400)
+        self.pipeline.finish.set()
+        self.assertEqual(self.post_document().status_code, 200)
+        self.assertEqual(self.spooled.call_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import os
+import unittest
+
+from agent_service.async_engine import AsyncAgentEngine
+from agent_service.batch import load_prompts, run_batch
+from agent_service.capabilities import CODE_INTERPRETER
+from agent_service.usage import UsageTracker
+from tests.fixtures import FakeServiceTestCase
+
+
+class BatchOutputTest(FakeServiceTestCase):
+    images = 1
+
+    def test_results_carry_code_images_and_step_usage(self):
+        tracker = UsageTracker(None)
+        self.patch("agent_service.batch.get_usage_tracker", return_value=tracker)
+        engine = AsyncAgentEngine(self.conn_str, project_client=self.service, async_client=self.service.aio())
+        self.addCleanup(engine.close)
+        results = list(run_batch(self.conn_str, CODE_INTERPRETER, "gpt-4o", ["first", "second"],
+                                 project_client=self.service, engine=engine))
+        self.assertEqual([result.status for result in results], ["completed", "completed"])
+        for result in results:
+            self.assertEqual(result.code, "print('hello from the fake agent')")
+            self.assertEqual(len(result.image_ids.split()), 1)
+        records = tracker.recent()
+        self.assertEqual(len(records), 2)
+        self.assertTrue(all(record.usage.steps for record in records))
+
+
+class LoadPromptsTest(unittest.TestCase):
+    def test_sample_prompts_are_split_on_separator_lines(self):
+        prompts = load_prompts(os.path.join(os.path.dirname(__file__), "..", "data", "test-scripts.txt"))
+        self.assertEqual(len(prompts), 3)
+        for prompt in prompts:
+            self.assertIn("Citizen Kane\t1941", prompt)
+            self.assertTrue(prompt.endswith("$45.1 million"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,27 @@
+import unittest
+
+from agent_service.conversations import Conversation
+from tests.fixtures import FakeServiceTestCase
+
+
+class DeletedThreadTest(FakeServiceTestCase):
+    def follow_up_after_the_thread_is_swept(self, stream):
+        pipeline = self.make_pipeline()
+        conversation = Conversation("Code Interpreter")
+        first = pipeline.run("Code Interpreter", "gpt-4o", "first question", conversation=conversation, stream=stream)
+        self.service.agents.delete_thread(first.thread_id)
+        second = pipeline.run("Code Interpreter", "gpt-4o", "follow-up", conversation=conversation, stream=stream)
+        self.assertEqual(second.status, "completed")
+        self.assertNotEqual(second.thread_id, first.thread_id)
+        self.assertEqual(conversation.thread_id, second.thread_id)
+        self.assertEqual(conversation.turns[0], ("user", "follow-up"))
+
+    def test_follow_up_on_the_engine_starts_a_new_thread(self):
+        self.follow_up_after_the_thread_is_swept(stream=False)
+
+    def test_streamed_follow_up_starts_a_new_thread(self):
+        self.follow_up_after_the_thread_is_swept(stream=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
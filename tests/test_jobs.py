@@ -0,0 +1,62 @@
+import os
+import tempfile
+import time
+import unittest
+
+from agent_service.jobs import JobQueue, JobWorkerPool
+from agent_service.pipeline import AgentResponse
+from agent_service.resource_ledger import current_session, session_scope
+from agent_service.usage import BudgetExceededError
+
+
+class SessionPipeline:
+    # Stands in for AgentPipeline: records the session each run sees, and refuses runs once told to
+    def __init__(self, over_budget=()):
+        self.over_budget = set(over_budget)
+        self.sessions = []
+
+    def run(self, capability, model, prompt, document=None):
+        session = current_session()
+        self.sessions.append(session)
+        if session in self.over_budget:
+            raise BudgetExceededError("This session's token budget is used up", retry_after=60)
+        return AgentResponse("reply", status="completed")
+
+
+class JobSessionTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "jobs.db")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_jobs(self, queue, pipeline, job_ids):
+        pool = JobWorkerPool(queue, pipeline, workers=1).start()
+        try:
+            deadline = time.monotonic() + 10
+            while time.monotonic() < deadline and len(pipeline.sessions) < len(job_ids):
+                time.sleep(0.05)
+        finally:
+            pool.stop(timeout=5)
+        return [queue.get(job_id) for job_id in job_ids]
+
+    def test_jobs_run_in_the_submitting_session(self):
+        queue = JobQueue(self.path)
+        explicit = queue.submit("Code Interpreter", "gpt-4o", "prompt", session="a" * 32)
+        with session_scope("b" * 32):
+            implicit = queue.submit("Code Interpreter", "gpt-4o", "prompt")
+        pipeline = SessionPipeline()
+        jobs = self.run_jobs(queue, pipeline, [explicit, implicit])
+        self.assertEqual(sorted(pipeline.sessions), ["a" * 32, "b" * 32])
+        self.assertEqual([job.status for job in jobs], ["completed", "completed"])
+
+    def test_job_over_its_session_budget_is_deferred(self):
+        queue = JobQueue(self.path)
+        job_id = queue.submit("Code Interpreter", "gpt-4o", "prompt", session="c" * 32)
+        job, = self.run_jobs(queue, SessionPipeline(over_budget=["c" * 32]), [job_id])
+        self.assertEqual((job.status, job.attempts), ("queued", 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import io
+import time
+import unittest
+
+from agent_service.async_engine import AsyncAgentEngine
+from agent_service.capabilities import CODE_INTERPRETER, RAG
+from agent_service.prefetch import Prefetcher
+from tests.fixtures import FakeServiceTestCase
+
+
+def document(name, text):
+    file_obj = io.BytesIO(text.encode())
+    file_obj.name = name
+    return file_obj
+
+
+class Upload(io.BytesIO):
+    # Like Streamlit's UploadedFile: an identity kept across reruns, and reads counted
+    def __init__(self, file_id, name, text):
+        super().__init__(text.encode())
+        self.file_id = file_id
+        self.name = name
+        self.reads = 0
+
+    def getvalue(self):
+        self.reads += 1
+        return super().getvalue()
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+
+class PrefetchTest(FakeServiceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.prefetcher = Prefetcher(self.conn_str, project_client=self.service)
+        self.engine = AsyncAgentEngine(self.conn_str, project_client=self.service, async_client=self.service.aio())
+        self.pipeline = self.make_pipeline(engine=self.engine, prefetcher=self.prefetcher)
+        self.addCleanup(self.engine.close)
+        self.addCleanup(self.prefetcher.close)
+
+    def test_engine_runs_take_prefetched_spare_threads(self):
+        self.pipeline.prefetch(CODE_INTERPRETER, "gpt-4o")
+        self.assertTrue(wait_for(lambda: self.prefetcher.reserve.stats()["spare_threads"] >= 1))
+        spares = {thread_id for spares in self.prefetcher.reserve._spares.values() for thread_id, _ in spares}
+        response = self.pipeline.run(CODE_INTERPRETER, "gpt-4o", "question")
+        self.assertEqual(response.status, "completed")
+        self.assertIn(response.thread_id, spares)
+        self.assertEqual(self.prefetcher.reserve.hits, 1)
+
+    def test_documents_are_prefetched_by_content(self):
+        self.pipeline.prefetch(RAG, "gpt-4o", document("report.md", "first draft"))
+        self.assertTrue(wait_for(lambda: self.prefetcher.prefetched_documents == 1))
+        # Same name and size, other content
+        self.pipeline.prefetch(RAG, "gpt-4o", document("report.md", "final draft"))
+        self.assertTrue(wait_for(lambda: self.prefetcher.prefetched_documents == 2))
+        # Same content, another name
+        self.pipeline.prefetch(RAG, "gpt-4o", document("copy.md", "final draft"))
+        time.sleep(0.2)
+        self.assertEqual(self.prefetcher.prefetched_documents, 2)
+
+    def test_reruns_do_not_read_the_upload_again(self):
+        upload = Upload("file-1", "report.md", "first draft")
+        self.pipeline.prefetch(RAG, "gpt-4o", upload)
+        self.assertTrue(wait_for(lambda: self.prefetcher.prefetched_documents == 1))
+        reads = upload.reads
+        for _ in range(3):
+            self.pipeline.prefetch(RAG, "gpt-4o", upload)
+        self.assertEqual(upload.reads, reads)
+        # The run's cache lookups use the hash the prefetch remembered, and its vector store is cached
+        self.assertEqual(self.pipeline.run(RAG, "gpt-4o", "question", document=upload).status, "completed")
+        self.assertEqual(upload.reads, reads)
+
+
+if __name__ == "__main__":
+    unittest.main()
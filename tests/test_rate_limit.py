@@ -0,0 +1,106 @@
+import asyncio
+import io
+import time
+import unittest
+
+from agent_service import rate_limit
+from agent_service.fake_client import FakeAgentsOperations, FakeAIProjectClient, FakeServiceError
+from agent_service.rate_limit import CircuitBreaker, CircuitOpenError, RateLimitedAgents, RateLimiter
+from agent_service.uploads import upload_file
+
+
+class ServiceError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def failing(status_code):
+    def method():
+        raise ServiceError(status_code)
+    return method
+
+
+class CircuitProbeTest(unittest.TestCase):
+    def setUp(self):
+        self.backoff_base = rate_limit.BACKOFF_BASE
+        rate_limit.BACKOFF_BASE = 0.001
+        self.breaker = CircuitBreaker(threshold=2, cooldown=0.05)
+        self.limiter = RateLimiter(limits={}, max_retries=3, breaker=self.breaker, seed=0)
+        # Two writes failing for good open the circuit
+        for _ in range(2):
+            with self.assertRaises(ServiceError):
+                self.limiter.call("create_run", failing(500), (), {})
+        self.assertEqual(self.breaker.state, "open")
+        time.sleep(0.06)
+
+    def tearDown(self):
+        rate_limit.BACKOFF_BASE = self.backoff_base
+
+    def test_throttled_probe_retries_and_closes_the_circuit(self):
+        responses = [ServiceError(429), "ok"]
+
+        def probe():
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        self.assertEqual(self.limiter.call("create_run", probe, (), {}), "ok")
+        self.assertEqual(self.breaker.state, "closed")
+        self.assertEqual(self.limiter.call("create_run", lambda: "next", (), {}), "next")
+
+    def test_probe_failing_for_good_reopens_the_circuit(self):
+        with self.assertRaises(ServiceError):
+            self.limiter.call("create_run", failing(500), (), {})
+        with self.assertRaises(CircuitOpenError):
+            self.limiter.call("create_run", lambda: "ok", (), {})
+
+    def test_cancelled_probe_lets_the_next_call_probe(self):
+        async def cancelled():
+            raise asyncio.CancelledError()
+
+        async def succeeded():
+            return "ok"
+
+        async def main():
+            with self.assertRaises(asyncio.CancelledError):
+                await self.limiter.call_async("create_run", cancelled, (), {})
+            return await self.limiter.call_async("create_run", succeeded, (), {})
+
+        self.assertEqual(asyncio.run(main()), "ok")
+        self.assertEqual(self.breaker.state, "closed")
+
+
+class ThrottledUploads(FakeAgentsOperations):
+    # Reads the whole upload, as the SDK's multipart body does, before answering 429 once
+    def __init__(self):
+        super().__init__(latency={})
+        self.throttled = False
+
+    def upload_file_and_poll(self, file_path=None, purpose=None, file=None, filename=None, **kwargs):
+        if not self.throttled:
+            self.throttled = True
+            file.read()
+            raise FakeServiceError("upload_file_and_poll", 429)
+        return super().upload_file_and_poll(file_path, purpose, file, filename, **kwargs)
+
+
+class UploadRetryTest(unittest.TestCase):
+    def setUp(self):
+        self.backoff_base = rate_limit.BACKOFF_BASE
+        rate_limit.BACKOFF_BASE = 0.001
+
+    def tearDown(self):
+        rate_limit.BACKOFF_BASE = self.backoff_base
+
+    def test_throttled_upload_is_retried_with_the_whole_file(self):
+        client = FakeAIProjectClient()
+        client.agents = RateLimitedAgents(ThrottledUploads(), RateLimiter(limits={}, seed=0))
+        file_obj = io.BytesIO(b"quarterly report " * 1000)
+        uploaded = upload_file(client, file_obj, "report.txt")
+        self.assertEqual(uploaded.data, file_obj.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from agent_service.response_cache import CachedResponse, ResponseCache
+
+
+class DiskTierTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_concurrently(self, cache, responses, writes=20):
+        errors = []
+
+        def write(response):
+            try:
+                for _ in range(writes):
+                    cache.put("same-key", response)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=write, args=(response,)) for response in responses]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return errors
+
+    def test_concurrent_writers_of_one_key_publish_whole_entries(self):
+        cache = ResponseCache(self.directory.name, max_memory_bytes=0)
+        responses = [CachedResponse(f"reply {i} " * 5000, images=(bytes([i]) * 100_000,)) for i in range(4)]
+        self.assertEqual(self.write_concurrently(cache, responses), [])
+        cached = cache.get("same-key")
+        self.assertIn(cached.text, [response.text for response in responses])
+        self.assertIn(cached.images[0], [response.images[0] for response in responses])
+        self.assertFalse([name for name in os.listdir(self.directory.name) if name.endswith(".tmp")])
+
+    def test_eviction_racing_writers_does_not_fail_puts(self):
+        # Every write evicts, while the other writers replace the same files
+        cache = ResponseCache(self.directory.name, max_memory_bytes=0, max_disk_bytes=1)
+        responses = [CachedResponse(f"reply {i}", images=(b"x" * 10_000,)) for i in range(4)]
+        self.assertEqual(self.write_concurrently(cache, responses), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import threading
+import time
+import unittest
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+from agent_service.fake_client import FakeAIProjectClient
+from agent_service.run_engine import stream_run
+from agent_service.streaming import to_sse
+from tests.fixtures import FakeServiceTestCase
+
+
+class StalledStreamClient:
+    # The fake service, with a stream that sends `events` and then goes silent until closed
+    def __init__(self, events=()):
+        self.service = FakeAIProjectClient(latency={}, run_duration=60)
+        self.agents = self
+        self.events = events
+        self.closed = threading.Event()
+
+    def __getattr__(self, name):
+        return getattr(self.service.agents, name)
+
+    @contextmanager
+    def create_stream(self, thread_id, assistant_id, **kwargs):
+        run = self.service.agents.create_run(thread_id=thread_id, assistant_id=assistant_id)
+
+        def events():
+            for event_type in self.events:
+                yield event_type, SimpleNamespace(id=run.id, status="queued"), None
+            self.closed.wait()
+
+        try:
+            yield events()
+        finally:
+            self.closed.set()
+
+
+class StreamDeadlineTest(unittest.TestCase):
+    def run_stalled(self, events):
+        client = StalledStreamClient(events)
+        agent = client.service.agents.create_agent(model="gpt-4o", name="agent", instructions="")
+        thread = client.service.agents.create_thread()
+        started = time.monotonic()
+        with self.assertRaises(TimeoutError):
+            list(stream_run(client, thread.id, agent.id, timeout=0.2))
+        self.assertLess(time.monotonic() - started, 5)
+        run, = client.service.agents.runs.values()
+        self.assertEqual(run.status, "cancelled")
+        self.assertTrue(client.closed.is_set())
+
+    def test_silent_stream_times_out_and_cancels_the_run(self):
+        self.run_stalled(["thread.run.created"])
+
+    def test_stream_silent_before_the_run_event_times_out_and_cancels_the_run(self):
+        self.run_stalled([])
+
+
+class IntermediateMessageTest(FakeServiceTestCase):
+    def setUp(self):
+        super().setUp()
+        stream_events = self.service.agents._stream_events
+
+        def with_intermediate_message(run):
+            # Code interpreter runs may post a message before the one holding the answer
+            for event in stream_events(run):
+                if event.startswith(b"event: thread.message.delta") and run.id not in self.posted:
+                    self.posted.add(run.id)
+                    yield to_sse("thread.message.delta", {"id": "msg_intermediate", "object": "thread.message.delta",
+                                                          "delta": {"content": [{"index": 0, "type": "text",
+                                                                                 "text": {"value": "Let me check. "}}]}})
+                yield event
+
+        self.posted = set()
+        self.patch_object(self.service.agents, "_stream_events", with_intermediate_message)
+
+    def test_streamed_reply_is_the_last_message_like_the_polled_one(self):
+        pipeline = self.make_pipeline()
+        polled = pipeline.run("Code Interpreter", "gpt-4o", "question", stream=False)
+        streamed = pipeline.run("Code Interpreter", "gpt-4o", "question", stream=True)
+        self.assertTrue(self.posted)
+        self.assertEqual(streamed.text, polled.text)
+
+
+if __name__ == "__main__":
+    unittest.main()
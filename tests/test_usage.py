@@ -0,0 +1,46 @@
+import os
+import tempfile
+import unittest
+
+from agent_service.usage import RUN_TOKEN_ESTIMATE, BudgetExceededError, RunUsage, UsageTracker
+
+SESSION = "a" * 32
+
+
+class BudgetReservationTest(unittest.TestCase):
+    def test_runs_in_flight_count_towards_the_budget(self):
+        tracker = UsageTracker(None, token_budget=int(RUN_TOKEN_ESTIMATE * 1.5))
+        first = tracker.reserve()
+        second = tracker.reserve()
+        with self.assertRaises(BudgetExceededError):
+            tracker.reserve()
+        tracker.release(second)
+        tracker.record("RAG", "gpt-4o", None, "run_1", RunUsage(100, 50, 150), first)
+        self.assertEqual(tracker.stats()["in_flight"], 0)
+        self.assertEqual(tracker.spent(), 150)
+        self.assertIsNotNone(tracker.reserve())
+
+    def test_session_reservations_only_count_for_their_session(self):
+        tracker = UsageTracker(None, session_budget=RUN_TOKEN_ESTIMATE)
+        tracker.reserve(SESSION)
+        with self.assertRaises(BudgetExceededError):
+            tracker.reserve(SESSION)
+        self.assertIsNotNone(tracker.reserve("b" * 32))
+
+    def test_no_budget_reserves_nothing(self):
+        tracker = UsageTracker(None)
+        self.assertIsNone(tracker.reserve(SESSION))
+        tracker.record("RAG", "gpt-4o", SESSION, "run_1", RunUsage(10, 5, 15), None)
+        self.assertEqual(tracker.stats()["runs"], 1)
+
+    def test_budgeted_usage_is_shared_with_other_processes_at_once(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "usage.db")
+            tracker = UsageTracker(path, token_budget=10**6, rollup_interval=3600)
+            tracker.record("RAG", "gpt-4o", SESSION, "run_1", RunUsage(100, 50, 150), tracker.reserve(SESSION))
+            # Another process sees the run in the database without waiting for the rollup interval
+            self.assertEqual(UsageTracker(path).spent(SESSION), 150)
+
+
+if __name__ == "__main__":
+    unittest.main()
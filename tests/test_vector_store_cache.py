@@ -0,0 +1,76 @@
+import io
+import os
+import tempfile
+import threading
+import unittest
+
+from agent_service.vector_store_cache import VectorStoreCache
+from tests.fixtures import FakeServiceTestCase
+
+
+def document(text):
+    file_obj = io.BytesIO(text.encode())
+    file_obj.name = f"{text}.txt"
+    return file_obj
+
+
+class SharedIndexTest(FakeServiceTestCase):
+    # Caches on one index stand in for the app, API and worker processes, against one service
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "cache.db")
+
+    def cache(self, ttl=3600):
+        return VectorStoreCache(self.conn_str, index_path=self.path, ttl=ttl)
+
+    def lease(self, cache, text):
+        with cache.lease(self.service, document(text), f"{text}.txt") as vector_store_id:
+            return vector_store_id
+
+    def test_concurrent_processes_keep_each_others_entries(self):
+        caches = [self.cache(), self.cache()]
+        threads = [threading.Thread(target=lambda cache=cache, i=i: [self.lease(cache, f"doc {i} {n}")
+                                                                     for n in range(10)])
+                   for i, cache in enumerate(caches)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.cache().stats()["size"], 20)
+
+    def test_processes_reuse_each_others_stores(self):
+        # Both start before the store exists, so the second finds it in the index, not at load
+        app, worker = self.cache(), self.cache()
+        vector_store_id = self.lease(app, "report")
+        self.assertEqual(self.lease(worker, "report"), vector_store_id)
+        self.assertEqual(worker.hits, 1)
+
+    def test_store_leased_by_another_process_is_not_deleted(self):
+        app, worker = self.cache(), self.cache()
+        vector_store_id = self.lease(app, "report")
+        with worker.lease(self.service, document("report"), "report.txt"):
+            app.ttl = 0
+            app.evict()
+            self.assertIn(vector_store_id, self.service.agents.vector_stores)
+        worker.ttl = 0
+        worker.evict()
+        self.assertNotIn(vector_store_id, self.service.agents.vector_stores)
+
+    def test_store_used_by_another_process_since_is_only_forgotten(self):
+        app, worker = self.cache(), self.cache()
+        vector_store_id = self.lease(app, "report")
+        self.lease(worker, "report")
+        app.ttl = 0
+        app.evict()
+        self.assertIn(vector_store_id, self.service.agents.vector_stores)
+        self.assertEqual(app.stats()["size"], 0)
+        # The last process to use the store deletes it
+        worker.ttl = 0
+        worker.evict()
+        self.assertNotIn(vector_store_id, self.service.agents.vector_stores)
+
+
+if __name__ == "__main__":
+    unittest.main()